@@ -26,7 +26,10 @@
 # policies, either expressed or implied, of Matt Chaput.
 
 import re
+
+from whoosh.automata import fsa
 from whoosh.automata.fsa import ANY, EPSILON, NFA
+from whoosh.compat import unichr, xrange
 
 
 # Operator precedence
@@ -133,3 +136,202 @@ class RegexBuilder(object):
 
 
 
+
+
+# Converting Python regular expressions to automata
+
+# Escapes that stand for a class of characters
+_class_escapes = frozenset("dDsSwW")
+# Escapes that match the empty string at certain positions
+_empty_escapes = frozenset("AbBZ")
+# Escapes for control characters
+_char_escapes = {"a": "\a", "f": "\f", "n": "\n", "r": "\r", "t": "\t",
+                 "v": "\v"}
+# The largest character range in a set we expand into single characters
+_max_range = 256
+
+
+class _RegexParser(object):
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.pos = 0
+        self.anchored = False
+        self.choice = False
+
+    def _peek(self):
+        if self.pos < len(self.pattern):
+            return self.pattern[self.pos]
+
+    def _take(self):
+        char = self._peek()
+        if char is None:
+            raise ValueError("Unexpected end of pattern %r" % self.pattern)
+        self.pos += 1
+        return char
+
+    def _at_end(self, depth):
+        return depth == 0 and self.pos == len(self.pattern)
+
+    def parse(self):
+        nfa = self._alternation(0)
+        if self.pos < len(self.pattern):
+            raise ValueError("Unbalanced parenthesis in %r" % self.pattern)
+        return nfa
+
+    def _alternation(self, depth):
+        nfa = self._sequence(depth)
+        while self._peek() == "|":
+            self.pos += 1
+            if not depth:
+                self.choice = True
+            nfa = fsa.choice_nfa(nfa, self._sequence(depth))
+        return nfa
+
+    def _sequence(self, depth):
+        nfa = fsa.epsilon_nfa()
+        while True:
+            char = self._peek()
+            if char is None or char in "|)":
+                return nfa
+            nfa = fsa.concat_nfa(nfa, self._repeat(self._atom(depth)))
+
+    def _repeat(self, nfa):
+        while True:
+            char = self._peek()
+            if char == "*":
+                nfa = fsa.star_nfa(nfa)
+            elif char == "+":
+                nfa = fsa.plus_nfa(nfa)
+            elif char == "?":
+                nfa = fsa.optional_nfa(nfa)
+            elif char == "{":
+                end = self.pattern.find("}", self.pos)
+                bounds = self.pattern[self.pos + 1:end].split(",")
+                if end < 0 or len(bounds) > 2 or not all(n.isdigit() or not n
+                                                         for n in bounds):
+                    raise ValueError("Can't convert %r" % self.pattern)
+                self.pos = end
+                # Approximate a counted repeat with "any number of times"
+                # ({0,n}) or "at least once" (anything else)
+                if bounds[0] and int(bounds[0]):
+                    nfa = fsa.plus_nfa(nfa)
+                else:
+                    nfa = fsa.star_nfa(nfa)
+            else:
+                return nfa
+            self.pos += 1
+            # Skip lazy and possessive suffixes
+            if self._peek() in ("?", "+"):
+                self.pos += 1
+
+    def _atom(self, depth):
+        char = self._take()
+        if char == "(":
+            if self._peek() == "?":
+                self.pos += 1
+                if self._peek() == ":":
+                    self.pos += 1
+                elif self.pattern.startswith("P<", self.pos):
+                    self.pos = self.pattern.index(">", self.pos) + 1
+                else:
+                    # Lookarounds, inline flags, conditionals, etc.
+                    raise ValueError("Can't convert %r" % self.pattern)
+            nfa = self._alternation(depth + 1)
+            if self._take() != ")":
+                raise ValueError("Unbalanced parenthesis in %r" % self.pattern)
+            return nfa
+        elif char == "[":
+            return self._charset()
+        elif char == ".":
+            return fsa.dot_nfa()
+        elif char == "^":
+            return fsa.epsilon_nfa()
+        elif char == "$":
+            if self._at_end(depth):
+                # "$" also matches before a newline at the end of the string
+                self.anchored = True
+                return fsa.optional_nfa(fsa.basic_nfa("\n"))
+            return fsa.epsilon_nfa()
+        elif char == "\\":
+            char = self._take()
+            if char in _class_escapes:
+                return fsa.dot_nfa()
+            elif char in _empty_escapes:
+                if char == "Z" and self._at_end(depth):
+                    self.anchored = True
+                return fsa.epsilon_nfa()
+            elif char in _char_escapes:
+                return fsa.basic_nfa(_char_escapes[char])
+            elif char.isalnum():
+                # Back references, numeric escapes, etc.
+                raise ValueError("Can't convert %r" % self.pattern)
+            return fsa.basic_nfa(char)
+        elif char in "*+?{":
+            raise ValueError("Nothing to repeat in %r" % self.pattern)
+        return fsa.basic_nfa(char)
+
+    def _charset(self):
+        # Since the automaton can't express "any character except these",
+        # negated sets and sets containing class escapes match any character
+        anychar = self._peek() == "^"
+        if anychar:
+            self.pos += 1
+
+        chars = set()
+        first = True
+        while True:
+            char = self._take()
+            if char == "]" and not first:
+                break
+            first = False
+            if char == "\\":
+                char = self._take()
+                if char in _class_escapes:
+                    anychar = True
+                    continue
+                elif char in _char_escapes:
+                    char = _char_escapes[char]
+                elif char.isalnum():
+                    raise ValueError("Can't convert %r" % self.pattern)
+
+            nextchar = self.pattern[self.pos + 1:self.pos + 2]
+            if self._peek() == "-" and nextchar not in ("]", ""):
+                self.pos += 1
+                end = self._take()
+                if end == "\\":
+                    end = self._take()
+                    if end.isalnum():
+                        raise ValueError("Can't convert %r" % self.pattern)
+                if ord(end) - ord(char) > _max_range:
+                    anychar = True
+                else:
+                    chars.update(unichr(n) for n
+                                 in xrange(ord(char), ord(end) + 1))
+            else:
+                chars.add(char)
+
+        if anychar:
+            return fsa.dot_nfa()
+        return fsa.charset_nfa(chars)
+
+
+def regex_automaton(pattern):
+    """Returns an :class:`whoosh.automata.fsa.NFA` that accepts every string
+    ``re.match(pattern, string)`` matches. Parts of the pattern the automaton
+    can't express exactly, such as negated character sets, class escapes like
+    ``\\w``, counted repeats and anchors in the middle of the pattern, are
+    replaced with looser equivalents, so the automaton may also accept some
+    strings the expression doesn't match. This makes it useful for quickly
+    finding candidates to check against the compiled expression.
+
+    Raises ``ValueError`` if the pattern uses features with no looser
+    equivalent, such as back references, lookaround assertions or inline
+    flags.
+    """
+
+    parser = _RegexParser(pattern)
+    nfa = parser.parse()
+    if parser.choice or not parser.anchored:
+        # re.match() only needs to match at the start of the string
+        nfa = fsa.concat_nfa(nfa, fsa.star_nfa(fsa.dot_nfa()))
+    return nfa
@@ -33,7 +33,7 @@ from bisect import bisect_right
 
 from whoosh import columns
 from whoosh.automata import lev
-from whoosh.compat import abstractmethod, izip, unichr, xrange
+from whoosh.compat import abstractmethod, izip, u, xrange
 from whoosh.filedb.compound import CompoundStorage
 from whoosh.system import emptybytes
 from whoosh.util import random_name
@@ -65,7 +65,7 @@ class Codec(object):
     # Postings
 
     @abstractmethod
-    def postings_writer(self, dbfile, byteids=False):
+    def postings_writer(self, dbfile, byteids=False, fieldname=None):
         raise NotImplementedError
 
     @abstractmethod
@@ -102,8 +102,9 @@ class WrappingCodec(Codec):
     def field_writer(self, storage, segment):
         return self._child.field_writer(storage, segment)
 
-    def postings_writer(self, dbfile, byteids=False):
-        return self._child.postings_writer(dbfile, byteids=byteids)
+    def postings_writer(self, dbfile, byteids=False, fieldname=None):
+        return self._child.postings_writer(dbfile, byteids=byteids,
+                                           fieldname=fieldname)
 
     def postings_reader(self, dbfile, terminfo, format_, term=None, scorer=None):
         return self._child.postings_reader(dbfile, terminfo, format_, term=term,
@@ -137,6 +138,14 @@ class PerDocumentWriter(object):
     def add_column_value(self, fieldname, columnobj, value):
         raise NotImplementedError("Codec does not implement writing columns")
 
+    def add_column_values(self, fieldname, columnobj, items):
+        """Adds a list of ``(docnum, value)`` pairs, in document number
+        order, to the given column. The documents must already have been
+        started with :meth:`PerDocumentWriter.start_doc`.
+        """
+
+        raise NotImplementedError("Codec does not implement writing columns")
+
     @abstractmethod
     def add_vector_items(self, fieldname, fieldobj, items):
         raise NotImplementedError
@@ -257,6 +266,21 @@ class FieldWriter(object):
     def finish_field(self):
         pass
 
+    def supports_slices(self):
+        """Returns True if this writer implements :meth:`append_slice`.
+        """
+
+        return False
+
+    def append_slice(self, storage, segment):
+        """Copies the terms and postings written to the given segment by
+        another field writer of the same codec onto the end of this writer's
+        files. The terms in the slice must sort after any terms already
+        written to this writer.
+        """
+
+        raise NotImplementedError
+
     def close(self):
         pass
 
@@ -344,6 +368,11 @@ class TermsReader(object):
     def indexed_field_names(self):
         raise NotImplementedError
 
+    def share_postings(self, share):
+        # Codecs that can cache term info lookups and decoded posting blocks
+        # between calls to matcher() should override this
+        pass
+
     def close(self):
         pass
 
@@ -355,22 +384,56 @@ class Automata(object):
 
     @staticmethod
     def find_matches(dfa, cur):
-        unull = unichr(0)
+        # Walks the sorted terms under the cursor and the DFA together.
+        # states[i] is the DFA state after the first i characters of the
+        # previous term, so each term only has to be run through the DFA from
+        # the point where it differs from the term before it. Only when a
+        # prefix of a term can't lead to a match do we ask the cursor to skip
+        # ahead, past every term starting with that prefix
 
         term = cur.text()
         if term is None:
             return
 
-        match = dfa.next_valid_string(term)
-        while match:
-            cur.find(match)
-            term = cur.text()
-            if term is None:
-                return
-            if match == term:
-                yield match
-                term += unull
-            match = dfa.next_valid_string(term)
+        next_state = dfa.next_state
+        is_final = dfa.is_final
+        last = u("")
+        states = [dfa.start()]
+        while term is not None:
+            # Reuse the states for the prefix shared with the previous term
+            i = 0
+            limit = min(len(last), len(term), len(states) - 1)
+            while i < limit and last[i] == term[i]:
+                i += 1
+            del states[i + 1:]
+
+            state = states[i]
+            termlen = len(term)
+            while i < termlen:
+                state = next_state(state, term[i])
+                if state is None:
+                    break
+                states.append(state)
+                i += 1
+            last = term
+
+            if state is None:
+                # No term starting with term[:i + 1] can match, so skip to the
+                # next prefix with a transition out of it
+                target = None
+                while i >= 0:
+                    label = dfa.find_next_edge(states[i], term[i], False)
+                    if label:
+                        target = term[:i] + label
+                        break
+                    i -= 1
+                if target is None:
+                    return
+                term = cur.find(target)
+            else:
+                if is_final(state):
+                    yield term
+                term = cur.next()
 
     def terms_within(self, fieldcur, uterm, maxdist, prefix=0):
         dfa = self.levenshtein_dfa(uterm, maxdist, prefix)
@@ -444,6 +507,9 @@ class PerDocumentReader(object):
     def doc_field_length(self, docnum, fieldname, default=0):
         raise NotImplementedError
 
+    def doc_length_bytes(self, fieldname):
+        return None
+
     @abstractmethod
     def field_length(self, fieldname):
         raise NotImplementedError
@@ -467,10 +533,17 @@ class PerDocumentReader(object):
 
     # Stored
 
+    # If fieldnames is not None, it's a set of the names of the stored fields
+    # the caller wants. Implementations can use it to avoid loading the values
+    # of other fields, but they're allowed to return other fields as well
+
     @abstractmethod
-    def stored_fields(self, docnum):
+    def stored_fields(self, docnum, fieldnames=None):
         raise NotImplementedError
 
+    def stored_fields_many(self, docnums, fieldnames=None):
+        return [self.stored_fields(docnum, fieldnames) for docnum in docnums]
+
     def all_stored_fields(self):
         for docnum in self.all_doc_ids():
             yield self.stored_fields(docnum)
@@ -820,6 +893,13 @@ class PerDocWriterWithColumns(PerDocumentWriter):
             self._create_column(fieldname, column)
         self._get_column(fieldname).add(self._docnum, value)
 
+    def add_column_values(self, fieldname, column, items):
+        if not self._has_column(fieldname):
+            self._create_column(fieldname, column)
+        add = self._get_column(fieldname).add
+        for docnum, value in items:
+            add(docnum, value)
+
 
 # FieldCursor implementations
 
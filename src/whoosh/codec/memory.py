@@ -26,10 +26,11 @@
 # policies, either expressed or implied, of Matt Chaput.
 
 from __future__ import with_statement
-from bisect import bisect_left
+from bisect import bisect_left, insort
 from threading import Lock, RLock
 
 from whoosh.compat import xrange
+from whoosh.system import emptybytes
 from whoosh.codec import base
 from whoosh.matching import ListMatcher
 from whoosh.reading import SegmentReader, TermInfo, TermNotFound
@@ -41,6 +42,62 @@ class MemWriter(SegmentWriter):
         self._finalize_segment()
 
 
+class MemPostingPool(object):
+    """Takes the place of a writer's posting pool for the memory codec. Instead
+    of sorting the postings and writing them to the segment when the writer
+    is committed, this adds each batch of postings directly to the in-memory
+    segment, so documents are searchable as soon as they're added.
+    """
+
+    def __init__(self, tempstore, segment, **kwargs):
+        self.segment = segment
+        self.fieldnames = set()
+
+    def add(self, item):
+        self.add_many([item])
+
+    def add_many(self, items):
+        segment = self.segment
+        invindex = segment._invindex
+        terminfos = segment._terminfos
+        lengths = segment._lengths
+        fieldnames = self.fieldnames
+
+        with segment._lock:
+            for fieldname, btext, docnum, weight, vbytes in items:
+                if vbytes is None:
+                    vbytes = emptybytes
+                if fieldname not in invindex:
+                    invindex[fieldname] = {}
+                    fieldnames.add(fieldname)
+                fielddict = invindex[fieldname]
+                if btext not in fielddict:
+                    fielddict[btext] = []
+                    terminfos[fieldname, btext] = TermInfo()
+
+                # Documents are added in order, so postings can almost always
+                # be appended to the end of the list
+                postings = fielddict[btext]
+                posting = (docnum, weight, vbytes)
+                if postings and docnum < postings[-1][0]:
+                    insort(postings, posting)
+                else:
+                    postings.append(posting)
+
+                length = lengths.get(docnum, {}).get(fieldname, 0)
+                terminfos[fieldname, btext].add_posting(docnum, weight, length)
+
+    def iter_postings(self):
+        # The postings are already in the segment
+        return iter(())
+
+    def save(self):
+        pass
+
+    def cleanup(self):
+        pass
+
+
 class MemoryCodec(base.Codec):
     def __init__(self):
         from whoosh.filedb.filestore import RamStorage
@@ -50,7 +107,7 @@ class MemoryCodec(base.Codec):
 
     def writer(self, schema):
         ix = self.storage.create_index(schema)
-        return MemWriter(ix, _lk=False, codec=self,
+        return MemWriter(ix, _lk=False, codec=self, poolclass=MemPostingPool,
                          docbase=self.segment._doccount)
 
     def reader(self, schema):
@@ -72,26 +129,35 @@ class MemoryCodec(base.Codec):
         return self.segment
 
 
+class MemColumnWriter(object):
+    # Keeps the values added to a column in a list of (docnum, value) pairs.
+    # MemPerDocReader writes them out to a real column when a reader asks for
+    # the column
+
+    def __init__(self, column):
+        self.column = column
+        self.values = []
+
+    def add(self, docnum, value):
+        self.values.append((docnum, value))
+
+
 class MemPerDocWriter(base.PerDocWriterWithColumns):
     def __init__(self, storage, segment):
         self._storage = storage
         self._segment = segment
         self.is_closed = False
-        self._colwriters = {}
-        self._doccount = 0
 
     def _has_column(self, fieldname):
-        return fieldname in self._colwriters
+        return fieldname in self._segment._columns
 
     def _create_column(self, fieldname, column):
-        colfile = self._storage.create_file("%s.c" % fieldname)
-        self._colwriters[fieldname] = (colfile, column.writer(colfile))
+        self._segment._columns[fieldname] = MemColumnWriter(column)
 
     def _get_column(self, fieldname):
-        return self._colwriters[fieldname][1]
+        return self._segment._columns[fieldname]
 
     def start_doc(self, docnum):
-        self._doccount += 1
         self._docnum = docnum
         self._stored = {}
         self._lengths = {}
@@ -112,13 +178,11 @@ class MemPerDocWriter(base.PerDocWriterWithColumns):
             self._segment._stored[docnum] = self._stored
             self._segment._lengths[docnum] = self._lengths
             self._segment._vectors[docnum] = self._vectors
+            # Make the document visible to new readers
+            if docnum >= self._segment._doccount:
+                self._segment._doccount = docnum + 1
 
     def close(self):
-        colwriters = self._colwriters
-        for fieldname in colwriters:
-            colfile, colwriter = colwriters[fieldname]
-            colwriter.finish(self._doccount)
-            colfile.close()
         self.is_closed = True
 
 
@@ -126,49 +190,103 @@ class MemPerDocReader(base.PerDocumentReader):
     def __init__(self, storage, segment):
         self._storage = storage
         self._segment = segment
+        # Documents added to the segment after the reader is created are
+        # ignored, so the reader sees a consistent snapshot of the segment
+        self._doccount = segment.doc_count_all()
+
+        self._fieldlengths = {}
+
+    def _deleted(self):
+        doccount = self._doccount
+        with self._segment._lock:
+            return [docnum for docnum in self._segment._deleted
+                    if docnum < doccount]
 
     def doc_count(self):
-        return self._segment.doc_count()
+        return self._doccount - len(self._deleted())
 
     def doc_count_all(self):
-        return self._segment.doc_count_all()
+        return self._doccount
 
     def has_deletions(self):
-        return self._segment.has_deletions()
+        return bool(self._deleted())
 
     def is_deleted(self, docnum):
         return self._segment.is_deleted(docnum)
 
     def deleted_docs(self):
-        return self._segment.deleted_docs()
+        return iter(sorted(self._deleted()))
 
     def supports_columns(self):
         return True
 
     def has_column(self, fieldname):
-        filename = "%s.c" % fieldname
-        return self._storage.file_exists(filename)
+        return fieldname in self._segment._columns
 
     def column_reader(self, fieldname, column):
-        filename = "%s.c" % fieldname
+        storage = self._storage
+        segment = self._segment
+        doccount = self._doccount
+        values = segment._columns[fieldname].values
+        end = bisect_left(values, (doccount,))
+
+        # Write the values added so far to a column file. The values are only
+        # ever appended, so the file can be reused by other readers until more
+        # values are added. The segment only keeps the latest file for each
+        # field, since readers that already opened an older file keep their
+        # own reference to its contents
+        key = (doccount, end)
+        filename = "%s.%d.%d.c" % (fieldname, doccount, end)
+        with segment._lock:
+            current = segment._colfiles.get(fieldname)
+            if current is not None and current[0] == key:
+                return self._open_column(column, filename)
+
+        colfile = storage.create_file(filename)
+        colwriter = column.writer(colfile)
+        for docnum, value in values[:end]:
+            colwriter.add(docnum, value)
+        colwriter.finish(doccount)
+        colfile.close()
+
+        with segment._lock:
+            current = segment._colfiles.get(fieldname)
+            if current is None or current[0] != key:
+                if current is not None:
+                    storage.delete_file(current[1])
+                segment._colfiles[fieldname] = (key, filename)
+            return self._open_column(column, filename)
+
+    def _open_column(self, column, filename):
         colfile = self._storage.open_file(filename)
         length = self._storage.file_length(filename)
-        return column.reader(colfile, 0, length, self._segment.doc_count_all())
+        return column.reader(colfile, 0, length, self._doccount)
 
     def doc_field_length(self, docnum, fieldname, default=0):
-        return self._segment._lengths[docnum].get(fieldname, default)
+        return self._segment._lengths.get(docnum, {}).get(fieldname, default)
+
+    def _field_lengths(self, fieldname):
+        # Returns a list of the lengths of the given field in the documents in
+        # the snapshot. The summary statistics never change for a snapshot,
+        # so they're only computed once
+        if fieldname not in self._fieldlengths:
+            doccount = self._doccount
+            with self._segment._lock:
+                lens = [fieldlens[fieldname] for docnum, fieldlens
+                        in self._segment._lengths.items()
+                        if docnum < doccount and fieldname in fieldlens]
+            self._fieldlengths[fieldname] = (sum(lens), min(lens or [0]),
+                                             max(lens or [0]))
+        return self._fieldlengths[fieldname]
 
     def field_length(self, fieldname):
-        return sum(lens.get(fieldname, 0) for lens
-                   in self._segment._lengths.values())
+        return self._field_lengths(fieldname)[0]
 
     def min_field_length(self, fieldname):
-        return min(lens[fieldname] for lens in self._segment._lengths.values()
-                   if fieldname in lens)
+        return self._field_lengths(fieldname)[1]
 
     def max_field_length(self, fieldname):
-        return max(lens[fieldname] for lens in self._segment._lengths.values()
-                   if fieldname in lens)
+        return self._field_lengths(fieldname)[2]
 
     def has_vector(self, docnum, fieldname):
         return (docnum in self._segment._vectors
@@ -179,7 +297,7 @@ class MemPerDocReader(base.PerDocumentReader):
         ids, weights, values = zip(*items)
         return ListMatcher(ids, weights, values, format_)
 
-    def stored_fields(self, docnum):
+    def stored_fields(self, docnum, fieldnames=None):
         return self._segment._stored[docnum]
 
     def close(self):
@@ -251,35 +369,85 @@ class MemTermsReader(base.TermsReader):
         self._storage = storage
         self._segment = segment
         self._invindex = segment._invindex
+        # Ignore postings for documents added after the reader is created
+        self._doccount = segment.doc_count_all()
+        # Term statistics for the snapshot, computed when they're first needed
+        self._terminfos = {}
+
+    def _in_snapshot(self, postings):
+        # Terms whose first posting is in a document added after the reader
+        # was created are not in the snapshot
+        return bool(postings) and postings[0][0] < self._doccount
+
+    def _field_terms(self, fieldname):
+        # Returns a sorted list of the terms in the given field. Documents
+        # may be added to the segment while we look, so hold the lock
+        with self._segment._lock:
+            fielddict = self._invindex[fieldname]
+            return sorted(btext for btext, postings in fielddict.items()
+                          if self._in_snapshot(postings))
+
+    def _postings(self, fieldname, btext):
+        # Returns the term's postings in the documents in the snapshot
+        with self._segment._lock:
+            try:
+                postings = self._invindex[fieldname][btext]
+            except KeyError:
+                raise TermNotFound("No term %s:%r" % (fieldname, btext))
+            return postings[:bisect_left(postings, (self._doccount,))]
+
+    def _terminfo(self, fieldname, btext):
+        key = (fieldname, btext)
+        if key not in self._terminfos:
+            postings = self._postings(fieldname, btext)
+            if not postings:
+                raise TermNotFound("No term %s:%r" % (fieldname, btext))
+            lengths = self._segment._lengths
+            terminfo = TermInfo()
+            for docnum, weight, _ in postings:
+                length = lengths.get(docnum, {}).get(fieldname, 0)
+                terminfo.add_posting(docnum, weight, length)
+            self._terminfos[key] = terminfo
+        return self._terminfos[key]
 
     def __contains__(self, term):
-        return term in self._segment._terminfos
+        with self._segment._lock:
+            postings = self._invindex.get(term[0], {}).get(term[1])
+            return self._in_snapshot(postings)
 
     def terms(self):
-        for fieldname in self._invindex:
-            for btext in self._invindex[fieldname]:
+        for fieldname in self.indexed_field_names():
+            for btext in self._field_terms(fieldname):
                 yield (fieldname, btext)
 
     def terms_from(self, fieldname, prefix):
         if fieldname not in self._invindex:
             raise TermNotFound("Unknown field %r" % (fieldname,))
-        terms = sorted(self._invindex[fieldname])
-        if not terms:
-            return
+        terms = self._field_terms(fieldname)
         start = bisect_left(terms, prefix)
         for i in xrange(start, len(terms)):
             yield (fieldname, terms[i])
 
     def term_info(self, fieldname, text):
-        return self._segment._terminfos[fieldname, text]
+        return self._terminfo(fieldname, text)
+
+    def frequency(self, fieldname, text):
+        return self._terminfo(fieldname, text).weight()
+
+    def doc_frequency(self, fieldname, text):
+        return self._terminfo(fieldname, text).doc_frequency()
 
     def matcher(self, fieldname, btext, format_, scorer=None):
-        items = self._invindex[fieldname][btext]
+        items = self._postings(fieldname, btext)
+        if not items:
+            return ListMatcher([], [], [], format_, scorer=scorer)
         ids, weights, values = zip(*items)
-        return ListMatcher(ids, weights, values, format_, scorer=scorer)
+        return ListMatcher(ids, weights, values, format_, scorer=scorer,
+                           terminfo=self._terminfo(fieldname, btext))
 
     def indexed_field_names(self):
-        return self._invindex.keys()
+        with self._segment._lock:
+            return list(self._invindex.keys())
 
     def close(self):
         pass
@@ -295,6 +463,11 @@ class MemSegment(base.Segment):
         self._vectors = {}
         self._invindex = {}
         self._terminfos = {}
+        self._columns = {}
+        # Maps field names to the (doccount, valuecount) key and name of the
+        # latest file written for the column by a reader
+        self._colfiles = {}
+        self._deleted = set()
         self._lock = Lock()
 
     def codec(self):
@@ -316,6 +489,7 @@ class MemSegment(base.Segment):
             del self._stored[docnum]
             del self._lengths[docnum]
             del self._vectors[docnum]
+            self._deleted.add(docnum)
 
     def has_deletions(self):
         with self._lock:
@@ -291,7 +291,7 @@ class PlainPerDocReader(base.PerDocumentReader, LineReader):
             c = self._find_line(2, "DOCFIELD")
         return sfs
 
-    def stored_fields(self, docnum):
+    def stored_fields(self, docnum, fieldnames=None):
         if not self._find_doc(docnum):
             raise Exception
         return self._read_stored_fields()
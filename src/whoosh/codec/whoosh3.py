@@ -31,19 +31,27 @@ This module implements a "codec" for writing/reading Whoosh X indexes.
 
 import struct
 from array import array
+from bisect import bisect_left
 from collections import defaultdict
+from heapq import nsmallest
+from operator import itemgetter
+from threading import Lock
 
 from whoosh import columns, formats
-from whoosh.compat import b, bytes_type, string_type, integer_types
-from whoosh.compat import dumps, loads, iteritems, xrange
+from whoosh.compat import b, bytes_type, string_type, text_type, integer_types
+from whoosh.compat import BytesIO, dumps, loads, iteritems, xrange
+from whoosh.compat import array_frombytes, array_tobytes
 from whoosh.codec import base
 from whoosh.filedb import compound, filetables
+from whoosh.filedb.structfile import BufferFile, StructFile
 from whoosh.matching import ListMatcher, ReadTooFar, LeafMatcher
 from whoosh.reading import TermInfo, TermNotFound
-from whoosh.system import emptybytes
+from whoosh.system import IS_LITTLE, emptybytes
 from whoosh.system import _SHORT_SIZE, _INT_SIZE, _LONG_SIZE, _FLOAT_SIZE
-from whoosh.system import pack_ushort, unpack_ushort
+from whoosh.system import pack_ushort, unpack_ushort, pack_uint
 from whoosh.system import pack_int, unpack_int, pack_long, unpack_long
+from whoosh.system import pack_float, unpack_float
+from whoosh.util import numlists
 from whoosh.util.numlists import delta_encode, delta_decode
 from whoosh.util.numeric import length_to_byte, byte_to_length
 
@@ -56,6 +64,8 @@ except ImportError:
 # This byte sequence is written at the start of a posting list to identify the
 # codec/version
 WHOOSH3_HEADER_MAGIC = b("W3Bl")
+# Header for posting lists written with the binary (pickle-free) block format
+WHOOSH3_BINARY_MAGIC = b("W3Bb")
 
 # Column type to store field length info
 LENGTHS_COLUMN = columns.NumericColumn("B", default=0)
@@ -74,10 +84,74 @@ class W3Codec(base.Codec):
     VPOSTS_EXT = ".vps"  # Vector postings
     COLUMN_EXT = ".col"  # Per-document value columns
 
-    def __init__(self, blocklimit=128, compression=3, inlinelimit=1):
+    # Codec objects pickled in a TOC before these options existed don't have
+    # the attributes, so fall back to the old behavior
+    _binary = False
+    _idencoding = None
+    _weightencoding = None
+    _fieldencodings = None
+    _blockterms = False
+    _blockstored = False
+
+    def __init__(self, blocklimit=128, compression=3, inlinelimit=1,
+                 binary=True, idencoding=None, weightencoding=None,
+                 fieldencodings=None, blockterms=False, blockstored=False):
+        """
+        :param blocklimit: the maximum number of postings in each block of a
+            posting list.
+        :param compression: the zlib compression level to use for posting
+            blocks, or 0 to not compress the blocks.
+        :param inlinelimit: posting lists with fewer than this number of
+            postings are stored in the term info instead of the postings file.
+        :param binary: if True (the default), write posting blocks using a
+            fixed binary layout that can be decoded with ``array`` and
+            ``struct`` instead of pickling each block. Readers can read either
+            format regardless of this setting.
+        :param idencoding: the name of the integer encoding to use for the
+            (delta-encoded) document numbers in binary posting blocks. One of
+            ``"varints"``, ``"simple16"``, ``"gints"`` or ``"pfordelta"``. The
+            default (``None``) stores them in an array of the smallest type
+            that fits.
+        :param weightencoding: the name of the integer encoding to use for
+            weights in binary posting blocks, when all the weights in a block
+            are whole numbers (e.g. term frequencies). The names are the same
+            as for ``idencoding``.
+        :param fieldencodings: an optional dictionary mapping field names to
+            ``(idencoding, weightencoding)`` tuples, overriding the encodings
+            above for individual fields.
+        :param blockterms: if True, write the term dictionary as blocks of
+            prefix-compressed terms with a sparse index of the first term in
+            each block (see :class:`whoosh.filedb.filetables.PrefixBlockWriter`)
+            instead of an on-disk hash table. This makes the term dictionary
+            smaller and makes ordered access (prefix, range, wildcard and
+            fuzzy queries) faster. Readers can read either format regardless of
+            this setting.
+        :param blockstored: if True, write stored fields in compressed blocks
+            of adjacent documents using
+            :class:`whoosh.columns.StoredFieldsColumn` instead of pickling and
+            compressing each document's stored fields separately. This makes
+            the stored fields much smaller and makes reading the stored fields
+            of many documents at once (see
+            :meth:`whoosh.reading.IndexReader.stored_fields_many`) faster, but
+            reading a single document's fields is slower. Readers can read
+            either format regardless of this setting.
+        """
+
         self._blocklimit = blocklimit
         self._compression = compression
         self._inlinelimit = inlinelimit
+        self._binary = binary
+
+        for name in (idencoding, weightencoding):
+            _encoding_code(name)
+        for encodings in (fieldencodings or {}).values():
+            for name in encodings:
+                _encoding_code(name)
+        self._idencoding = idencoding
+        self._weightencoding = weightencoding
+        self._fieldencodings = fieldencodings
+        self._blockterms = blockterms
+        self._blockstored = blockstored
 
     # def automata(self):
 
@@ -91,10 +165,21 @@ class W3Codec(base.Codec):
 
     # Postings
 
-    def postings_writer(self, dbfile, byteids=False):
+    def postings_writer(self, dbfile, byteids=False, fieldname=None):
+        idenc, weightenc = self._encodings(fieldname)
         return W3PostingsWriter(dbfile, blocklimit=self._blocklimit,
                                 byteids=byteids, compression=self._compression,
-                                inlinelimit=self._inlinelimit)
+                                inlinelimit=self._inlinelimit,
+                                binary=self._binary, idencoding=idenc,
+                                weightencoding=weightenc)
+
+    def _encodings(self, fieldname):
+        # Returns the names of the ID and weight encodings to use for the given
+        # field
+        fieldencodings = self._fieldencodings
+        if fieldencodings and fieldname in fieldencodings:
+            return fieldencodings[fieldname]
+        return self._idencoding, self._weightencoding
 
     def postings_reader(self, dbfile, terminfo, format_, term=None, scorer=None):
         if terminfo.is_inlined():
@@ -117,9 +202,9 @@ class W3Codec(base.Codec):
     def terms_reader(self, storage, segment):
         tiname = segment.make_filename(self.TERMS_EXT)
         tilen = storage.file_length(tiname)
-        tifile = storage.open_file(tiname)
+        tifile = storage.open_file(tiname, mapped=True)
 
-        postfile = segment.open_file(storage, self.POSTS_EXT)
+        postfile = segment.open_file(storage, self.POSTS_EXT, mapped=True)
 
         return W3TermsReader(self, tifile, tilen, postfile)
 
@@ -143,6 +228,14 @@ class W3Codec(base.Codec):
 
 # Common functions
 
+def _open_terms_index(dbfile, length):
+    # Returns a reader for a term dictionary file, which is either an ordered
+    # hash file or a prefix-compressed block file
+    if dbfile.get(0, 4) == filetables.PrefixBlockWriter.magic:
+        return filetables.PrefixBlockReader(dbfile, length)
+    return filetables.OrderedHashReader(dbfile, length)
+
+
 def _vecfield(fieldname):
     return "_%s_vec" % fieldname
 
@@ -162,7 +255,11 @@ class W3PerDocWriter(base.PerDocWriterWithColumns):
         tempst = storage.temp_storage("%s.tmp" % segment.indexname)
         self._cols = compound.CompoundWriter(tempst)
         self._colwriters = {}
-        self._create_column("_stored", STORED_COLUMN)
+        if codec._blockstored:
+            self._storedcolumn = columns.StoredFieldsColumn()
+        else:
+            self._storedcolumn = STORED_COLUMN
+        self._create_column("_stored", self._storedcolumn)
 
         self._fieldlengths = defaultdict(int)
         self._doccount = 0
@@ -246,7 +343,7 @@ class W3PerDocWriter(base.PerDocWriterWithColumns):
     def finish_doc(self):
         sf = self._storedfields
         if sf:
-            self.add_column_value("_stored", STORED_COLUMN, sf)
+            self.add_column_value("_stored", self._storedcolumn, sf)
             sf.clear()
         self._indoc = False
 
@@ -285,7 +382,10 @@ class W3FieldWriter(base.FieldWriter):
         self._format = None
 
         _tifile = self._create_file(W3Codec.TERMS_EXT)
-        self._tindex = filetables.OrderedHashWriter(_tifile)
+        if codec._blockterms:
+            self._tindex = filetables.PrefixBlockWriter(_tifile)
+        else:
+            self._tindex = filetables.OrderedHashWriter(_tifile)
         self._fieldmap = self._tindex.extras["fieldmap"] = {}
 
         self._postfile = self._create_file(W3Codec.POSTS_EXT)
@@ -311,7 +411,8 @@ class W3FieldWriter(base.FieldWriter):
         self._infield = True
 
         # Start a new postwriter for this field
-        self._postwriter = self._codec.postings_writer(self._postfile)
+        self._postwriter = self._codec.postings_writer(self._postfile,
+                                                       fieldname=fieldname)
 
     def start_term(self, btext):
         if self._postwriter is None:
@@ -338,6 +439,45 @@ class W3FieldWriter(base.FieldWriter):
         self._infield = False
         self._postwriter = None
 
+    def supports_slices(self):
+        return True
+
+    def append_slice(self, storage, segment):
+        postfile = self._postfile
+        base = postfile.tell()
+
+        # Posting lists don't contain any absolute positions, so the slice's
+        # postings file can be copied onto the end of this one as is
+        length = storage.file_length(segment.make_filename(W3Codec.POSTS_EXT))
+        slicefile = segment.open_file(storage, W3Codec.POSTS_EXT)
+        while length > 0:
+            chunk = slicefile.read(min(length, 1024 * 1024))
+            postfile.write(chunk)
+            length -= len(chunk)
+        slicefile.close()
+
+        # Copy the term infos, translating the field numbers to this writer's
+        # field map and moving the posting list pointers by the base offset
+        tifilename = segment.make_filename(W3Codec.TERMS_EXT)
+        tindex = _open_terms_index(storage.open_file(tifilename),
+                                   storage.file_length(tifilename))
+        fieldunmap = dict((num, fieldname) for fieldname, num
+                          in iteritems(tindex.extras["fieldmap"]))
+        fmap = self._fieldmap
+        offpos = W3TermInfo._struct.size
+        for keybytes, valbytes in tindex.items():
+            fieldname = fieldunmap[unpack_ushort(keybytes[:_SHORT_SIZE])[0]]
+            if fieldname not in fmap:
+                fmap[fieldname] = len(fmap)
+            keybytes = pack_ushort(fmap[fieldname]) + keybytes[_SHORT_SIZE:]
+            if base and valbytes[:1] == b("\x00"):
+                # The postings aren't inlined, so rewrite the offset
+                offset = unpack_long(valbytes[offpos:offpos + _LONG_SIZE])[0]
+                valbytes = (valbytes[:offpos] + pack_long(offset + base) +
+                            valbytes[offpos + _LONG_SIZE:])
+            self._tindex.add(keybytes, valbytes)
+        tindex.close()
+
     def close(self):
         self._tindex.close()
         self._postfile.close()
@@ -347,16 +487,24 @@ class W3FieldWriter(base.FieldWriter):
 # Reader objects
 
 class W3PerDocReader(base.PerDocumentReader):
-    def __init__(self, storage, segment):
+    def __init__(self, storage, segment, storedcache=8):
+        """
+        :param storedcache: the number of decompressed blocks of stored fields
+            to keep in memory, when the stored fields are in the block format.
+        """
+
         self._storage = storage
         self._segment = segment
         self._doccount = segment.doc_count_all()
+        self._storedcache = storedcache
+        self._blockstored = False
 
         self._vpostfile = None
         self._colfiles = {}
         self._readers = {}
         self._minlengths = {}
         self._maxlengths = {}
+        self._lengthbytes = {}
 
     def close(self):
         for colfile, _, _ in self._colfiles.values():
@@ -390,13 +538,16 @@ class W3PerDocReader(base.PerDocumentReader):
     def _get_column_file(self, fieldname):
         filename = W3Codec.column_filename(self._segment, fieldname)
         length = self._storage.file_length(filename)
-        colfile = self._storage.open_file(filename)
+        colfile = self._storage.open_file(filename, mapped=True)
         return colfile, 0, length
 
-    def column_reader(self, fieldname, column):
+    def _column_file(self, fieldname):
         if fieldname not in self._colfiles:
             self._colfiles[fieldname] = self._get_column_file(fieldname)
-        colfile, offset, length = self._colfiles[fieldname]
+        return self._colfiles[fieldname]
+
+    def column_reader(self, fieldname, column):
+        colfile, offset, length = self._column_file(fieldname)
         return column.reader(colfile, offset, length, self._doccount)
 
     # Lengths
@@ -426,6 +577,27 @@ class W3PerDocReader(base.PerDocumentReader):
         if lbyte:
             return byte_to_length(lbyte)
 
+    def doc_length_bytes(self, fieldname):
+        if fieldname in self._lengthbytes:
+            return self._lengthbytes[fieldname]
+
+        lenfield = _lenfield(fieldname)
+        lbytes = None
+        if self.has_column(lenfield):
+            # The lengths column stores one byte per document, so the column
+            # file is already the array we want
+            colfile, offset, length = self._column_file(lenfield)
+            doccount = self._doccount
+            if length >= doccount:
+                lbytes = colfile.get_view(offset, doccount)
+            else:
+                # The column leaves off trailing documents without the field,
+                # so copy the bytes and pad them out to the document count
+                lbytes = array("B", colfile.get_view(offset, length))
+                lbytes.extend(array("B", [0]) * (doccount - length))
+        self._lengthbytes[fieldname] = lbytes
+        return lbytes
+
     def field_length(self, fieldname):
         return self._segment._fieldlengths.get(fieldname, 0)
 
@@ -448,7 +620,8 @@ class W3PerDocReader(base.PerDocumentReader):
     # Vectors
 
     def _prep_vectors(self):
-        f = self._segment.open_file(self._storage, W3Codec.VPOSTS_EXT)
+        f = self._segment.open_file(self._storage, W3Codec.VPOSTS_EXT,
+                                    mapped=True)
         self._vpostfile = f
 
     def _vector_extent(self, docnum, fieldname):
@@ -484,13 +657,40 @@ class W3PerDocReader(base.PerDocumentReader):
 
     # Stored fields
 
-    def stored_fields(self, docnum):
-        reader = self._cached_reader("_stored", STORED_COLUMN)
+    def _stored_reader(self):
+        if "_stored" in self._readers:
+            return self._readers["_stored"]
+
+        # Look at the column data to see which format it was written in
+        colfile, offset, length = self._column_file("_stored")
+        self._blockstored = columns.StoredFieldsColumn.is_column(colfile,
+                                                                 offset,
+                                                                 length)
+        if self._blockstored:
+            column = columns.StoredFieldsColumn(cachesize=self._storedcache)
+        else:
+            column = STORED_COLUMN
+        reader = column.reader(colfile, offset, length, self._doccount)
+        self._readers["_stored"] = reader
+        return reader
+
+    def stored_fields(self, docnum, fieldnames=None):
+        reader = self._stored_reader()
+        if fieldnames is not None and self._blockstored:
+            # The block format can skip the fields we don't want
+            return reader.fields(docnum, fieldnames)
+
         v = reader[docnum]
         if v is None:
             v = {}
         return v
 
+    def stored_fields_many(self, docnums, fieldnames=None):
+        reader = self._stored_reader()
+        if fieldnames is not None and self._blockstored:
+            return reader.get_many(docnums, fieldnames)
+        return [v or {} for v in reader.get_many(docnums)]
+
 
 class W3FieldCursor(base.FieldCursor):
     def __init__(self, tindex, fieldname, keycoder, keydecoder, fieldobj):
@@ -550,13 +750,157 @@ class W3FieldCursor(base.FieldCursor):
         return self._pos is not None
 
 
+class W3BlockFieldCursor(base.FieldCursor):
+    # Field cursor for term dictionaries stored in prefix-compressed blocks.
+    # The cursor holds on to the decoded block it's positioned in, so moving
+    # to a nearby term is a binary search of the block's keys in memory, and
+    # the first keys of the blocks let it skip over whole blocks without
+    # reading them
+
+    def __init__(self, tindex, fieldname, keycoder, keydecoder, fieldobj):
+        self._tindex = tindex
+        self._fieldname = fieldname
+        self._keycoder = keycoder
+        self._keydecoder = keydecoder
+        self._fieldobj = fieldobj
+        self._prefix = keycoder(fieldname, b'')
+        self._blockcount = tindex.block_count()
+        self._blocknum = -1
+        self._keys = ()
+        self.first()
+
+    def _read_block(self, blocknum):
+        self._blocknum = blocknum
+        block = self._tindex.read_block(blocknum)
+        self._keys, self._datapositions, self._datalengths = block
+
+    def _seek(self, key):
+        if not self._blockcount:
+            return self._settle(None)
+
+        tindex = self._tindex
+        keys = self._keys
+        blocknum = self._blocknum
+        # If the key is past the end of the current block, look up the block
+        # it's in using the first keys
+        if (not keys or key < keys[0]
+                or (blocknum + 1 < self._blockcount
+                    and key >= tindex.first_key(blocknum + 1))):
+            self._read_block(tindex.block_for_key(key))
+            keys = self._keys
+        i = bisect_left(keys, key)
+        if i >= len(keys):
+            return self._next_block()
+        return self._settle(i)
+
+    def _next_block(self):
+        blocknum = self._blocknum + 1
+        if blocknum >= self._blockcount:
+            return self._settle(None)
+        self._read_block(blocknum)
+        return self._settle(0)
+
+    def _settle(self, i):
+        self._i = i
+        if i is not None:
+            keybytes = self._keys[i]
+            prefix = self._prefix
+            if keybytes.startswith(prefix):
+                self._text = self._fieldobj.from_bytes(keybytes[len(prefix):])
+                return self._text
+
+        self._i = self._text = None
+        return None
+
+    def first(self):
+        return self._seek(self._prefix)
+
+    def find(self, term):
+        if not isinstance(term, bytes_type):
+            term = self._fieldobj.to_bytes(term)
+        return self._seek(self._keycoder(self._fieldname, term))
+
+    def next(self):
+        if self._i is None:
+            return None
+        i = self._i + 1
+        if i >= len(self._keys):
+            return self._next_block()
+        return self._settle(i)
+
+    def text(self):
+        return self._text
+
+    def term_info(self):
+        if self._text is None:
+            return None
+
+        i = self._i
+        databytes = self._tindex.dbfile.get(self._datapositions[i],
+                                            self._datalengths[i])
+        return W3TermInfo.from_bytes(databytes)
+
+    def is_valid(self):
+        return self._text is not None
+
+
+class _SharedCache(object):
+    # A size-limited cache shared by the matchers and searchers using a terms
+    # reader while share_postings() is on. When the cache is full, adding
+    # another item removes the least recently used 10% of the items
+
+    def __init__(self, maxsize):
+        self._maxsize = maxsize
+        self._data = {}
+        self._lastused = {}
+        self._counter = 0
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._counter += 1
+                self._lastused[key] = self._counter
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            data = self._data
+            lastused = self._lastused
+            if key not in data and len(data) >= self._maxsize:
+                for k, _ in nsmallest(self._maxsize // 10 or 1,
+                                      iteritems(lastused), key=itemgetter(1)):
+                    del data[k]
+                    del lastused[k]
+            self._counter += 1
+            data[key] = value
+            lastused[key] = self._counter
+
+
 class W3TermsReader(base.TermsReader):
+    # The maximum number of term infos and decoded posting blocks to keep
+    # while share_postings() is on
+    ticachesize = 10000
+    blockcachesize = 1024
+
     def __init__(self, codec, dbfile, length, postfile):
         self._codec = codec
         self._dbfile = dbfile
-        self._tindex = filetables.OrderedHashReader(dbfile, length)
+        self._tindex = _open_terms_index(dbfile, length)
         self._fieldmap = self._tindex.extras["fieldmap"]
         self._postfile = postfile
+        # Caches used while share_postings() is on: term info objects keyed by
+        # term key, and decoded posting blocks keyed by data offset. The
+        # caches are kept until every caller that turned sharing on has
+        # turned it off again
+        self._ticache = None
+        self._blockcache = None
+        self._sharecount = 0
+        self._sharelock = Lock()
 
         self._fieldunmap = [None] * len(self._fieldmap)
         for fieldname, num in iteritems(self._fieldmap):
@@ -584,7 +928,11 @@ class W3TermsReader(base.TermsReader):
         tindex = self._tindex
         coder = self._keycoder
         decoder = self._keydecoder
-        return W3FieldCursor(tindex, fieldname, coder, decoder, fieldobj)
+        if isinstance(tindex, filetables.PrefixBlockReader):
+            cls = W3BlockFieldCursor
+        else:
+            cls = W3FieldCursor
+        return cls(tindex, fieldname, coder, decoder, fieldobj)
 
     def terms(self):
         keydecoder = self._keydecoder
@@ -611,10 +959,19 @@ class W3TermsReader(base.TermsReader):
 
     def term_info(self, fieldname, tbytes):
         key = self._keycoder(fieldname, tbytes)
+        ticache = self._ticache
+        if ticache is not None:
+            terminfo = ticache.get(key)
+            if terminfo is not None:
+                return terminfo
+
         try:
-            return W3TermInfo.from_bytes(self._tindex[key])
+            terminfo = W3TermInfo.from_bytes(self._tindex[key])
         except KeyError:
             raise TermNotFound("No term %s:%r" % (fieldname, tbytes))
+        if ticache is not None:
+            ticache.put(key, terminfo)
+        return terminfo
 
     def frequency(self, fieldname, tbytes):
         datapos = self._range_for_key(fieldname, tbytes)[0]
@@ -628,15 +985,156 @@ class W3TermsReader(base.TermsReader):
         terminfo = self.term_info(fieldname, tbytes)
         m = self._codec.postings_reader(self._postfile, terminfo, format_,
                                         term=(fieldname, tbytes), scorer=scorer)
+        blockcache = self._blockcache
+        if blockcache is not None and isinstance(m, W3LeafMatcher):
+            m._blockcache = blockcache
         return m
 
+    def share_postings(self, share):
+        with self._sharelock:
+            if share:
+                self._sharecount += 1
+                if self._sharecount == 1:
+                    self._ticache = _SharedCache(self.ticachesize)
+                    self._blockcache = _SharedCache(self.blockcachesize)
+            elif self._sharecount:
+                self._sharecount -= 1
+                if not self._sharecount:
+                    self._ticache = self._blockcache = None
+
     def close(self):
+        self._ticache = self._blockcache = None
         self._tindex.close()
         self._postfile.close()
 
 
 # Postings
 
+# Binary block format
+#
+# Block info (uncompressed):
+#   I   | Number of postings in the block
+#   f   | Maximum weight in block
+#   B   | Compression level (0 if the block data is not compressed)
+#   B   | Minimum length byte
+#   B   | Maximum length byte
+# Followed by the last ID in the block, either as an unsigned int, or for
+# byte IDs (vector postings) as a ushort length followed by the UTF-8 bytes
+#
+# Block data (optionally zlib compressed):
+#   IDs: an array of the delta-encoded IDs, or for byte IDs an array of the
+#     term lengths followed by the concatenated terms
+#   Weights: a flag byte, followed by nothing if all the weights are 1.0, a
+#     single float if all the weights are the same, or an array of floats
+#   Values: nothing if the format has no values, the concatenated values if
+#     they are a fixed size, otherwise an array of the value lengths followed
+#     by the concatenated values
+#
+# Lists of numbers are written as an encoding code and an item count. Codes
+# less than len(_NUM_TYPECODES) mean the numbers follow as a big-endian array
+# of that type, higher codes mean they were written using the corresponding
+# NumberEncoding in _NUM_ENCODINGS.
+_BLOCK_INFO = struct.Struct("!IfBBB")
+_NUM_HEADER = struct.Struct("!BI")
+_NUM_TYPECODES = ("B", "H", "I")
+# Don't change the existing codes, they're stored in the posting blocks
+_NUM_ENCODINGS = {
+    3: numlists.Varints(),
+    4: numlists.Simple16(),
+    5: numlists.GInts(),
+    6: numlists.PForDelta(),
+}
+_ENCODING_CODES = {"varints": 3, "simple16": 4, "gints": 5, "pfordelta": 6}
+_WEIGHTS_ONE = b("\x00")
+_WEIGHTS_SAME = b("\x01")
+_WEIGHTS_ARRAY = b("\x02")
+_WEIGHTS_INTS = b("\x03")
+# Block data shorter than this is not worth compressing
+_MIN_COMPRESS_SIZE = 20
+
+
+def _encode_byteid(id_):
+    if isinstance(id_, text_type):
+        id_ = id_.encode("utf-8")
+    return id_
+
+
+def _array_bytes(arry):
+    # Returns the bytes of the given array in big-endian order
+    if IS_LITTLE and arry.itemsize > 1:
+        arry.byteswap()
+    return array_tobytes(arry)
+
+
+def _encoding_code(name):
+    # Translates an encoding name into the code stored in the posting blocks
+    if name is None:
+        return None
+    try:
+        return _ENCODING_CODES[name]
+    except KeyError:
+        raise ValueError("Unknown number encoding %r" % (name,))
+
+
+def _pack_nums(nums, encoding=None):
+    # Packs a list of non-negative integers using the encoding with the given
+    # code, or if it's None (or the numbers are too big for the encoding) into
+    # an array of the smallest typecode that can hold the largest number
+    maxnum = max(nums) if nums else 0
+    if encoding is not None:
+        numenc = _NUM_ENCODINGS[encoding]
+        if numenc.maxint is None or maxnum <= numenc.maxint:
+            f = StructFile(BytesIO())
+            numenc.write_nums(f, nums)
+            return _NUM_HEADER.pack(encoding, len(nums)) + f.file.getvalue()
+
+    if maxnum < 2 ** 8:
+        code = 0
+    elif maxnum < 2 ** 16:
+        code = 1
+    else:
+        code = 2
+    arry = array(_NUM_TYPECODES[code], nums)
+    return _NUM_HEADER.pack(code, len(arry)) + _array_bytes(arry)
+
+
+def _unpack_array(typecode, data, pos, count):
+    # Reads an array of count items of the given type from the data at the
+    # given position, and returns the array and the position after it
+    arry = array(typecode)
+    end = pos + count * arry.itemsize
+    array_frombytes(arry, data[pos:end])
+    if IS_LITTLE and arry.itemsize > 1:
+        arry.byteswap()
+    return arry, end
+
+
+def _unpack_nums(data, pos):
+    # Reads an array written by _pack_nums() from the data at the given
+    # position, and returns the array and the position after it
+    code, count = _NUM_HEADER.unpack(data[pos:pos + _NUM_HEADER.size])
+    pos += _NUM_HEADER.size
+    if code < len(_NUM_TYPECODES):
+        return _unpack_array(_NUM_TYPECODES[code], data, pos, count)
+
+    f = BufferFile(data)
+    f.seek(pos)
+    nums = array("I", _NUM_ENCODINGS[code].read_nums(f, count))
+    return nums, f.tell()
+
+
+def _split_bytes(data, pos, lengths):
+    # Cuts the concatenated strings with the given lengths out of the data
+    # starting at the given position, and returns a tuple of the strings and
+    # the position after them
+    items = []
+    for length in lengths:
+        end = pos + length
+        items.append(data[pos:end])
+        pos = end
+    return tuple(items), pos
+
+
 class W3PostingsWriter(base.PostingsWriter):
     """This object writes posting lists to the postings file. It groups postings
     into blocks and tracks block level statistics to makes it easier to skip
@@ -644,12 +1142,16 @@ class W3PostingsWriter(base.PostingsWriter):
     """
 
     def __init__(self, postfile, blocklimit, byteids=False, compression=3,
-                 inlinelimit=1):
+                 inlinelimit=1, binary=False, idencoding=None,
+                 weightencoding=None):
         self._postfile = postfile
         self._blocklimit = blocklimit
         self._byteids = byteids
         self._compression = compression
         self._inlinelimit = inlinelimit
+        self._binary = binary
+        self._idencoding = _encoding_code(idencoding)
+        self._weightencoding = _encoding_code(weightencoding)
 
         self._blockcount = 0
         self._format = None
@@ -746,21 +1248,47 @@ class W3PostingsWriter(base.PostingsWriter):
 
         # If this is the first block, write a small header first
         if not self._blockcount:
-            self._postfile.write(WHOOSH3_HEADER_MAGIC)
+            if self._binary:
+                self._postfile.write(WHOOSH3_BINARY_MAGIC)
+            else:
+                self._postfile.write(WHOOSH3_HEADER_MAGIC)
 
         # Add this block's statistics to the terminfo object, which tracks the
         # overall statistics for all term postings
         self._terminfo.add_block(self)
 
+        if self._binary:
+            infobytes, databytes = self._binary_block()
+        else:
+            infobytes, databytes = self._pickled_block()
+
+        # Write block length
+        postfile = self._postfile
+        blocklength = len(infobytes) + len(databytes)
+        if last:
+            # If this is the last block, use a negative number
+            blocklength *= -1
+        postfile.write_int(blocklength)
+        # Write block info
+        postfile.write(infobytes)
+        # Write block data
+        postfile.write(databytes)
+
+        self._blockcount += 1
+        # Reset block buffer
+        self._new_block()
+
+    def _pickled_block(self):
         # Minify the IDs, weights, and values, and put them in a tuple
         data = (self._mini_ids(), self._mini_weights(), self._mini_values())
         # Pickle the tuple
         databytes = dumps(data, 2)
         # If the pickle is less than 20 bytes, don't bother compressing
-        if len(databytes) < 20:
+        if len(databytes) < _MIN_COMPRESS_SIZE:
             comp = 0
+        else:
+            comp = self._compression
         # Compress the pickle (if self._compression > 0)
-        comp = self._compression
         if comp:
             databytes = zlib.compress(databytes, comp)
 
@@ -779,22 +1307,68 @@ class W3PostingsWriter(base.PostingsWriter):
                            length_to_byte(self._minlength),
                            length_to_byte(self._maxlength),
                            ), 2)
+        return infobytes, databytes
 
-        # Write block length
-        postfile = self._postfile
-        blocklength = len(infobytes) + len(databytes)
-        if last:
-            # If this is the last block, use a negative number
-            blocklength *= -1
-        postfile.write_int(blocklength)
-        # Write block info
-        postfile.write(infobytes)
-        # Write block data
-        postfile.write(databytes)
+    def _binary_block(self):
+        # Encode the block using the binary format (see the comments above
+        # _BLOCK_INFO)
 
-        self._blockcount += 1
-        # Reset block buffer
-        self._new_block()
+        ids = self._ids
+        if self._byteids:
+            # The IDs are terms: write an array of their encoded lengths
+            # followed by the concatenated encoded terms
+            idbytes = [_encode_byteid(id_) for id_ in ids]
+            parts = [_pack_nums([len(bs) for bs in idbytes]),
+                     emptybytes.join(idbytes)]
+            maxid = idbytes[-1]
+            maxidbytes = pack_ushort(len(maxid)) + maxid
+        else:
+            # Write the delta-encoded IDs as an array
+            parts = [_pack_nums(list(delta_encode(ids)), self._idencoding)]
+            maxidbytes = pack_uint(ids[-1])
+
+        # Weights
+        weights = self._weights
+        if all(w == 1.0 for w in weights):
+            parts.append(_WEIGHTS_ONE)
+        elif all(w == weights[0] for w in weights):
+            parts.append(_WEIGHTS_SAME + pack_float(weights[0]))
+        elif all(w.is_integer() and 0 <= w < 2 ** 32 for w in weights):
+            # Whole number weights (e.g. frequencies) are stored as integers
+            intweights = [int(w) for w in weights]
+            parts.append(_WEIGHTS_INTS + _pack_nums(intweights,
+                                                    self._weightencoding))
+        else:
+            parts.append(_WEIGHTS_ARRAY + _array_bytes(array("f", weights)))
+
+        # Values
+        fixedsize = self._format.fixed_value_size()
+        values = self._values
+        if fixedsize is None or fixedsize < 0:
+            # Write an array of the value lengths followed by the values
+            parts.append(_pack_nums([len(v) for v in values]))
+            parts.append(emptybytes.join(values))
+        elif fixedsize:
+            parts.append(emptybytes.join(values))
+
+        databytes = emptybytes.join(parts)
+        # Don't bother compressing very small blocks
+        comp = self._compression
+        if len(databytes) < _MIN_COMPRESS_SIZE:
+            comp = 0
+        if comp:
+            compressed = zlib.compress(databytes, comp)
+            # Keep the uncompressed data if compression didn't help (which is
+            # common when the numbers are already packed tightly)
+            if len(compressed) < len(databytes):
+                databytes = compressed
+            else:
+                comp = 0
+
+        infobytes = _BLOCK_INFO.pack(len(ids), self._maxweight, comp,
+                                     length_to_byte(self._minlength),
+                                     length_to_byte(self._maxlength))
+        return infobytes + maxidbytes, databytes
 
     # Methods to reduce the byte size of the various lists
 
@@ -873,6 +1447,9 @@ class W3LeafMatcher(LeafMatcher):
         self._term = term
         self._byteids = byteids
         self.scorer = scorer
+        # A cache shared with other matchers on the same postings file,
+        # mapping block data offsets to decoded (data, ids) pairs, or None
+        self._blockcache = None
 
         self._fixedsize = self.format.fixed_value_size()
         # Read the header tag at the start of the postings
@@ -886,7 +1463,11 @@ class W3LeafMatcher(LeafMatcher):
 
         postfile.seek(self._startoffset)
         magic = postfile.read(4)
-        if magic != WHOOSH3_HEADER_MAGIC:
+        if magic == WHOOSH3_BINARY_MAGIC:
+            self._binary = True
+        elif magic == WHOOSH3_HEADER_MAGIC:
+            self._binary = False
+        else:
             raise Exception("Block tag error %r" % magic)
 
         # Remember the base offset (start of postings, after the header)
@@ -931,14 +1512,24 @@ class W3LeafMatcher(LeafMatcher):
 
         # Remember the offset of the next block
         self._nextoffset = position + _INT_SIZE + length
-        # Read the pickled block info tuple
-        info = postfile.read_pickle()
+        if self._binary:
+            # Read the fixed-size block info and the last ID in the block
+            info = postfile.read(_BLOCK_INFO.size)
+            (self._blocklength, self._maxweight, self._compression,
+             mnlen, mxlen) = _BLOCK_INFO.unpack(info)
+            if self._byteids:
+                self._maxid = postfile.read_string2().decode("utf-8")
+            else:
+                self._maxid = postfile.read_uint()
+        else:
+            # Read the pickled block info tuple
+            info = postfile.read_pickle()
+            # Decompose the info tuple to set the current block info
+            (self._blocklength, self._maxid, self._maxweight,
+             self._compression, mnlen, mxlen) = info
         # Remember the offset of the block's data
         self._dataoffset = postfile.tell()
 
-        # Decompose the info tuple to set the current block info
-        (self._blocklength, self._maxid, self._maxweight, self._compression,
-         mnlen, mxlen) = info
         self._minlength = byte_to_length(mnlen)
         self._maxlength = byte_to_length(mxlen)
 
@@ -1040,6 +1631,17 @@ class W3LeafMatcher(LeafMatcher):
         # minimum
         return self._skip_to_block(lambda: block_quality() <= minquality)
 
+    def block_arrays(self):
+        if self._ids is None:
+            self._read_ids()
+        if self._weights is None:
+            self._read_weights()
+        i = self._i
+        return self._ids[i:], self._weights[i:]
+
+    def skip_block(self):
+        self._next_block()
+
     def block_min_id(self):
         if self._ids is None:
             self._read_ids()
@@ -1060,20 +1662,76 @@ class W3LeafMatcher(LeafMatcher):
     def _read_data(self):
         # Load block data tuple from disk
 
+        # If another matcher already decoded this block, use its data
+        blockcache = self._blockcache
+        if blockcache is not None:
+            cached = blockcache.get(self._dataoffset)
+            if cached is not None:
+                self._data, self._ids = cached
+                return
+
         datalen = self._nextoffset - self._dataoffset
         b = self._postfile.get(self._dataoffset, datalen)
 
-        # Decompress the pickled data if necessary
+        # Decompress the data if necessary
         if self._compression:
             b = zlib.decompress(b)
 
-        # Unpickle the data tuple and save it in an attribute
-        self._data = loads(b)
+        if self._binary:
+            # Decode the binary data into the same "minified" tuple the
+            # pickled format stores
+            self._data = self._decode_binary(b)
+        else:
+            # Unpickle the data tuple and save it in an attribute
+            self._data = loads(b)
+
+        if blockcache is not None:
+            blockcache.put(self._dataoffset, (self._data, None))
+
+    def _decode_binary(self, b):
+        postcount = self._blocklength
+
+        # IDs
+        if self._byteids:
+            lengths, pos = _unpack_nums(b, 0)
+            ids, pos = _split_bytes(b, pos, lengths)
+            ids = tuple(id_.decode("utf-8") for id_ in ids)
+        else:
+            ids, pos = _unpack_nums(b, 0)
+
+        # Weights
+        flag = b[pos:pos + 1]
+        pos += 1
+        if flag == _WEIGHTS_ONE:
+            weights = None
+        elif flag == _WEIGHTS_SAME:
+            weights = unpack_float(b[pos:pos + _FLOAT_SIZE])[0]
+            pos += _FLOAT_SIZE
+        elif flag == _WEIGHTS_INTS:
+            intweights, pos = _unpack_nums(b, pos)
+            weights = array("f", intweights)
+        else:
+            weights, pos = _unpack_array("f", b, pos, postcount)
+
+        # Values
+        fixedsize = self._fixedsize
+        if fixedsize is None or fixedsize < 0:
+            lengths, pos = _unpack_nums(b, pos)
+            values = _split_bytes(b, pos, lengths)[0]
+        elif fixedsize:
+            values = b[pos:]
+        else:
+            values = None
+
+        return ids, weights, values
 
     def _read_ids(self):
         # If we haven't loaded the data from disk yet, load it now
         if self._data is None:
             self._read_data()
+            if self._ids is not None:
+                # The decoded IDs came from the block cache
+                return
         ids = self._data[0]
 
         # De-minify the IDs
@@ -1081,6 +1739,8 @@ class W3LeafMatcher(LeafMatcher):
             ids = tuple(delta_decode(ids))
 
         self._ids = ids
+        if self._blockcache is not None:
+            self._blockcache.put(self._dataoffset, (self._data, ids))
 
     def _read_weights(self):
         # If we haven't loaded the data from disk yet, load it now
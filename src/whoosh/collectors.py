@@ -73,6 +73,12 @@ method uses many of these when you specify various parameters.
 
 NOTE: collectors are not designed to be reentrant or thread-safe. It is
 generally a good idea to create a new collector for each search.
+
+To search the segments of an index in parallel
+(``mysearcher.search(myquery, workers=4)``), the searcher runs a separate
+collector for each segment and then calls :meth:`Collector.merge` to combine
+them. Collectors that support this return ``True`` from
+:meth:`Collector.supports_merge`.
 """
 
 import os
@@ -80,12 +86,12 @@ import threading
 from array import array
 from bisect import insort
 from collections import defaultdict
-from heapq import heapify, heappush, heapreplace
+from heapq import heapify, heappush, heapreplace, nlargest
 
 from whoosh import sorting
-from whoosh.compat import abstractmethod, iteritems, itervalues, xrange
+from whoosh.compat import abstractmethod, iteritems, itervalues, izip, xrange
 from whoosh.searching import Results, TimeLimit
-from whoosh.util import now
+from whoosh.util import now, overrides_together
 
 
 # Functions
@@ -202,6 +208,26 @@ class Collector(object):
 
         return len(self.docset)
 
+    def supports_merge(self):
+        """Returns True if this collector implements :meth:`Collector.merge`,
+        so the searcher can run a copy of it on each segment in parallel and
+        combine the copies afterwards.
+        """
+
+        return False
+
+    def merge(self, other):
+        """Adds the results collected by ``other``, a collector of the same
+        type that was prepared for the same search but run on different
+        sub-searchers, to this collector. (Only valid after both collectors are
+        run.)
+
+        Subclasses that support merging should override this method and
+        :meth:`Collector.supports_merge`.
+        """
+
+        raise NotImplementedError(self.__class__)
+
     def collect_matches(self):
         """This method calls :meth:`Collector.matches` and then for each
         matched document calls :meth:`Collector.collect`. Sub-classes that
@@ -350,6 +376,10 @@ class ScoredCollector(Collector):
     def sort_key(self, sub_docnum):
         return 0 - self.matcher.score()
 
+    def merge(self, other):
+        self.replaced_times += other.replaced_times
+        self.skipped_times += other.skipped_times
+
     def _collect(self, global_docnum, score):
         # Concrete subclasses should override this method to collect matching
         # documents
@@ -373,6 +403,45 @@ class ScoredCollector(Collector):
         # Call specialized method on subclass
         return self._collect(global_docnum, score)
 
+    def collect_matches(self):
+        matcher = self.matcher
+        # Collecting whole blocks bypasses collect(), so only do it if a
+        # subclass hasn't overridden collect()
+        if (self.final_fn is not None or self.context.needs_current
+                or not overrides_together(self, "collect", "collect_matches")
+                or not matcher.supports_block_scores()):
+            return Collector.collect_matches(self)
+
+        # The matcher can score a block of postings at a time, so collect the
+        # scores in bulk instead of calling score() on every document
+        offset = self.offset
+        _collect = self._collect
+        minscore = None
+        while matcher.is_active():
+            if self.replace and self.minscore != minscore:
+                minscore = self.minscore
+                self.matcher = matcher = matcher.replace(minscore or 0)
+                self.replaced_times += 1
+                if not matcher.is_active():
+                    break
+                if not matcher.supports_block_scores():
+                    # The replacement can't score in bulk, so finish the
+                    # sub-searcher one document at a time
+                    return Collector.collect_matches(self)
+
+            if self._use_block_quality():
+                self.skipped_times += matcher.skip_to_quality(self.minscore)
+                if not matcher.is_active():
+                    break
+
+            ids, scores = matcher.block_scores()
+            if hasattr(scores, "tolist"):
+                # Convert NumPy scores to Python floats
+                scores = scores.tolist()
+            for sub_docnum, score in izip(ids, scores):
+                _collect(offset + sub_docnum, score)
+            matcher.skip_block()
+
     def matches(self):
         minscore = self.minscore
         matcher = self.matcher
@@ -435,14 +504,37 @@ class TopCollector(ScoredCollector):
         self.limit = limit
         self.usequality = usequality
         self.total = 0
+        # Set to True if block-quality optimizations were used on any
+        # sub-searcher, since then the total may be missing skipped documents
+        self.usedquality = False
 
     def _use_block_quality(self):
         return (self.usequality
                 and not self.top_searcher.weighting.use_final
                 and self.matcher.supports_block_quality())
 
+    def set_subsearcher(self, subsearcher, offset):
+        ScoredCollector.set_subsearcher(self, subsearcher, offset)
+        if self._use_block_quality():
+            self.usedquality = True
+
     def computes_count(self):
-        return not self._use_block_quality()
+        return not self.usedquality
+
+    def supports_merge(self):
+        return True
+
+    def merge(self, other):
+        ScoredCollector.merge(self, other)
+        self.total += other.total
+        self.usedquality = self.usedquality or other.usedquality
+
+        # Keep the top N of the combined heaps
+        items = nlargest(self.limit, self.items + other.items)
+        heapify(items)
+        self.items = items
+        if len(items) >= self.limit:
+            self.minscore = items[0][0]
 
     def all_ids(self):
         # Since this collector can skip blocks, it doesn't track the total
@@ -522,6 +614,14 @@ class UnlimitedCollector(ScoredCollector):
         # Negate score to act as sort key so higher scores appear first
         return 0 - score
 
+    def supports_merge(self):
+        return True
+
+    def merge(self, other):
+        ScoredCollector.merge(self, other)
+        self.items.extend(other.items)
+        self.docset.update(other.docset)
+
     def results(self):
         # Sort by negated scores so that higher scores go first, then by
         # document number to keep the order stable when documents have the
@@ -574,6 +674,15 @@ class SortingCollector(Collector):
         self.docset.add(global_docnum)
         return sortkey
 
+    def supports_merge(self):
+        return True
+
+    def merge(self, other):
+        # The sort keys come from categorizers created by the top-level
+        # searcher, so keys from different segments are comparable
+        self.items.extend(other.items)
+        self.docset.update(other.docset)
+
     def results(self):
         items = self.items
         items.sort(reverse=self.reverse)
@@ -592,6 +701,13 @@ class UnsortedCollector(Collector):
         self.items.append((None, global_docnum))
         self.docset.add(global_docnum)
 
+    def supports_merge(self):
+        return True
+
+    def merge(self, other):
+        self.items.extend(other.items)
+        self.docset.update(other.docset)
+
     def results(self):
         items = self.items
         return self._results(items, docset=self.docset)
@@ -629,6 +745,14 @@ class WrappingCollector(Collector):
     def count(self):
         return self.child.count()
 
+    def supports_merge(self):
+        # Subclasses that keep their own state must override merge() and this
+        # method
+        return type(self) is WrappingCollector and self.child.supports_merge()
+
+    def merge(self, other):
+        self.child.merge(other.child)
+
     def collect_matches(self):
         for sub_docnum in self.matches():
             self.collect(sub_docnum)
@@ -747,6 +871,13 @@ class FilterCollector(WrappingCollector):
             # just forward the call to the child collector
             child.collect_matches()
 
+    def supports_merge(self):
+        return self.child.supports_merge()
+
+    def merge(self, other):
+        self.child.merge(other.child)
+        self.filtered_count += other.filtered_count
+
     def results(self):
         r = self.child.results()
         r.collector = self
@@ -839,6 +970,15 @@ class FacetCollector(WrappingCollector):
 
         return sortkey
 
+    def supports_merge(self):
+        return (self.child.supports_merge()
+                and all(fmap.mergeable for fmap in itervalues(self.facetmaps)))
+
+    def merge(self, other):
+        self.child.merge(other.child)
+        for name, fmap in iteritems(self.facetmaps):
+            fmap.merge(other.facetmaps[name])
+
     def results(self):
         r = self.child.results()
         r._facetmaps = self.facetmaps
@@ -1158,6 +1298,16 @@ class TermsCollector(WrappingCollector):
                 termdocs[term].append(global_docnum)
                 docterms[global_docnum].append(term)
 
+    def supports_merge(self):
+        return self.child.supports_merge()
+
+    def merge(self, other):
+        self.child.merge(other.child)
+        for term, docnums in iteritems(other.termdocs):
+            self.termdocs[term].extend(docnums)
+        for docnum, terms in iteritems(other.docterms):
+            self.docterms[docnum].extend(terms)
+
     def results(self):
         r = self.child.results()
         r.termdocs = dict(self.termdocs)
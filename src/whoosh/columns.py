@@ -49,23 +49,25 @@ and ``reader()`` to return a ``ColumnReader`` object.
 from __future__ import division, with_statement
 import struct, warnings
 from array import array
-from bisect import bisect_right
+from bisect import bisect_left, bisect_right
+from threading import Lock
 
 try:
     import zlib
 except ImportError:
     zlib = None
 
-from whoosh.compat import b, bytes_type, BytesIO
-from whoosh.compat import array_tobytes, xrange
-from whoosh.compat import dumps, loads
+from whoosh.compat import PY3, b, byte, bytes_type, BytesIO, text_type
+from whoosh.compat import array_frombytes, array_tobytes, xrange
+from whoosh.compat import dumps, loads, integer_types, iteritems
 from whoosh.filedb.structfile import StructFile
 from whoosh.idsets import BitSet, OnDiskBitSet
-from whoosh.system import emptybytes
+from whoosh.system import IS_LITTLE, emptybytes
 from whoosh.util.cache import lru_cache
 from whoosh.util.numeric import typecode_max, typecode_min
 from whoosh.util.numlists import GrowableArray
-from whoosh.util.varints import varint, read_varint
+from whoosh.util.varints import decode_signed_varint, read_varint
+from whoosh.util.varints import signed_varint, varint
 
 
 # Utility functions
@@ -83,6 +85,44 @@ def _mintype(maxn):
     return typecode
 
 
+class _BlockCache(object):
+    # A bounded cache of decoded blocks, for column readers that decode a
+    # whole block of documents at a time. When the cache is full, loading
+    # another block evicts the least recently used one
+
+    def __init__(self, loader, size):
+        self._loader = loader
+        self._size = size
+        self._blocks = {}
+        # The block numbers in the cache from least to most recently used
+        self._lru = []
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def get(self, blocknum):
+        with self._lock:
+            if blocknum in self._blocks:
+                lru = self._lru
+                if lru[-1] != blocknum:
+                    lru.remove(blocknum)
+                    lru.append(blocknum)
+                return self._blocks[blocknum]
+
+        # Decode the block without holding the lock, so threads reading other
+        # blocks don't have to wait
+        block = self._loader(blocknum)
+        if self._size:
+            with self._lock:
+                if blocknum not in self._blocks:
+                    if len(self._lru) >= self._size:
+                        del self._blocks[self._lru.pop(0)]
+                    self._blocks[blocknum] = block
+                    self._lru.append(blocknum)
+        return block
+
+
 # Python does not support arrays of long long see Issue 1172711
 # These functions help write/read a simulated an array of q/Q using lists
 
@@ -207,6 +247,12 @@ class ColumnReader(object):
     def sort_key(self, docnum):
         return self[docnum]
 
+    def get_many(self, docnums):
+        """Returns a list of the values for the given document numbers.
+        """
+
+        return [self[docnum] for docnum in docnums]
+
     def __iter__(self):
         for i in xrange(self._doccount):
             yield self[i]
@@ -880,31 +926,53 @@ class CompressedBytesColumn(Column):
             return list(self)
 
 
+# Number of values in the block, typecodes of the document number and value
+# end arrays
+_cb_header = struct.Struct("!I2s")
+# Directory position (64-bit), number of blocks, magic number
+_cb_footer = struct.Struct("!QI4s")
+
+
 class CompressedBlockColumn(Column):
-    """An experimental column type that compresses and decompresses blocks of
-    values at a time. This can lead to high compression and decent performance
-    for columns with lots of very short values, but random access times are
-    usually terrible.
+    """A column type that compresses and decompresses blocks of values at a
+    time. This can lead to high compression and decent performance for columns
+    with lots of very short values.
+
+    The reader finds the block containing a document with a binary search of a
+    small directory at the end of the column, and keeps a few of the most
+    recently used blocks in memory, so reading the values of many nearby
+    documents (for example when sorting or faceting) only decompresses each
+    block once. Use :meth:`ColumnReader.get_many` to read the values for a
+    list of documents a block at a time.
     """
 
-    def __init__(self, level=3, blocksize=32, module="zlib"):
+    magic = b("CBC1")
+
+    # Defaults for columns pickled before these options existed
+    _cachesize = 8
+
+    def __init__(self, level=3, blocksize=32, module="zlib", cachesize=8):
         """
         :param level: the compression level to use.
         :param blocksize: the size (in KB) of each compressed block.
         :param module: a string containing the name of the compression module
             to use. The default is "zlib". The module should export "compress"
             and "decompress" functions.
+        :param cachesize: the number of decompressed blocks the reader keeps
+            in memory.
         """
 
         self._level = level
         self._blocksize = blocksize
         self._module = module
+        self._cachesize = cachesize
 
     def writer(self, dbfile):
         return self.Writer(dbfile, self._level, self._blocksize, self._module)
 
     def reader(self, dbfile, basepos, length, doccount):
-        return self.Reader(dbfile, basepos, length, doccount, self._module)
+        return self.Reader(dbfile, basepos, length, doccount, self._module,
+                           self._cachesize)
 
     class Writer(ColumnWriter):
         def __init__(self, dbfile, level, blocksize, module):
@@ -912,6 +980,13 @@ class CompressedBlockColumn(Column):
             self._blocksize = blocksize * 1024
             self._level = level
             self._compress = __import__(module).compress
+            self._written = 0
+
+            # The block directory
+            self._firstdocs = array("I")
+            self._lastdocs = array("I")
+            # Block offsets can be past 4 GB, so they're stored as 64-bit
+            self._positions = make_array("Q")
 
             self._reset()
 
@@ -919,101 +994,664 @@ class CompressedBlockColumn(Column):
             return "<CompressedBlock.Writer>"
 
         def _reset(self):
-            self._startdoc = None
-            self._block = emptybytes
-            self._lengths = []
+            self._docnums = []
+            self._values = []
+            self._size = 0
 
         def _emit(self):
-            dbfile = self._dbfile
-            block = self._compress(self._block, self._level)
-            header = (self._startdoc, self._lastdoc, len(block),
-                      tuple(self._lengths))
-            dbfile.write_pickle(header)
-            dbfile.write(block)
+            docnums = self._docnums
+            values = self._values
+            firstdoc = docnums[0]
+            lastdoc = docnums[-1]
+
+            # The block starts with the number of values, the typecodes of
+            # the arrays of document numbers and value end offsets, and the
+            # arrays. If every document in the block's range has a value, the
+            # document numbers are left out
+            ends = []
+            end = 0
+            for v in values:
+                end += len(v)
+                ends.append(end)
+            endcode = _mintype(end)
+            arrays = [array(endcode, ends)]
+            doccode = "-"
+            if lastdoc - firstdoc + 1 != len(docnums):
+                doccode = _mintype(lastdoc - firstdoc)
+                arrays.insert(0, array(doccode, [d - firstdoc for d
+                                                 in docnums]))
+            parts = [_cb_header.pack(len(docnums),
+                                     (doccode + endcode).encode("ascii"))]
+            for arry in arrays:
+                if IS_LITTLE:
+                    arry.byteswap()
+                parts.append(array_tobytes(arry))
+            parts.extend(values)
+
+            block = self._compress(emptybytes.join(parts), self._level)
+            self._firstdocs.append(firstdoc)
+            self._lastdocs.append(lastdoc)
+            self._positions.append(self._written)
+            self._dbfile.write(block)
+            self._written += len(block)
 
         def add(self, docnum, v):
-            if self._startdoc is None:
-                self._startdoc = docnum
-            self._lengths.append((docnum, len(v)))
-            self._lastdoc = docnum
-
-            self._block += v
-            if len(self._block) >= self._blocksize:
+            self._docnums.append(docnum)
+            self._values.append(v)
+            self._size += len(v)
+            if self._size >= self._blocksize:
                 self._emit()
                 self._reset()
 
         def finish(self, doccount):
             # If there's still a pending block, write it out
-            if self._startdoc is not None:
+            if self._docnums:
                 self._emit()
 
+            dbfile = self._dbfile
+            dirpos = self._written
+            self._positions.append(dirpos)
+            dbfile.write_array(self._firstdocs)
+            dbfile.write_array(self._lastdocs)
+            write_qsafe_array("Q", self._positions, dbfile)
+            dbfile.write(_cb_footer.pack(dirpos, len(self._firstdocs),
+                                         CompressedBlockColumn.magic))
+
     class Reader(ColumnReader):
-        def __init__(self, dbfile, basepos, length, doccount, module):
+        def __init__(self, dbfile, basepos, length, doccount, module,
+                     cachesize=8):
             ColumnReader.__init__(self, dbfile, basepos, length, doccount)
             self._decompress = __import__(module).decompress
 
-            self._blocks = []
-            dbfile.seek(basepos)
-            pos = 0
-            while pos < length:
-                startdoc, enddoc, blocklen, lengths = dbfile.read_pickle()
-                here = dbfile.tell()
-                self._blocks.append((startdoc, enddoc, here, blocklen,
-                                     lengths))
-                dbfile.seek(blocklen, 1)
-                pos = here + blocklen
+            footer = dbfile.get(basepos + length - _cb_footer.size,
+                                _cb_footer.size)
+            dirpos, blockcount, magic = _cb_footer.unpack(footer)
+            if magic != CompressedBlockColumn.magic:
+                raise Exception("Not a compressed block column: %r" % magic)
+
+            pos = basepos + dirpos
+            self._firstdocs = dbfile.get_array(pos, "I", blockcount)
+            pos += blockcount * self._firstdocs.itemsize
+            self._lastdocs = dbfile.get_array(pos, "I", blockcount)
+            pos += blockcount * self._lastdocs.itemsize
+            dbfile.seek(pos)
+            self._positions = read_qsafe_array("Q", blockcount + 1, dbfile)
+
+            self._cache = _BlockCache(self._read_block, cachesize)
 
         def __repr__(self):
             return "<CompressedBlock.Reader>"
 
         def _find_block(self, docnum):
-            # TODO: use binary search instead of linear
-            for i, b in enumerate(self._blocks):
-                if docnum < b[0]:
-                    return None
-                elif docnum <= b[1]:
-                    return i
-            return None
-
-        def _get_block(self, blocknum):
-            block = self._blocks[blocknum]
-            pos = block[2]
-            blocklen = block[3]
-            lengths = block[4]
-
+            # Returns the number of the block containing the given document,
+            # or None if no block contains it
+            i = bisect_right(self._firstdocs, docnum) - 1
+            if i < 0 or docnum > self._lastdocs[i]:
+                return None
+            return i
+
+        def _read_block(self, blocknum):
+            # Returns a (firstdoc, docs, ends, start, data) tuple for the given
+            # block, where docs is an array of the document numbers (relative
+            # to firstdoc) in the block, or None if the block has a value for
+            # every document in its range, and the value of the nth document
+            # in the block is between the (n-1)th and nth ends after start
+            positions = self._positions
+            pos = positions[blocknum]
             data = self._decompress(self._dbfile.get(self._basepos + pos,
-                                                     blocklen))
-            values = {}
-            base = 0
-            for docnum, vlen in lengths:
-                values[docnum] = data[base:base + vlen]
-                base += vlen
-            return values
+                                                     positions[blocknum + 1]
+                                                     - pos))
+
+            count, typecodes = _cb_header.unpack(data[:_cb_header.size])
+            doccode, endcode = typecodes.decode("ascii")
+            pos = _cb_header.size
+            docs = None
+            if doccode != "-":
+                docs = array(doccode)
+                size = count * docs.itemsize
+                array_frombytes(docs, data[pos:pos + size])
+                if IS_LITTLE:
+                    docs.byteswap()
+                pos += size
+            ends = array(endcode)
+            size = count * ends.itemsize
+            array_frombytes(ends, data[pos:pos + size])
+            if IS_LITTLE:
+                ends.byteswap()
+            pos += size
+            return self._firstdocs[blocknum], docs, ends, pos, data
+
+        def _value(self, block, docnum):
+            firstdoc, docs, ends, start, data = block
+            i = docnum - firstdoc
+            if docs is not None:
+                rel = i
+                i = bisect_left(docs, rel)
+                if i == len(docs) or docs[i] != rel:
+                    return emptybytes
+            if i:
+                return data[start + ends[i - 1]:start + ends[i]]
+            return data[start:start + ends[0]]
 
         def __getitem__(self, docnum):
             i = self._find_block(docnum)
             if i is None:
                 return emptybytes
-            return self._get_block(i)[docnum]
+            return self._value(self._cache.get(i), docnum)
+
+        def get_many(self, docnums):
+            # Go through the document numbers in order so each block only has
+            # to be found and decoded once
+            docnums = list(docnums)
+            results = [emptybytes] * len(docnums)
+            order = sorted(xrange(len(docnums)), key=docnums.__getitem__)
+            blocknum = None
+            block = None
+            for i in order:
+                docnum = docnums[i]
+                if block is None or docnum > self._lastdocs[blocknum]:
+                    blocknum = self._find_block(docnum)
+                    if blocknum is None:
+                        block = None
+                        continue
+                    block = self._cache.get(blocknum)
+                results[i] = self._value(block, docnum)
+            return results
 
         def __iter__(self):
-            last = -1
-            for i, block in enumerate(self._blocks):
-                startdoc = block[0]
-                enddoc = block[1]
-                if startdoc > (last + 1):
-                    for _ in xrange(startdoc - last):
-                        yield emptybytes
-                values = self._get_block(i)
-                for docnum in xrange(startdoc, enddoc + 1):
-                    if docnum in values:
-                        yield values[docnum]
-                    else:
-                        yield emptybytes
-                last = enddoc
-            if enddoc < self._doccount - 1:
-                for _ in xrange(self._doccount - enddoc):
+            # Read the blocks in order without disturbing the cache
+            docnum = 0
+            for blocknum in xrange(len(self._firstdocs)):
+                block = self._read_block(blocknum)
+                for _ in xrange(self._firstdocs[blocknum] - docnum):
                     yield emptybytes
+                for docnum in xrange(self._firstdocs[blocknum],
+                                     self._lastdocs[blocknum] + 1):
+                    yield self._value(block, docnum)
+                docnum = self._lastdocs[blocknum] + 1
+            for _ in xrange(self._doccount - docnum):
+                yield emptybytes
+
+
+# Stored fields
+
+# Type codes for the binary encoding of stored field values
+_SF_TEXT = ord("u")
+_SF_BYTES = ord("b")
+_SF_INT = ord("i")
+_SF_FLOAT = ord("f")
+_SF_TRUE = ord("T")
+_SF_FALSE = ord("F")
+_SF_NONE = ord("N")
+_SF_LIST = ord("l")
+_SF_TUPLE = ord("t")
+_SF_PICKLE = ord("p")
+# A large value compressed on its own outside the blocks
+_SF_EXTERNAL = ord("x")
+
+_sf_float = struct.Struct("!d")
+# Number of documents in a block
+_sf_count = struct.Struct("!I")
+# Directory position (64-bit, so columns can be larger than 4 GB), compressed
+# dictionary length, encoded field names length, number of blocks, magic number
+_sf_footer = struct.Struct("!QIII4s")
+
+# zlib can only use the last 32 KB of a preset dictionary
+_sf_maxdict = 32 * 1024
+
+# Python 2 and early versions of Python 3 don't support preset dictionaries
+try:
+    zlib.compressobj(3, zlib.DEFLATED, 15, 9, zlib.Z_DEFAULT_STRATEGY,
+                     b("x"))
+    _zdict_supported = True
+except (AttributeError, TypeError):
+    _zdict_supported = False
+
+
+def _read_varint(ints, pos):
+    # Reads a varint from a sequence of byte values, returning the number and
+    # the position after it
+    n = ints[pos]
+    pos += 1
+    if n < 128:
+        return n, pos
+    n &= 0x7F
+    shift = 7
+    while True:
+        byte = ints[pos]
+        pos += 1
+        n |= (byte & 0x7F) << shift
+        if byte < 128:
+            return n, pos
+        shift += 7
+
+
+def _encode_stored(value):
+    # Returns a bytestring containing a type code byte followed by the encoded
+    # value. Types without a binary encoding are pickled
+    t = type(value)
+    if t is text_type:
+        return byte(_SF_TEXT) + value.encode("utf8")
+    elif t is bytes_type:
+        return byte(_SF_BYTES) + value
+    elif t is bool:
+        return byte(_SF_TRUE if value else _SF_FALSE)
+    elif t in integer_types:
+        return byte(_SF_INT) + signed_varint(value)
+    elif t is float:
+        return byte(_SF_FLOAT) + _sf_float.pack(value)
+    elif value is None:
+        return byte(_SF_NONE)
+    elif t is list or t is tuple:
+        parts = [byte(_SF_LIST if t is list else _SF_TUPLE), varint(len(value))]
+        for item in value:
+            encoded = _encode_stored(item)
+            parts.append(varint(len(encoded)))
+            parts.append(encoded)
+        return emptybytes.join(parts)
+    else:
+        return byte(_SF_PICKLE) + dumps(value, 2)
+
+
+def _decode_stored(data, ints, pos, end):
+    # Decodes the value encoded by _encode_stored() in data[pos:end]. The ints
+    # argument is the same data as a sequence of integers
+    code = ints[pos]
+    pos += 1
+    if code == _SF_TEXT:
+        return data[pos:end].decode("utf8")
+    elif code == _SF_BYTES:
+        return data[pos:end]
+    elif code == _SF_INT:
+        return decode_signed_varint(_read_varint(ints, pos)[0])
+    elif code == _SF_FLOAT:
+        return _sf_float.unpack(data[pos:end])[0]
+    elif code == _SF_TRUE:
+        return True
+    elif code == _SF_FALSE:
+        return False
+    elif code == _SF_NONE:
+        return None
+    elif code == _SF_LIST or code == _SF_TUPLE:
+        count, pos = _read_varint(ints, pos)
+        items = []
+        for _ in xrange(count):
+            length, pos = _read_varint(ints, pos)
+            items.append(_decode_stored(data, ints, pos, pos + length))
+            pos += length
+        return items if code == _SF_LIST else tuple(items)
+    elif code == _SF_PICKLE:
+        return loads(data[pos:end])
+    raise Exception("Unknown stored value type %r" % code)
+
+
+class StoredFieldsColumn(Column):
+    """Stores the dictionary of stored field values for each document.
+
+    Instead of pickling and compressing each document's dictionary on its own,
+    this column encodes the values in a compact binary format (falling back
+    to pickling values of types it doesn't know) and compresses blocks of
+    adjacent documents together. When a column has more than one block, the
+    first block is used as a preset compression dictionary for all the blocks,
+    so even small blocks compress well. The reader keeps a small cache of the
+    most recently used decompressed blocks.
+
+    Large values are compressed separately and kept outside the blocks, so
+    reading the other fields of a document (see the ``fieldnames`` argument
+    of :meth:`StoredFieldsColumn.Reader.fields`) doesn't need to read or
+    decompress them.
+    """
+
+    magic = b("SFB1")
+
+    def __init__(self, level=3, blocksize=4, dictionary=True, cachesize=8,
+                 maxinline=2):
+        """
+        :param level: the compression level to use.
+        :param blocksize: the (uncompressed) size in KB of each block. Larger
+            blocks compress better, but reading a document means
+            decompressing the whole block it's in.
+        :param dictionary: whether to use the first block as a preset
+            dictionary when compressing the blocks. This is ignored on
+            versions of Python where the ``zlib`` module doesn't support preset
+            dictionaries.
+        :param cachesize: the number of decompressed blocks the reader keeps
+            in memory.
+        :param maxinline: values whose encoded size is larger than this many
+            KB are compressed on their own and stored outside the blocks.
+            Use ``None`` to keep all values in the blocks.
+        """
+
+        self._level = level
+        self._blocksize = blocksize
+        self._dictionary = dictionary
+        self._cachesize = cachesize
+        self._maxinline = maxinline
+
+    @classmethod
+    def is_column(cls, dbfile, basepos, length):
+        """Returns True if the column data at the given position was written
+        by this column type.
+        """
+
+        if length < _sf_footer.size:
+            return False
+        return dbfile.get(basepos + length - 4, 4) == cls.magic
+
+    def writer(self, dbfile):
+        return self.Writer(dbfile, self._level, self._blocksize,
+                           self._dictionary, self._maxinline)
+
+    def reader(self, dbfile, basepos, length, doccount):
+        return self.Reader(dbfile, basepos, length, doccount, self._cachesize)
+
+    def default_value(self, reverse=False):
+        return {}
+
+    class Writer(ColumnWriter):
+        def __init__(self, dbfile, level, blocksize, dictionary, maxinline):
+            self._dbfile = dbfile
+            self._level = level
+            self._blocksize = blocksize * 1024
+            self._usedict = dictionary and _zdict_supported
+            self._maxinline = None
+            if maxinline is not None:
+                self._maxinline = maxinline * 1024
+            self._count = 0
+            self._written = 0
+            self._fieldnums = {}
+
+            self._records = []
+            self._size = 0
+            # The first block is kept uncompressed until we know whether there
+            # will be other blocks to share it as a dictionary with
+            self._firstblock = None
+            self._zdict = None
+
+            self._firstdocs = array("I")
+            # Block offsets can be past 4 GB, so they're stored as 64-bit
+            self._starts = make_array("Q")
+            self._ends = make_array("Q")
+
+        def __repr__(self):
+            return "<StoredFields.Writer>"
+
+        def _external(self, encoded):
+            # Writes a large encoded value to the file right away and returns
+            # an encoded reference to it to put in the record instead
+            data = zlib.compress(encoded, self._level)
+            ref = emptybytes.join([byte(_SF_EXTERNAL), varint(self._written),
+                                   varint(len(data))])
+            self._dbfile.write(data)
+            self._written += len(data)
+            return ref
+
+        def fill(self, docnum):
+            # Documents without stored fields get an empty record
+            if docnum > self._count:
+                gap = docnum - self._count
+                self._records.extend([varint(0)] * gap)
+                self._size += gap
+                self._count = docnum
+
+        def add(self, docnum, value):
+            self.fill(docnum)
+            fieldnums = self._fieldnums
+            maxinline = self._maxinline
+            parts = [varint(len(value))]
+            for fieldname, v in iteritems(value):
+                if fieldname not in fieldnums:
+                    fieldnums[fieldname] = len(fieldnums)
+                encoded = _encode_stored(v)
+                if maxinline is not None and len(encoded) > maxinline:
+                    encoded = self._external(encoded)
+                parts.append(varint(fieldnums[fieldname]))
+                parts.append(varint(len(encoded)))
+                parts.append(encoded)
+            record = emptybytes.join(parts)
+
+            self._records.append(record)
+            self._size += len(record)
+            self._count = docnum + 1
+            if self._size >= self._blocksize:
+                self._end_block()
+
+        def _end_block(self):
+            records = self._records
+            if not records:
+                return
+
+            # The block starts with the number of records and the offsets of
+            # the ends of the records
+            ends = []
+            end = 0
+            for record in records:
+                end += len(record)
+                ends.append(end)
+            typecode = _mintype(end)
+            ends = array(typecode, ends)
+            if IS_LITTLE:
+                ends.byteswap()
+            block = emptybytes.join([_sf_count.pack(len(records)),
+                                     typecode.encode("ascii"),
+                                     array_tobytes(ends)] + records)
+            firstdoc = self._count - len(records)
+            self._records = []
+            self._size = 0
+
+            if self._usedict and self._zdict is None:
+                if self._firstblock is None:
+                    self._firstblock = (firstdoc, block)
+                    return
+                self._zdict = self._firstblock[1][-_sf_maxdict:]
+                self._write_block(*self._firstblock)
+                self._firstblock = None
+            self._write_block(firstdoc, block)
+
+        def _write_block(self, firstdoc, block):
+            if self._zdict:
+                compressor = zlib.compressobj(self._level, zlib.DEFLATED, 15,
+                                              9, zlib.Z_DEFAULT_STRATEGY,
+                                              self._zdict)
+                data = compressor.compress(block) + compressor.flush()
+            else:
+                data = zlib.compress(block, self._level)
+
+            self._firstdocs.append(firstdoc)
+            self._starts.append(self._written)
+            self._dbfile.write(data)
+            self._written += len(data)
+            self._ends.append(self._written)
+
+        def finish(self, doccount):
+            dbfile = self._dbfile
+            self._end_block()
+            if self._firstblock is not None:
+                # There was only one block, so write it without a dictionary
+                self._write_block(*self._firstblock)
+                self._firstblock = None
+
+            dirpos = self._written
+            zdict = emptybytes
+            if self._zdict:
+                zdict = zlib.compress(self._zdict, self._level)
+            fieldnums = self._fieldnums
+            names = [None] * len(fieldnums)
+            for fieldname, num in iteritems(fieldnums):
+                names[num] = fieldname
+            names = _encode_stored(names)
+
+            dbfile.write(zdict)
+            dbfile.write(names)
+            dbfile.write_array(self._firstdocs)
+            write_qsafe_array("Q", self._starts, dbfile)
+            write_qsafe_array("Q", self._ends, dbfile)
+            dbfile.write(_sf_footer.pack(dirpos, len(zdict), len(names),
+                                         len(self._firstdocs),
+                                         StoredFieldsColumn.magic))
+
+    class Reader(ColumnReader):
+        def __init__(self, dbfile, basepos, length, doccount, cachesize=8):
+            ColumnReader.__init__(self, dbfile, basepos, length, doccount)
+            footer = dbfile.get(basepos + length - _sf_footer.size,
+                                _sf_footer.size)
+            dirpos, dictlen, nameslen, blockcount, magic = \
+                _sf_footer.unpack(footer)
+            if magic != StoredFieldsColumn.magic:
+                raise Exception("Not a stored fields column: %r" % magic)
+
+            pos = basepos + dirpos
+            self._zdict = None
+            if dictlen:
+                self._zdict = zlib.decompress(dbfile.get(pos, dictlen))
+            pos += dictlen
+            names = dbfile.get(pos, nameslen)
+            self._names = _decode_stored(names, bytearray(names), 0, nameslen)
+            self._fieldnums = dict((name, i) for i, name
+                                   in enumerate(self._names))
+            pos += nameslen
+            self._firstdocs = dbfile.get_array(pos, "I", blockcount)
+            pos += blockcount * self._firstdocs.itemsize
+            dbfile.seek(pos)
+            self._starts = read_qsafe_array("Q", blockcount, dbfile)
+            self._ends = read_qsafe_array("Q", blockcount, dbfile)
+
+            self._cache = _BlockCache(self._read_block, cachesize)
+
+        def __repr__(self):
+            return "<StoredFields.Reader>"
+
+        def _read_block(self, blocknum):
+            # Returns a (firstdoc, start, ends, data, ints) tuple for the given
+            # block, where start is the position in data of the first record
+            # and ends are the offsets from there of the ends of the records
+            start = self._starts[blocknum]
+            compressed = self._dbfile.get(self._basepos + start,
+                                          self._ends[blocknum] - start)
+            if self._zdict:
+                decompressor = zlib.decompressobj(15, self._zdict)
+                data = decompressor.decompress(compressed)
+                data += decompressor.flush()
+            else:
+                data = zlib.decompress(compressed)
+
+            count = _sf_count.unpack(data[:_sf_count.size])[0]
+            pos = _sf_count.size
+            typecode = data[pos:pos + 1].decode("ascii")
+            pos += 1
+            ends = array(typecode)
+            array_frombytes(ends, data[pos:pos + count * ends.itemsize])
+            if IS_LITTLE:
+                ends.byteswap()
+            pos += count * ends.itemsize
+
+            ints = data if PY3 else bytearray(data)
+            return self._firstdocs[blocknum], pos, ends, data, ints
+
+        def _block_for(self, docnum):
+            return bisect_right(self._firstdocs, docnum) - 1
+
+        def _fieldnum_set(self, fieldnames):
+            if fieldnames is None:
+                return None
+            fieldnums = self._fieldnums
+            return frozenset(fieldnums[name] for name in fieldnames
+                             if name in fieldnums)
+
+        def _external(self, ints, pos):
+            # Reads and decodes a value stored outside the blocks
+            offset, pos = _read_varint(ints, pos + 1)
+            length, pos = _read_varint(ints, pos)
+            data = zlib.decompress(self._dbfile.get(self._basepos + offset,
+                                                    length))
+            return _decode_stored(data, data if PY3 else bytearray(data), 0,
+                                  len(data))
+
+        def _record(self, block, docnum, fieldnums=None):
+            # If fieldnums is not None, it's a set of the numbers of the fields
+            # to decode, and the values of any other fields are skipped
+            firstdoc, pos, ends, data, ints = block
+            i = docnum - firstdoc
+            if i >= len(ends):
+                return {}
+            if i:
+                pos += ends[i - 1]
+
+            names = self._names
+            count, pos = _read_varint(ints, pos)
+            d = {}
+            for _ in xrange(count):
+                fieldnum, pos = _read_varint(ints, pos)
+                length, pos = _read_varint(ints, pos)
+                end = pos + length
+                if fieldnums is None or fieldnum in fieldnums:
+                    if ints[pos] == _SF_EXTERNAL:
+                        v = self._external(ints, pos)
+                    else:
+                        v = _decode_stored(data, ints, pos, end)
+                    d[names[fieldnum]] = v
+                pos = end
+            return d
+
+        def __getitem__(self, docnum):
+            return self.fields(docnum)
+
+        def fields(self, docnum, fieldnames=None):
+            """Returns the dictionary of stored fields for the given document.
+
+            :param fieldnames: if not None, a list of the names of the fields
+                to return. The values of other fields are skipped without
+                being decoded.
+            """
+
+            if not 0 <= docnum < self._doccount:
+                raise IndexError("Asked for document %r of %d"
+                                 % (docnum, self._doccount))
+            blocknum = self._block_for(docnum)
+            if blocknum < 0:
+                return {}
+            return self._record(self._cache.get(blocknum), docnum,
+                                self._fieldnum_set(fieldnames))
+
+        def get_many(self, docnums, fieldnames=None):
+            # Go through the document numbers in order so each block only
+            # has to be found and decoded once
+            docnums = list(docnums)
+            fieldnums = self._fieldnum_set(fieldnames)
+            results = [None] * len(docnums)
+            order = sorted(xrange(len(docnums)), key=docnums.__getitem__)
+            blocknum = -1
+            block = None
+            nextfirst = 0
+            for i in order:
+                docnum = docnums[i]
+                if docnum >= self._doccount:
+                    # Let fields() raise the same IndexError as a single
+                    # lookup
+                    self.fields(docnum, fieldnames)
+                if block is None or docnum >= nextfirst:
+                    blocknum = self._block_for(docnum)
+                    if blocknum < 0:
+                        results[i] = self.fields(docnum, fieldnames)
+                        continue
+                    block = self._cache.get(blocknum)
+                    if blocknum + 1 < len(self._firstdocs):
+                        nextfirst = self._firstdocs[blocknum + 1]
+                    else:
+                        nextfirst = self._doccount
+                results[i] = self._record(block, docnum, fieldnums)
+            return results
+
+        def __iter__(self):
+            # Read the blocks in order without disturbing the cache
+            docnum = 0
+            for blocknum in xrange(len(self._firstdocs)):
+                block = self._read_block(blocknum)
+                for _ in xrange(len(block[2])):
+                    yield self._record(block, docnum)
+                    docnum += 1
+            for _ in xrange(self._doccount - docnum):
+                yield {}
 
 
 class StructColumn(FixedBytesColumn):
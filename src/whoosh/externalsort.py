@@ -157,6 +157,13 @@ class SortingPool(object):
             self.save()
         self.current.append(item)
 
+    def add_many(self, items):
+        """Adds all the items in the iterable `items` to the pool.
+        """
+
+        for item in items:
+            self.add(item)
+
     def _write_run(self, f, items):
         for item in items:
             dump(item, f, 2)
@@ -29,8 +29,13 @@ from __future__ import with_statement
 import errno, os, sys, tempfile
 from threading import Lock
 
+try:
+    import mmap
+except ImportError:
+    mmap = None
+
 from whoosh.compat import BytesIO, memoryview_
-from whoosh.filedb.structfile import BufferFile, StructFile
+from whoosh.filedb.structfile import BufferFile, MmapFile, StructFile
 from whoosh.index import _DEF_INDEX_NAME, EmptyIndexError
 from whoosh.util import random_name
 from whoosh.util.filelock import FileLock
@@ -207,6 +212,10 @@ class Storage(object):
         """Opens a file with the given name in this storage.
 
         :param name: the name for the new file.
+        :param mapped: (keyword argument) a hint that the file will be used
+            for random access reads and should be memory-mapped if the storage
+            supports it. Storage implementations that can't map files ignore
+            this argument.
         :return: a :class:`whoosh.filedb.structfile.StructFile` instance.
         """
 
@@ -492,18 +501,52 @@ class FileStorage(Storage):
         f = StructFile(fileobj, name=name, **kwargs)
         return f
 
-    def open_file(self, name, **kwargs):
+    def open_file(self, name, mapped=False, **kwargs):
         """Opens an existing file in this storage.
 
         :param name: the name of the file to open.
+        :param mapped: if True, and this storage object supports ``mmap``, try
+            to open the file as a read-only memory map. Random access reads
+            (``get()``, ``get_array()``, etc.) on the returned object are then
+            slices of the map instead of ``seek`` + ``read`` calls. If the file
+            can't be mapped (for example, it is empty), this falls back to a
+            normal file.
         :param kwargs: additional keyword arguments are passed through to the
             :class:`~whoosh.filedb.structfile.StructFile` initializer.
         :return: a :class:`whoosh.filedb.structfile.StructFile` instance.
         """
 
-        f = StructFile(open(self._fpath(name), "rb"), name=name, **kwargs)
+        fileobj = open(self._fpath(name), "rb")
+        if mapped and self.supports_mmap and mmap:
+            mm = self._map(fileobj)
+            if mm is not None:
+                # The map keeps its own handle on the file, so we can close
+                # the one we opened
+                fileobj.close()
+                return MmapFile(mm, name=name, **kwargs)
+
+        f = StructFile(fileobj, name=name, **kwargs)
         return f
 
+    @staticmethod
+    def _map(fileobj):
+        # Returns a read-only mmap of the given file, or None if the file
+        # can't be mapped
+        fileobj.seek(0, os.SEEK_END)
+        filesize = fileobj.tell()
+        fileobj.seek(0)
+        # Empty files can't be mapped, and a file too big to fit in the address
+        # space of a 32-bit Python would fail
+        if not filesize or filesize >= sys.maxsize:
+            return None
+
+        try:
+            return mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+        except (mmap.error, OSError, ValueError):
+            # Fall through to the (slower) regular file implementation if the
+            # platform or filesystem refuses to map the file
+            return None
+
     def _fpath(self, fname):
         return os.path.abspath(os.path.join(self.folder, fname))
 
@@ -620,7 +663,8 @@ class RamStorage(Storage):
         f = StructFile(BytesIO(), name=name, onclose=onclose_fn)
         return f
 
-    def open_file(self, name, **kwargs):
+    def open_file(self, name, mapped=False, **kwargs):
+        # Files in RAM are always opened as buffers, so "mapped" is ignored
         if name not in self.files:
             raise NameError(name)
         buf = memoryview_(self.files[name])
@@ -31,14 +31,15 @@ D. J. Bernstein's CDB format (http://cr.yp.to/cdb.html).
 """
 
 import os, struct
+from array import array
 from binascii import crc32
-from bisect import bisect_left
+from bisect import bisect_left, bisect_right
 from hashlib import md5  # @UnresolvedImport
 
 from whoosh.compat import b, bytes_type
-from whoosh.compat import xrange
+from whoosh.compat import array_frombytes, array_tobytes, izip, xrange
 from whoosh.util.numlists import GrowableArray
-from whoosh.system import _INT_SIZE, emptybytes
+from whoosh.system import IS_LITTLE, _INT_SIZE, _LONG_SIZE, emptybytes
 
 
 # Exceptions
@@ -732,4 +733,424 @@ class FieldedOrderedHashReader(HashReader):
             yield (dbfile.get(keypos, keylen), dbfile.get(datapos, datalen))
 
 
+# Prefix-compressed block file
+
+# The number of keys in a block
+_block_count = struct.Struct("!I")
+# Maps the typecode bytes written by _write_numbers to array typecodes
+_typecodes = dict((b(typecode), typecode) for typecode in "BHI")
+
+
+def _write_numbers(dbfile, numbers):
+    # Writes a list of non-negative integers as a typecode byte followed by a
+    # big-endian array of the smallest type that can hold them
+    top = max(numbers) if numbers else 0
+    if top < 256:
+        typecode = "B"
+    elif top < 65536:
+        typecode = "H"
+    else:
+        typecode = "I"
+    arr = array(typecode, numbers)
+    if IS_LITTLE and typecode != "B":
+        arr.byteswap()
+    dbfile.write(b(typecode))
+    dbfile.write(array_tobytes(arr))
+
+
+def _read_numbers(data, pos, count):
+    # Reads an array written by _write_numbers from the bytes at the given
+    # position, and returns the array and the position after it
+    arr = array(_typecodes[data[pos:pos + 1]])
+    pos += 1
+    end = pos + arr.itemsize * count
+    array_frombytes(arr, data[pos:end])
+    if IS_LITTLE and arr.itemsize > 1:
+        arr.byteswap()
+    return arr, end
+
+
+def _common_prefix(a, b):
+    # Returns the length of the common prefix of two byte strings
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def _read_block_header(data):
+    # Returns the number of keys in a block, the arrays of prefix lengths,
+    # suffix lengths, and value lengths, and the position of the suffixes
+    count = _block_count.unpack(data[:_block_count.size])[0]
+    numbers, pos = _read_numbers(data, _block_count.size, count * 3)
+    return (count, numbers[:count], numbers[count:count * 2],
+            numbers[count * 2:], pos)
+
+
+class PrefixBlockWriter(object):
+    """Implements an ordered on-disk key-value store where the keys are
+    prefix-compressed in blocks. Each key only stores the part that differs
+    from the previous key, and the first key of each block goes in a small
+    sparse index that a :class:`PrefixBlockReader` keeps in memory, so
+    looking up a key only has to read the one block that could contain it.
+
+    Keys must be added in increasing order.
+    """
+
+    magic = b("PBK1")
+
+    def __init__(self, dbfile, blocksize=32):
+        """
+        :param dbfile: a :class:`~whoosh.filedb.structfile.StructFile` object
+            to write to.
+        :param blocksize: the number of keys in each block.
+        """
+
+        self.dbfile = dbfile
+        self.blocksize = blocksize
+        # A place for the caller to put extra metadata
+        self.extras = {}
+
+        # Write format tag
+        dbfile.write(self.magic)
+        # Unused future expansion bits
+        dbfile.write_int(0)
+
+        self.lastkey = None
+        # The keys and values of the current block
+        self._keys = []
+        self._values = []
+        # The first key and the start position of each block
+        self._firstkeys = []
+        self._positions = []
+
+    def add(self, key, value):
+        assert isinstance(key, bytes_type)
+        assert isinstance(value, bytes_type)
+        if self.lastkey is not None and key <= self.lastkey:
+            raise ValueError("Keys must increase: %r..%r"
+                             % (self.lastkey, key))
+
+        self._keys.append(key)
+        self._values.append(value)
+        self.lastkey = key
+        if len(self._keys) >= self.blocksize:
+            self._write_block()
+
+    def add_all(self, items):
+        add = self.add
+        for key, value in items:
+            add(key, value)
+
+    def _write_block(self):
+        # Block layout:
+        #   I   | Number of keys
+        #   The prefix lengths, suffix lengths, and value lengths, as a single
+        #     array (see _write_numbers)
+        #   The concatenated key suffixes
+        #   The concatenated values
+
+        dbfile = self.dbfile
+        keys = self._keys
+        values = self._values
+        self._firstkeys.append(keys[0])
+        self._positions.append(dbfile.tell())
+
+        prefixes = []
+        suffixes = []
+        lastkey = emptybytes
+        for key in keys:
+            plen = _common_prefix(lastkey, key)
+            prefixes.append(plen)
+            suffixes.append(key[plen:])
+            lastkey = key
+
+        dbfile.write(_block_count.pack(len(keys)))
+        _write_numbers(dbfile, prefixes + [len(suffix) for suffix in suffixes]
+                       + [len(value) for value in values])
+        dbfile.write(emptybytes.join(suffixes))
+        dbfile.write(emptybytes.join(values))
+
+        self._keys = []
+        self._values = []
+
+    def close(self):
+        dbfile = self.dbfile
+        if self._keys:
+            self._write_block()
+        firstkeys = self._firstkeys
+        positions = self._positions
+        # Add the end of the last block so the reader knows where every block
+        # ends
+        positions.append(dbfile.tell())
+
+        # Write extra information
+        expos = dbfile.tell()
+        dbfile.write_pickle(self.extras)
+
+        # Write the sparse index: the number of blocks, the lengths of the
+        # first keys, the first keys, and the start positions of the blocks
+        ixpos = dbfile.tell()
+        dbfile.write(_block_count.pack(len(firstkeys)))
+        _write_numbers(dbfile, [len(key) for key in firstkeys])
+        dbfile.write(emptybytes.join(firstkeys))
+        posarray = array("q", positions)
+        if IS_LITTLE:
+            posarray.byteswap()
+        dbfile.write(array_tobytes(posarray))
+
+        dbfile.write_long(expos)
+        dbfile.write_long(ixpos)
+        endpos = dbfile.tell()
+        dbfile.close()
+        return endpos
+
+
+class PrefixBlockReader(object):
+    """Reader for the prefix-compressed block files created by
+    :class:`PrefixBlockWriter`. The reader loads the sparse index of the
+    first key in each block into memory, so finding a key takes a binary
+    search in memory and a single read of the block containing the key.
+    """
+
+    def __init__(self, dbfile, length=None):
+        """
+        :param dbfile: a :class:`~whoosh.filedb.structfile.StructFile` object
+            to read from.
+        :param length: the length of the file data.
+        """
+
+        self.dbfile = dbfile
+        self.is_closed = False
+
+        if length is None:
+            dbfile.seek(0, os.SEEK_END)
+            length = dbfile.tell()
+
+        filemagic = dbfile.get(0, 4)
+        if filemagic != PrefixBlockWriter.magic:
+            raise FileFormatError("Unknown file header %r" % filemagic)
 
+        expos = dbfile.get_long(length - _LONG_SIZE * 2)
+        ixpos = dbfile.get_long(length - _LONG_SIZE)
+        dbfile.seek(expos)
+        self.extras = dbfile.read_pickle()
+
+        # Read the sparse index
+        data = dbfile.get(ixpos, length - _LONG_SIZE * 2 - ixpos)
+        count = _block_count.unpack(data[:_block_count.size])[0]
+        keylens, pos = _read_numbers(data, _block_count.size, count)
+        firstkeys = []
+        for keylen in keylens:
+            firstkeys.append(data[pos:pos + keylen])
+            pos += keylen
+        self._firstkeys = firstkeys
+        positions = array("q")
+        array_frombytes(positions, data[pos:pos + (count + 1) * 8])
+        if IS_LITTLE:
+            positions.byteswap()
+        self._positions = positions
+
+        # The most recently decoded block, as (blocknum, keys, datapositions,
+        # datalengths)
+        self._lastblock = None
+
+    @classmethod
+    def open(cls, storage, name):
+        length = storage.file_length(name)
+        dbfile = storage.open_file(name)
+        return cls(dbfile, length)
+
+    def file(self):
+        return self.dbfile
+
+    def close(self):
+        if self.is_closed:
+            raise Exception("Tried to close %r twice" % self)
+        self.dbfile.close()
+        self.is_closed = True
+
+    def block_count(self):
+        """Returns the number of blocks in the file.
+        """
+
+        return len(self._firstkeys)
+
+    def block_for_key(self, key):
+        """Returns the number of the block that would contain the given key.
+        """
+
+        if not isinstance(key, bytes_type):
+            raise TypeError("Key %r should be bytes" % key)
+        return max(0, bisect_right(self._firstkeys, key) - 1)
+
+    def first_key(self, blocknum):
+        """Returns the first key in the given block.
+        """
+
+        return self._firstkeys[blocknum]
+
+    def read_block(self, blocknum):
+        """Returns a ``(keys, datapositions, datalengths)`` tuple for the
+        given block, where ``keys`` is a list of the keys in the block and the
+        other two are lists of the positions and lengths of the corresponding
+        values in the file.
+        """
+
+        last = self._lastblock
+        if last is not None and last[0] == blocknum:
+            return last[1:]
+
+        start = self._positions[blocknum]
+        data = self.dbfile.get(start, self._positions[blocknum + 1] - start)
+        count, prefixes, suffixes, datalens, pos = _read_block_header(data)
+
+        keys = []
+        key = emptybytes
+        for plen, slen in izip(prefixes, suffixes):
+            key = key[:plen] + data[pos:pos + slen]
+            keys.append(key)
+            pos += slen
+
+        datapos = []
+        pos += start
+        for datalen in datalens:
+            datapos.append(pos)
+            pos += datalen
+
+        self._lastblock = (blocknum, keys, datapos, datalens)
+        return keys, datapos, datalens
+
+    def ranges_from(self, key):
+        """Yields a series of ``(key, datapos, datalen)`` tuples for the
+        ordered series of keys equal to or greater than the given key.
+        """
+
+        blockcount = self.block_count()
+        if not blockcount:
+            return
+
+        blocknum = self.block_for_key(key)
+        keys, datapos, datalens = self.read_block(blocknum)
+        i = bisect_left(keys, key)
+        while True:
+            for j in xrange(i, len(keys)):
+                yield (keys[j], datapos[j], datalens[j])
+            blocknum += 1
+            if blocknum >= blockcount:
+                return
+            keys, datapos, datalens = self.read_block(blocknum)
+            i = 0
+
+    def _ranges(self):
+        for blocknum in xrange(self.block_count()):
+            keys, datapos, datalens = self.read_block(blocknum)
+            for item in izip(keys, datapos, datalens):
+                yield item
+
+    def range_for_key(self, key):
+        """Returns a ``(datapos, datalen)`` tuple for the given key, or raises
+        ``KeyError`` if the key is not in the file.
+        """
+
+        if not self.block_count():
+            raise KeyError(key)
+        blocknum = self.block_for_key(key)
+        last = self._lastblock
+        if last is not None and last[0] == blocknum:
+            _, keys, datapos, datalens = last
+            i = bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                return datapos[i], datalens[i]
+            raise KeyError(key)
+
+        # Scan the block without rebuilding the keys, keeping track of how
+        # many bytes at the start of the key the current key matches (m). A
+        # key that shares more than m bytes with the previous key is still
+        # less than the key we're looking for, and a key that shares fewer
+        # bytes is greater, so we only need to look at the suffixes of keys
+        # that share exactly m bytes
+        start = self._positions[blocknum]
+        data = self.dbfile.get(start, self._positions[blocknum + 1] - start)
+        count, prefixes, suffixes, datalens, pos = _read_block_header(data)
+        valstart = start + pos + sum(suffixes)
+
+        m = 0
+        for i in xrange(count):
+            plen = prefixes[i]
+            slen = suffixes[i]
+            if plen == m:
+                suffix = data[pos:pos + slen]
+                rest = key[m:]
+                if suffix == rest:
+                    return valstart + sum(datalens[:i]), datalens[i]
+                elif suffix > rest:
+                    break
+                elif suffix[:1] == rest[:1]:
+                    m += _common_prefix(suffix, rest)
+            elif plen < m:
+                break
+            pos += slen
+        raise KeyError(key)
+
+    def __getitem__(self, key):
+        datapos, datalen = self.range_for_key(key)
+        return self.dbfile.get(datapos, datalen)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        try:
+            self.range_for_key(key)
+            return True
+        except KeyError:
+            return False
+
+    def __iter__(self):
+        return self.items()
+
+    def keys(self):
+        for key, _, _ in self._ranges():
+            yield key
+
+    def values(self):
+        get = self.dbfile.get
+        for _, datapos, datalen in self._ranges():
+            yield get(datapos, datalen)
+
+    def items(self):
+        get = self.dbfile.get
+        for key, datapos, datalen in self._ranges():
+            yield (key, get(datapos, datalen))
+
+    def closest_key(self, key):
+        """Returns the closest key equal to or greater than the given key. If
+        there is no key in the file equal to or greater than the given key,
+        returns None.
+        """
+
+        for k, _, _ in self.ranges_from(key):
+            return k
+        return None
+
+    def keys_from(self, key):
+        """Yields an ordered series of keys equal to or greater than the given
+        key.
+        """
+
+        for k, _, _ in self.ranges_from(key):
+            yield k
+
+    def items_from(self, key):
+        """Yields an ordered series of ``(key, value)`` tuples for keys equal
+        to or greater than the given key.
+        """
+
+        get = self.dbfile.get
+        for k, datapos, datalen in self.ranges_from(key):
+            yield (k, get(datapos, datalen))
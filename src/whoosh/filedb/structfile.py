@@ -29,12 +29,12 @@ from array import array
 from copy import copy
 from struct import calcsize
 
-from whoosh.compat import BytesIO, bytes_type
+from whoosh.compat import PY3, BytesIO, bytes_type, memoryview_
 from whoosh.compat import dump as dump_pickle
 from whoosh.compat import load as load_pickle
 from whoosh.compat import array_frombytes, array_tobytes
 from whoosh.system import _INT_SIZE, _SHORT_SIZE, _FLOAT_SIZE, _LONG_SIZE
-from whoosh.system import IS_LITTLE
+from whoosh.system import IS_LITTLE, emptybytes
 from whoosh.system import pack_byte, unpack_byte, pack_sbyte, unpack_sbyte
 from whoosh.system import pack_ushort, unpack_ushort
 from whoosh.system import pack_ushort_le, unpack_ushort_le
@@ -349,6 +349,14 @@ class StructFile(object):
         self.seek(position)
         return self.read_array(typecode, length)
 
+    def get_view(self, position, length):
+        """Returns a read-only sequence of the unsigned byte values in the
+        given range of the file. Files backed by a buffer or a memory map
+        return a view of the buffer instead of copying the bytes.
+        """
+
+        return array("B", self.get(position, length))
+
 
 class BufferFile(StructFile):
     def __init__(self, buf, name=None, onclose=None):
@@ -374,6 +382,50 @@ class BufferFile(StructFile):
             a.byteswap()
         return a
 
+    def get_view(self, position, length):
+        if not PY3:
+            # Python 2 buffers index as strings instead of integers
+            return StructFile.get_view(self, position, length)
+        return memoryview(self._buf)[position:position + length]
+
+
+class MmapFile(BufferFile):
+    """A :class:`BufferFile` over a read-only ``mmap.mmap`` object. The map
+    object is used both as the buffer and as the file, so opening the file
+    doesn't copy its contents into memory, and :meth:`StructFile.get` and
+    :meth:`StructFile.get_array` are slices of the mapping instead of
+    ``seek()`` + ``read()`` system calls.
+    """
+
+    def __init__(self, mm, name=None, onclose=None):
+        self._buf = mm
+        self._name = name
+        self.file = mm
+        self.onclose = onclose
+
+        self.is_real = False
+        self.is_closed = False
+
+    def __iter__(self):
+        return iter(self.file.readline, emptybytes)
+
+    def subset(self, position, length, name=None):
+        name = name or self._name
+        return BufferFile(memoryview_(self._buf, position, length), name=name)
+
+    def close(self):
+        if self.is_closed:
+            raise Exception("This file is already closed")
+        if self.onclose:
+            self.onclose(self)
+        try:
+            self.file.close()
+        except BufferError:
+            # Something still holds a view of the map (e.g. a subset), so
+            # leave it to be unmapped when it's garbage collected
+            pass
+        self.is_closed = True
+
 
 class ChecksumFile(StructFile):
     def __init__(self, *args, **kwargs):
@@ -27,10 +27,16 @@
 
 from __future__ import division
 from array import array
+from bisect import bisect_left
 
 from whoosh.compat import xrange
 from whoosh.matching import mcore
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class CombinationMatcher(mcore.Matcher):
     def __init__(self, submatchers, boost=1.0):
@@ -167,19 +173,44 @@ class ArrayUnionMatcher(CombinationMatcher):
     because of less overhead), but it doesn't allow getting information about
     the "current" document other than the score, because there isn't really a
     current document, just an array of scores.
+
+    If NumPy is available, the scores are accumulated in a NumPy array. Leaf
+    sub-matchers add a whole posting block at a time, using the scorer's
+    :meth:`~whoosh.scoring.BaseScorer.score_block` method, and documents
+    that can't score higher than the minimum quality passed to
+    :meth:`ArrayUnionMatcher.replace` are skipped with vectorized operations.
     """
 
     def __init__(self, submatchers, doccount, boost=1.0, scored=True,
-                 partsize=2048):
+                 partsize=None, vectorize=True):
+        """
+        :param submatchers: a list of matchers to combine.
+        :param doccount: the number of documents in the searcher.
+        :param boost: a boost factor to multiply the scores by.
+        :param scored: if False, all matching documents have a score of 1.
+        :param partsize: the number of documents to read at a time. The
+            default is 2048, or 65536 if NumPy is used.
+        :param vectorize: whether to use NumPy if it is available.
+        """
+
         CombinationMatcher.__init__(self, submatchers, boost=boost)
         self._scored = scored
         self._doccount = doccount
+        self._numpy = vectorize and numpy is not None
+        # Minimum score (from replace()) a document must have to be matched
+        self._minquality = 0
 
+        if partsize is None:
+            partsize = min(65536, doccount) if self._numpy else 2048
         if not partsize:
             partsize = doccount
         self._partsize = partsize
 
-        self._a = array("d", (0 for _ in xrange(self._partsize)))
+        if self._numpy:
+            self._a = numpy.zeros(partsize)
+        else:
+            self._zeros = array("d", [0.0]) * partsize
+            self._a = array("d", self._zeros)
         self._docnum = self._min_id()
         self._read_part()
 
@@ -202,12 +233,17 @@ class ArrayUnionMatcher(CombinationMatcher):
         offset = self._docnum
         a = self._a
 
-        # Clear the array
-        for i in xrange(self._partsize):
-            a[i] = 0
+        if self._numpy:
+            a.fill(0)
+        else:
+            # Clear the array
+            a[:] = self._zeros
 
         # Add the scores from the submatchers into the array
         for m in self._submatchers:
+            if self._numpy and self._add_blocks(m, offset, limit):
+                continue
+
             while m.is_active() and m.id() < limit:
                 i = m.id() - offset
                 if scored:
@@ -219,7 +255,67 @@ class ArrayUnionMatcher(CombinationMatcher):
         self._offset = offset
         self._limit = limit
 
+        if self._numpy:
+            # Find the documents in this part that match (and could score
+            # higher than the minimum quality)
+            self._hits = numpy.flatnonzero(a[:limit - offset] >
+                                           self._minquality)
+            self._hitpos = 0
+
+    def _add_blocks(self, m, offset, limit):
+        # Adds the scores of a matcher's postings before the limit to the
+        # NumPy array a block at a time. Returns False if the matcher can't be
+        # read in blocks.
+
+        scored = self._scored
+        if scored:
+            if not m.supports_block_scores():
+                return False
+        elif not isinstance(m, mcore.LeafMatcher):
+            return False
+
+        a = self._a
+        boost = self._boost
+        while m.is_active() and m.id() < limit:
+            if scored:
+                ids, scores = m.block_scores()
+            else:
+                ids, scores = m.block_arrays()
+
+            # Only use the postings before the limit
+            count = bisect_left(ids, limit)
+            pastlimit = count < len(ids)
+            if pastlimit:
+                ids = ids[:count]
+                scores = scores[:count]
+
+            if len(ids):
+                positions = numpy.asarray(ids) - offset
+                if scored:
+                    a[positions] += numpy.asarray(scores) * boost
+                else:
+                    a[positions] = 1
+
+            if pastlimit:
+                m.skip_to(limit)
+                break
+            m.skip_block()
+        return True
+
     def _find_next(self):
+        if self._numpy:
+            while self._docnum < self._doccount:
+                hits = self._hits
+                pos = int(numpy.searchsorted(hits, self._docnum - self._offset))
+                if pos < len(hits):
+                    self._hitpos = pos
+                    self._docnum = self._offset + int(hits[pos])
+                    return
+                # No more hits in this part, read the next one
+                self._docnum = self._min_id()
+                self._read_part()
+            return
+
         a = self._a
         docnum = self._docnum
         offset = self._offset
@@ -236,6 +332,20 @@ class ArrayUnionMatcher(CombinationMatcher):
         else:
             self._docnum = docnum
 
+    def replace(self, minquality=0):
+        if self._numpy and self._scored and minquality > self._minquality:
+            # Remove documents that don't score high enough from the hits in
+            # the current part
+            self._minquality = minquality
+            hits = self._hits
+            hitpos = self._hitpos
+            scores = self._a[hits[hitpos:]]
+            self._hits = hits[hitpos:][scores > minquality]
+            self._hitpos = 0
+            if self.is_active():
+                self._find_next()
+        return self
+
     def supports(self, astype):
         # This matcher doesn't support any posting values
         return False
@@ -247,6 +357,8 @@ class ArrayUnionMatcher(CombinationMatcher):
         return max(m.max_quality() for m in self._submatchers)
 
     def block_quality(self):
+        if self._numpy:
+            return float(self._a.max())
         return max(self._a)
 
     def skip_to(self, docnum):
@@ -270,6 +382,8 @@ class ArrayUnionMatcher(CombinationMatcher):
             # Rebuffer
             self._docnum = self._min_id()
             self._read_part()
+            if self._numpy and self.is_active():
+                self._find_next()
         else:
             self._docnum = self._doccount
 
@@ -287,6 +401,15 @@ class ArrayUnionMatcher(CombinationMatcher):
         return self._docnum
 
     def all_ids(self):
+        if self._numpy:
+            while self.is_active():
+                offset = self._offset
+                for pos in self._hits[self._hitpos:].tolist():
+                    yield offset + pos
+                self._docnum = self._min_id()
+                self._read_part()
+            return
+
         doccount = self._doccount
         docnum = self._docnum
         offset = self._offset
@@ -310,3 +433,209 @@ class ArrayUnionMatcher(CombinationMatcher):
 
     def score(self):
         return self._a[self._docnum - self._offset]
+
+
+class WandMatcher(CombinationMatcher):
+    """Matches the union (OR) of any number of sub-matchers, using the "weak
+    AND" (WAND) algorithm with block-max bounds to skip documents that can't
+    score higher than a minimum quality (for example the lowest score in a
+    collector's top N, which the collector passes to :meth:`replace` and
+    :meth:`skip_to_quality`).
+
+    Instead of a binary tree of
+    :class:`~whoosh.matching.binary.UnionMatcher` objects, this matcher keeps
+    the sub-matchers in a list sorted by their current ID. To find the next
+    match, it adds up the maximum qualities of the sub-matchers in ID order
+    until the sum is higher than the minimum quality. The ID of the
+    sub-matcher where that happens (the "pivot") is the lowest ID that could
+    possibly score high enough, so the sub-matchers before it skip straight to
+    the pivot. Once all of them are on the pivot, the sum of their *block*
+    qualities is checked, and if that's too low the matcher skips to the end
+    of the shortest of their current blocks.
+
+    All the sub-matchers must support block quality (see
+    :meth:`~whoosh.matching.Matcher.supports_block_quality`). This works best
+    with many term matchers of differing frequencies.
+    """
+
+    def __init__(self, submatchers, boost=1.0, minquality=0):
+        CombinationMatcher.__init__(self, submatchers, boost=boost)
+        self._minquality = minquality
+        # List of active sub-matchers, sorted by ID
+        self._subs = []
+        # Number of sub-matchers (at the start of self._subs) on the current
+        # ID
+        self._count = 0
+        self._id = None
+        self._find()
+
+    def __repr__(self):
+        return "%s(%r, boost=%s)" % (self.__class__.__name__,
+                                     self._submatchers, self._boost)
+
+    def _find(self):
+        # Moves the sub-matchers forward until they are on a document that
+        # might score higher than the minimum quality, and returns the number
+        # of times the matcher skipped non-competitive blocks
+
+        minquality = self._minquality / self._boost
+        skipped = 0
+
+        while True:
+            subs = [m for m in self._submatchers if m.is_active()]
+            if not subs:
+                self._subs = []
+                self._count = 0
+                self._id = None
+                return skipped
+            subs.sort(key=lambda m: m.id())
+            self._subs = subs
+
+            # Without a minimum quality, every document is a match
+            if not minquality:
+                return self._settle(subs[0].id(), skipped)
+
+            # Find the pivot: the first sub-matcher where the sum of the
+            # maximum qualities so far is higher than the minimum quality
+            total = 0
+            pivot = None
+            for m in subs:
+                total += m.max_quality()
+                if total > minquality:
+                    pivot = m
+                    break
+            if pivot is None:
+                # Even all of the remaining sub-matchers together can't score
+                # high enough, so there are no more matches
+                self._subs = []
+                self._count = 0
+                self._id = None
+                return skipped
+
+            pivotid = pivot.id()
+            if subs[0].id() < pivotid:
+                # Move the sub-matchers before the pivot up to the pivot ID
+                for m in subs:
+                    if m.id() >= pivotid:
+                        break
+                    m.skip_to(pivotid)
+                continue
+
+            # All the sub-matchers up to the pivot are on the pivot ID; check
+            # the qualities of their current blocks
+            count = 0
+            blockquality = 0
+            for m in subs:
+                if m.id() != pivotid:
+                    break
+                blockquality += m.block_quality()
+                count += 1
+            if blockquality > minquality:
+                return self._settle(pivotid, skipped)
+
+            # No document before the end of the shortest block can score high
+            # enough (or before the next sub-matcher's ID), so skip there
+            nextid = pivotid + 1
+            ends = [m.block_max_id() for m in subs[:count]]
+            if None not in ends:
+                nextid = max(nextid, min(ends) + 1)
+                if count < len(subs):
+                    nextid = min(nextid, subs[count].id())
+            for m in subs[:count]:
+                m.skip_to(nextid)
+            skipped += 1
+
+    def _settle(self, id, skipped):
+        # Sets the current ID to the given ID, which the first sub-matchers in
+        # self._subs are on
+        subs = self._subs
+        count = 1
+        while count < len(subs) and subs[count].id() == id:
+            count += 1
+        self._id = id
+        self._count = count
+        return skipped
+
+    def _current(self):
+        # Returns the sub-matchers on the current ID
+        return self._subs[:self._count]
+
+    def copy(self):
+        return self.__class__([m.copy() for m in self._submatchers],
+                              boost=self._boost, minquality=self._minquality)
+
+    def replace(self, minquality=0):
+        active = [m for m in self._submatchers if m.is_active()]
+        if not active:
+            return mcore.NullMatcher()
+        if len(active) == 1 and self._boost == 1.0:
+            return active[0].replace(minquality)
+
+        self._submatchers = active
+        if minquality > self._minquality:
+            self._minquality = minquality
+            self._find()
+        return self
+
+    def children(self):
+        return self._submatchers
+
+    def is_active(self):
+        return self._id is not None
+
+    def reset(self):
+        for m in self._submatchers:
+            m.reset()
+        self._find()
+
+    def id(self):
+        return self._id
+
+    def next(self):
+        if self._id is None:
+            raise mcore.ReadTooFar
+
+        newblock = False
+        for m in self._current():
+            if m.next():
+                newblock = True
+        self._find()
+        return newblock
+
+    def skip_to(self, id):
+        if self._id is None:
+            raise mcore.ReadTooFar
+        if id <= self._id:
+            return
+
+        for m in self._subs:
+            if m.is_active():
+                m.skip_to(id)
+        self._find()
+
+    def skip_to_quality(self, minquality):
+        if self._id is None:
+            raise mcore.ReadTooFar
+
+        if minquality > self._minquality:
+            self._minquality = minquality
+            return self._find()
+        return 0
+
+    def block_quality(self):
+        return sum(m.block_quality() for m in self._subs) * self._boost
+
+    def max_quality(self):
+        return sum(m.max_quality() for m in self._subs) * self._boost
+
+    def spans(self):
+        current = self._current()
+        if len(current) == 1:
+            return current[0].spans()
+        return sorted(set().union(*(m.spans() for m in current)))
+
+    def weight(self):
+        return sum(m.weight() for m in self._current()) * self._boost
+
+    def score(self):
+        return sum(m.score() for m in self._current()) * self._boost
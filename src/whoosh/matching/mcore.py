@@ -192,6 +192,40 @@ class Matcher(object):
 
         raise NoQualityAvailable(self.__class__)
 
+    def block_max_id(self):
+        """Returns the highest ID in the current block of postings, or None if
+        this matcher doesn't know where its blocks end. Matchers that skip
+        ahead based on block quality use this to find how far they can skip.
+        """
+
+        return None
+
+    def supports_block_scores(self):
+        """Returns True if this matcher implements
+        :meth:`Matcher.block_scores` and :meth:`Matcher.skip_block`.
+        """
+
+        return False
+
+    def block_scores(self):
+        """Returns a tuple of ``(ids, scores)`` sequences containing the IDs
+        and scores of the postings from the current posting to the end of the
+        current block, so callers that want many scores can avoid calling
+        :meth:`Matcher.score` and :meth:`Matcher.next` for every posting. Call
+        :meth:`Matcher.skip_block` to move past them.
+
+        Only available if :meth:`Matcher.supports_block_scores` returns True.
+        """
+
+        raise NotImplementedError(self.__class__)
+
+    def skip_block(self):
+        """Moves the matcher to the first posting of the next block (see
+        :meth:`Matcher.block_scores`).
+        """
+
+        raise NotImplementedError(self.__class__)
+
     @abstractmethod
     def id(self):
         """Returns the ID of the current posting.
@@ -488,6 +522,10 @@ class ListMatcher(Matcher):
     def block_quality(self):
         return self._scorer.block_quality(self)
 
+    def block_max_id(self):
+        # The whole list is treated as one block
+        return self._ids[-1]
+
     def skip_to_quality(self, minquality):
         while self._i < len(self._ids) and self.block_quality() <= minquality:
             self._i += 1
@@ -620,3 +658,23 @@ class LeafMatcher(Matcher):
 
     def score(self):
         return self.scorer.score(self)
+
+    def block_arrays(self):
+        """Returns a tuple of ``(ids, weights)`` sequences containing the IDs
+        and weights of the postings from the current posting to the end of the
+        current block. Call :meth:`Matcher.skip_block` to move past them.
+
+        The default implementation treats each posting as a separate block.
+        """
+
+        return [self.id()], [self.weight()]
+
+    def supports_block_scores(self):
+        return bool(self.scorer and self.scorer.supports_score_block())
+
+    def block_scores(self):
+        ids, weights = self.block_arrays()
+        return ids, self.scorer.score_block(ids, weights)
+
+    def skip_block(self):
+        self.next()
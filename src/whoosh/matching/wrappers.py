@@ -109,6 +109,25 @@ class WrappingMatcher(mcore.Matcher):
     def block_quality(self):
         return self.child.block_quality() * self.boost
 
+    def block_max_id(self):
+        return self.child.block_max_id()
+
+    def supports_block_scores(self):
+        # Subclasses usually change the IDs or scores of the child, so only
+        # the plain wrapper passes through the child's blocks
+        return (type(self) is WrappingMatcher
+                and self.child.supports_block_scores())
+
+    def block_scores(self):
+        ids, scores = self.child.block_scores()
+        boost = self.boost
+        if boost != 1.0:
+            scores = [score * boost for score in scores]
+        return ids, scores
+
+    def skip_block(self):
+        self.child.skip_block()
+
     def weight(self):
         return self.child.weight() * self.boost
 
@@ -314,6 +333,26 @@ class FilterMatcher(WrappingMatcher):
         self.child.skip_to(id)
         self._find_next()
 
+    def supports_block_scores(self):
+        return self.child.supports_block_scores()
+
+    def block_scores(self):
+        ids, scores = self.child.block_scores()
+        filterids = self._ids
+        exclude = self._exclude
+        boost = self.boost
+        keep = [i for i, id in enumerate(ids) if (id in filterids) != exclude]
+        if len(keep) < len(ids):
+            ids = [ids[i] for i in keep]
+            scores = [scores[i] for i in keep]
+        if boost != 1.0:
+            scores = [score * boost for score in scores]
+        return ids, scores
+
+    def skip_block(self):
+        self.child.skip_block()
+        self._find_next()
+
     def all_ids(self):
         ids = self._ids
         if self._exclude:
@@ -348,6 +387,10 @@ class InverseMatcher(WrappingMatcher):
                               weight=self._weight, missing=self.missing,
                               id=self._id)
 
+    def block_max_id(self):
+        # The IDs of this matcher aren't related to the child's blocks
+        return None
+
     def _replacement(self, newchild):
         return self.__class__(newchild, self.limit, missing=self.missing,
                               weight=self._weight, id=self._id)
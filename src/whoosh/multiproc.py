@@ -27,13 +27,19 @@
 
 from __future__ import with_statement
 import os
-from multiprocessing import Process, Queue, cpu_count
+from array import array
+from bisect import bisect_right
+from itertools import islice
+from collections import deque
+from multiprocessing import Pipe, Pool, Process, Queue, cpu_count
 
-from whoosh.compat import queue, xrange, iteritems, pickle
+from whoosh.compat import BytesIO, izip, queue, xrange, iteritems, pickle
 from whoosh.codec import base
-from whoosh.writing import PostingPool, SegmentWriter
+from whoosh.writing import IndexingError, PostingPool, SegmentWriter
+from whoosh.writing import analyze_document, batch_documents
+from whoosh.writing import decode_postings, encode_postings
 from whoosh.externalsort import imerge
-from whoosh.util import random_name
+from whoosh.system import emptybytes
 
 
 def finish_subsegment(writer, k=64):
@@ -61,9 +67,10 @@ def finish_subsegment(writer, k=64):
 class SubWriterTask(Process):
     # This is a Process object that takes "jobs" off a job Queue, processes
     # them, and when it's done, puts a summary of its work on a results Queue
+    # and sends its sorted postings back to the parent through a pipe
 
     def __init__(self, storage, indexname, jobqueue, resultqueue, kwargs,
-                 multisegment):
+                 multisegment, tasknum=0, postingconn=None):
         Process.__init__(self)
         self.storage = storage
         self.indexname = indexname
@@ -71,6 +78,8 @@ class SubWriterTask(Process):
         self.resultqueue = resultqueue
         self.kwargs = kwargs
         self.multisegment = multisegment
+        self.tasknum = tasknum
+        self.postingconn = postingconn
         self.running = True
 
     def run(self):
@@ -79,13 +88,12 @@ class SubWriterTask(Process):
         # multiprocessing module, work around bugs, and address performance
         # issues, so there is at least some reasoning behind some of this
 
-        # The "parent" task farms individual documents out to the subtasks for
-        # indexing. You could pickle the actual documents and put them in the
-        # queue, but that is not very performant. Instead, we assume the tasks
-        # share a filesystem and use that to pass the information around. The
-        # parent task writes a certain number of documents to a file, then puts
-        # the filename on the "job queue". A subtask gets the filename off the
-        # queue and reads through the file processing the documents.
+        # The "parent" task farms batches of documents out to the subtasks
+        # for indexing. The parent pickles a batch of documents into a single
+        # bytes string and puts it on the "job queue", which has a maximum
+        # size so the parent blocks instead of buffering documents when the
+        # subtasks fall behind. A subtask gets a batch off the queue and
+        # indexes the documents in it.
 
         jobqueue = self.jobqueue
         resultqueue = self.resultqueue
@@ -107,53 +115,81 @@ class SubWriterTask(Process):
             # finish up
             if jobinfo is None:
                 break
-            # The object from the queue is a tuple of (filename,
-            # number_of_docs_in_file). Pass those two pieces of information as
-            # arguments to _process_file().
-            self._process_file(*jobinfo)
-            # jobqueue.task_done()
+            # The object from the queue is a tuple of (pickled_batch,
+            # number_of_docs_in_batch)
+            self._process_batch(*jobinfo)
 
         if not self.running:
             # I was cancelled, so I'll cancel my underlying writer
             writer.cancel()
+        elif multisegment:
+            # Actually finish the segment and return it
+            fieldnames = writer.pool.fieldnames
+            segment = writer._finalize_segment()
+            resultqueue.put((self.tasknum, fieldnames, segment), timeout=5)
         else:
-            if multisegment:
-                # Actually finish the segment and return it with no run
-                runname = None
-                fieldnames = writer.pool.fieldnames
-                segment = writer._finalize_segment()
-            else:
-                # Merge all runs in the writer's pool into one run, close the
-                # segment, and return the run name and the segment
-                k = self.kwargs.get("k", 64)
-                runname, fieldnames, segment = finish_subsegment(writer, k)
-
-            # Put the results (the run filename and the segment object) on the
-            # result queue
-            resultqueue.put((runname, fieldnames, segment), timeout=5)
-
-    def _process_file(self, filename, doc_count):
-        # This method processes a "job file" written out by the parent task. A
-        # job file is a series of pickled (code, arguments) tuples. Currently
-        # the only command codes is 0=add_document
+            # Close the segment and put it on the result queue, then stream
+            # the sorted postings in the writer's pool to the parent, which
+            # merges them with the postings from the other subtasks as they
+            # arrive. The pipe blocks when the parent isn't reading, so the
+            # postings are never all in memory
+            fieldnames = writer.pool.fieldnames
+            segment = writer._partial_segment()
+            resultqueue.put((self.tasknum, fieldnames, segment), timeout=5)
+
+            conn = self.postingconn
+            postings = iter(writer.pool.iter_postings())
+            while True:
+                block = list(islice(postings, 4096))
+                if not block:
+                    break
+                conn.send_bytes(encode_postings(block))
+            # An empty message means there are no more postings
+            conn.send_bytes(emptybytes)
+            conn.close()
+            writer.pool.cleanup()
+
+    def _process_batch(self, data, doc_count):
+        # This method processes a batch of documents pickled by the parent
+        # task. The batch is a list of (code, arguments) tuples. Currently
+        # the only command code is 0=add_document
 
         writer = self.writer
-        tempstorage = writer.temp_storage()
-
-        load = pickle.load
-        with tempstorage.open_file(filename).raw_file() as f:
-            for _ in xrange(doc_count):
-                # Load the next pickled tuple from the file
-                code, args = load(f)
-                assert code == 0
-                writer.add_document(**args)
-        # Remove the job file
-        tempstorage.delete_file(filename)
+        batch = pickle.loads(data)
+        assert len(batch) == doc_count
+        assert all(code == 0 for code, _ in batch)
+        writer.add_documents([args for _, args in batch])
 
     def cancel(self):
         self.running = False
 
 
+def receive_postings(conn):
+    # Yields the postings streamed by a SubWriterTask through a pipe
+    while True:
+        data = conn.recv_bytes()
+        if not data:
+            break
+        for item in decode_postings(BytesIO(data).read):
+            yield item
+    conn.close()
+
+
+def collect_results(tasks, resultqueue, count):
+    # Gets the given number of results off the result queue, while checking
+    # that the tasks producing them haven't died. Returns a list of results,
+    # which may be shorter than count if a task failed
+    results = []
+    while len(results) < count:
+        alive = any(task.is_alive() for task in tasks)
+        try:
+            results.append(resultqueue.get(timeout=1))
+        except queue.Empty:
+            if not alive:
+                break
+    return results
+
+
 class MpWriter(SegmentWriter):
     def __init__(self, ix, procs=None, batchsize=100, subargs=None,
                  multisegment=False, **kwargs):
@@ -174,7 +210,11 @@ class MpWriter(SegmentWriter):
 
         # A list to hold the sub-task Process objects
         self.tasks = []
-        # A queue to pass the filenames of job files to the sub-tasks
+        # The receiving ends of the pipes the sub-tasks send their postings
+        # through, in the same order as the tasks
+        self.postingconns = []
+        # A queue to pass batches of pickled documents to the sub-tasks. The
+        # size limit makes add_document() block if the sub-tasks can't keep up
         self.jobqueue = Queue(self.procs * 4)
         # A queue to get back the final results of the sub-tasks
         self.resultqueue = Queue()
@@ -185,28 +225,27 @@ class MpWriter(SegmentWriter):
         self._added_sub = False
 
     def _new_task(self):
+        recvconn, sendconn = Pipe(duplex=False)
         task = SubWriterTask(self.storage, self.indexname,
                              self.jobqueue, self.resultqueue, self.subargs,
-                             self.multisegment)
+                             self.multisegment, tasknum=len(self.tasks),
+                             postingconn=sendconn)
         self.tasks.append(task)
+        self.postingconns.append(recvconn)
         task.start()
+        # Only the task uses the sending end
+        sendconn.close()
         return task
 
     def _enqueue(self):
-        # Flush the documents stored in self.docbuffer to a file and put the
-        # filename on the job queue
+        # Pickle the documents stored in self.docbuffer and put them on the
+        # job queue
         docbuffer = self.docbuffer
-        dump = pickle.dump
-        length = len(docbuffer)
-
-        filename = "%s.doclist" % random_name()
-        with self.temp_storage().create_file(filename).raw_file() as f:
-            for item in docbuffer:
-                dump(item, f, 2)
+        data = pickle.dumps(docbuffer, -1)
 
         if len(self.tasks) < self.procs:
             self._new_task()
-        jobinfo = (filename, length)
+        jobinfo = (data, len(docbuffer))
         self.jobqueue.put(jobinfo)
         self.docbuffer = []
 
@@ -233,18 +272,18 @@ class MpWriter(SegmentWriter):
             self._enqueue()
         self._added_sub = True
 
-    def _read_and_renumber_run(self, path, offset):
-        # Note that SortingPool._read_run() automatically deletes the run file
-        # when it's finished
+    def add_documents(self, docs):
+        for fields in batch_documents(docs):
+            self.add_document(**fields)
 
-        gen = self.pool._read_run(path)
+    def _renumber(self, items, offset):
         # If offset is 0, just return the items unchanged
         if not offset:
-            return gen
+            return items
         else:
             # Otherwise, add the offset to each docnum
             return ((fname, text, docnum + offset, weight, value)
-                    for fname, text, docnum, weight, value in gen)
+                    for fname, text, docnum, weight, value in items)
 
     def commit(self, mergetype=None, optimize=None, merge=None):
         if self._added_sub:
@@ -267,22 +306,17 @@ class MpWriter(SegmentWriter):
         # Merge existing segments
         finalsegments = self._merge_segments(mergetype, optimize, merge)
 
-        # Wait for the subtasks to finish
-        for task in self.tasks:
-            task.join()
-
-        # Pull a (run_file_name, fieldnames, segment) tuple off the result
+        # Pull a (task_number, fieldnames, segment) tuple off the result
         # queue for each sub-task, representing the final results of the task
-        results = []
-        for _ in self.tasks:
-            try:
-                results.append(self.resultqueue.get(timeout=1))
-            except queue.Empty:
-                pass
+        results = collect_results(self.tasks, self.resultqueue,
+                                  len(self.tasks))
+        if len(results) < len(self.tasks):
+            raise IndexingError("A sub-writer process failed")
+        results.sort(key=lambda result: result[0])
 
         if self.multisegment:
-            # If we're not merging the segments, we don't care about the runname
-            # and fieldnames in the results... just pull out the segments and
+            # If we're not merging the segments, we don't care about the
+            # fieldnames in the results... just pull out the segments and
             # add them to the list of final segments
             finalsegments += [s for _, _, s in results]
             if self._added:
@@ -291,18 +325,28 @@ class MpWriter(SegmentWriter):
                 self._close_segment()
             assert self.perdocwriter.is_closed
         else:
-            # Merge the posting sources from the sub-writers and my
+            # Merge the postings streamed from the sub-writers and my
             # postings into this writer
-            self._merge_subsegments(results, mergetype)
+            sources = [(receive_postings(self.postingconns[tasknum]),
+                        fieldnames, segment)
+                       for tasknum, fieldnames, segment in results]
+            self._merge_subsegments(sources, mergetype)
             self._close_segment()
             self._assemble_segment()
             finalsegments.append(self.get_segment())
             assert self.perdocwriter.is_closed
 
+        # Wait for the subtasks to finish
+        for task in self.tasks:
+            task.join()
+
         self._commit_toc(finalsegments)
         self._finish()
 
     def _merge_subsegments(self, results, mergetype):
+        # results is a list of (postings, fieldnames, segment) tuples, where
+        # postings is an iterator of the sorted postings in the sub-writer's
+        # segment
         schema = self.schema
         schemanames = set(schema.names())
         storage = self.storage
@@ -312,10 +356,10 @@ class MpWriter(SegmentWriter):
         # If information was added to this writer the conventional (e.g.
         # through add_reader or merging segments), add it as an extra source
         if self._added:
-            sources.append(self.pool.iter_postings())
+            sources.append(self.iter_postings())
 
         pdrs = []
-        for runname, fieldnames, segment in results:
+        for items, fieldnames, segment in results:
             fieldnames = set(fieldnames) | schemanames
             pdr = codec.per_document_reader(storage, segment)
             pdrs.append(pdr)
@@ -323,8 +367,7 @@ class MpWriter(SegmentWriter):
             docmap = self.write_per_doc(fieldnames, pdr)
             assert docmap is None
 
-            items = self._read_and_renumber_run(runname, basedoc)
-            sources.append(items)
+            sources.append(self._renumber(items, basedoc))
 
         # Create a MultiLengths object combining the length files from the
         # subtask segments
@@ -359,6 +402,10 @@ class SerialMpWriter(MpWriter):
         self.pointer = (self.pointer + 1) % len(self.tasks)
         self._added_sub = True
 
+    def add_documents(self, docs):
+        for fields in batch_documents(docs):
+            self.add_document(**fields)
+
     def _commit(self, mergetype, optimize, merge):
         # Pull a (run_file_name, segment) tuple off the result queue for each
         # sub-task, representing the final results of the task
@@ -367,7 +414,11 @@ class SerialMpWriter(MpWriter):
         finalsegments = self._merge_segments(mergetype, optimize, merge)
         results = []
         for writer in self.tasks:
-            results.append(finish_subsegment(writer))
+            runname, fieldnames, segment = finish_subsegment(writer)
+            # Note that SortingPool._read_run() automatically deletes the run
+            # file when it's finished
+            results.append((writer.pool._read_run(runname), fieldnames,
+                            segment))
 
         self._merge_subsegments(results, mergetype)
         self._close_segment()
@@ -378,6 +429,374 @@ class SerialMpWriter(MpWriter):
         self._finish()
 
 
+# Parallel segment merging
+
+class MergeSources(object):
+    # Maps the documents of a list of segment readers to their document numbers
+    # in the merged segment (the same numbering SegmentWriter.write_per_doc()
+    # uses), and lets the field writer look up the field lengths of the merged
+    # documents in the source readers
+
+    def __init__(self, readers):
+        self.readers = readers
+        self.bases = []
+        # For readers with deletions, an array of the undeleted document
+        # numbers in the reader, in the order they'll appear in the merged
+        # segment
+        self.docs = []
+
+        base = 0
+        for reader in readers:
+            self.bases.append(base)
+            if reader.has_deletions():
+                docs = array("I", reader.all_doc_ids())
+            else:
+                docs = None
+            self.docs.append(docs)
+            base += reader.doc_count()
+
+    def postings(self, fieldname, start=None, end=None):
+        # Returns an iterator of (fieldname, btext, docnum, weight, vbytes)
+        # postings for the terms in the given field from start (inclusive) to
+        # end (exclusive), renumbered for the merged segment and sorted by
+        # term and document number
+        sources = []
+        for reader, base, docs in zip(self.readers, self.bases, self.docs):
+            if fieldname in reader.indexed_field_names():
+                sources.append(self._reader_postings(reader, base, docs,
+                                                     fieldname, start, end))
+        # The postings from each reader are already sorted, so they only need
+        # to be interleaved
+        return imerge(sources)
+
+    def _reader_postings(self, reader, base, docs, fieldname, start, end):
+        if docs is not None:
+            docmap = dict((docnum, base + i) for i, docnum in enumerate(docs))
+
+        for fname, btext in reader.terms_from(fieldname, start or emptybytes):
+            if fname != fieldname or (end is not None and btext >= end):
+                break
+            m = reader.postings(fieldname, btext)
+            while m.is_active():
+                if docs is None:
+                    docnum = base + m.id()
+                else:
+                    docnum = docmap[m.id()]
+                yield (fieldname, btext, docnum, m.weight(), m.value())
+                m.next()
+
+    def doc_field_length(self, docnum, fieldname, default=0):
+        i = bisect_right(self.bases, docnum) - 1
+        docnum -= self.bases[i]
+        if self.docs[i] is not None:
+            docnum = self.docs[i][docnum]
+        return self.readers[i].doc_field_length(docnum, fieldname, default)
+
+
+def merge_jobs(readers, fieldnames, procs):
+    # Splits the postings of the given fields into a sorted list of
+    # (fieldname, start, end) term ranges of roughly similar sizes: small
+    # fields are merged whole, while fields larger than an even share of the
+    # work are split into several ranges
+
+    weights = {}
+    for fieldname in fieldnames:
+        weights[fieldname] = sum(r.field_length(fieldname) or r.doc_count()
+                                 for r in readers
+                                 if fieldname in r.indexed_field_names())
+    share = sum(weights.values()) / float(procs)
+
+    jobs = []
+    for fieldname in sorted(fieldnames):
+        weight = weights[fieldname]
+        if not weight:
+            continue
+
+        parts = min(procs, int(weight // share))
+        if parts < 2:
+            jobs.append((fieldname, None, None))
+            continue
+
+        # Choose the boundaries between the ranges using the document
+        # frequencies of the terms in the biggest segment
+        reader = max(readers, key=lambda r: r.doc_count())
+        total = sum(ti.doc_frequency() for _, ti
+                    in reader.iter_field(fieldname))
+        step = total / float(parts)
+        bounds = []
+        sofar = 0
+        for btext, ti in reader.iter_field(fieldname):
+            if sofar >= step * (len(bounds) + 1):
+                bounds.append(btext)
+            sofar += ti.doc_frequency()
+
+        starts = [None] + bounds
+        ends = bounds + [None]
+        jobs.extend((fieldname, start, end) for start, end
+                    in zip(starts, ends))
+    return jobs
+
+
+class MergeSliceTask(Process):
+    # This is a Process object that takes (fieldname, start, end) term ranges
+    # off a job Queue, writes the merged postings for each range to a separate
+    # "slice" segment containing only a term index and postings, and puts the
+    # slice segment on the results Queue
+
+    def __init__(self, storage, schema, codec, segments, jobqueue,
+                 resultqueue):
+        Process.__init__(self)
+        self.storage = storage
+        self.schema = schema
+        self.codec = codec
+        self.segments = segments
+        self.jobqueue = jobqueue
+        self.resultqueue = resultqueue
+
+    def run(self):
+        from whoosh.reading import SegmentReader
+
+        storage = self.storage
+        schema = self.schema
+        codec = self.codec
+        readers = [SegmentReader(storage, schema, segment)
+                   for segment in self.segments]
+        sources = MergeSources(readers)
+        lengths = sources if codec.length_stats else None
+
+        try:
+            while True:
+                jobinfo = self.jobqueue.get()
+                if jobinfo is None:
+                    break
+                num, fieldname, start, end, segment = jobinfo
+
+                postings = sources.postings(fieldname, start, end)
+                fieldwriter = codec.field_writer(storage, segment)
+                fieldwriter.add_postings(schema, lengths, postings)
+                fieldwriter.close()
+
+                self.resultqueue.put((num, segment))
+        finally:
+            for reader in readers:
+                reader.close()
+
+
+def parallel_merge(writer, segments, procs):
+    """Merges the given segments into a new segment using several processes,
+    and returns the new segment. This is used by the merge policies when a
+    :class:`whoosh.writing.SegmentWriter` is created with ``mergeprocs``
+    greater than 1, for example::
+
+        ix.optimize(mergeprocs=4)
+
+    The postings are partitioned into term ranges (whole fields, with large
+    fields split into several ranges), and each worker process writes the
+    postings for its ranges to separate "slice" files. Meanwhile this process
+    writes the stored fields, field lengths, vectors, and columns of the new
+    segment. The slices are then copied into the new segment's term index and
+    postings file in order.
+
+    Returns None without merging anything if the index's storage is not a
+    :class:`whoosh.filedb.filestore.FileStorage` (the worker processes must
+    share the files) or the codec's field writer doesn't support slices.
+
+    :param writer: the :class:`whoosh.writing.SegmentWriter` being committed.
+    :param segments: the segments to merge.
+    :param procs: the number of worker processes to use.
+    """
+
+    from whoosh.filedb.filestore import FileStorage
+    from whoosh.reading import SegmentReader
+
+    storage = writer.storage
+    if not isinstance(storage, FileStorage):
+        return None
+
+    schema = writer.schema
+    codec = writer.codec
+    ix = storage.open_index(writer.indexname, schema=schema)
+    mwriter = SegmentWriter(ix, _lk=False, codec=codec,
+                            compound=writer.compound)
+    if not mwriter.fieldwriter.supports_slices():
+        mwriter._close_segment()
+        mwriter.is_closed = True
+        return None
+
+    readers = [SegmentReader(storage, schema, seg) for seg in segments]
+    tasks = []
+    jobs = []
+    try:
+        ndxnames = set()
+        for reader in readers:
+            ndxnames.update(fname for fname in reader.indexed_field_names()
+                            if fname in schema)
+        fieldnames = set(schema.names()) | ndxnames
+
+        # Put the term ranges on the job queue along with the slice segment
+        # each one should be written to
+        jobqueue = Queue()
+        resultqueue = Queue()
+        slicename = "%s_slice" % writer.indexname
+        for num, (fieldname, start, end) in enumerate(merge_jobs(readers,
+                                                                 ndxnames,
+                                                                 procs)):
+            segment = codec.new_segment(storage, slicename)
+            jobs.append(segment)
+            jobqueue.put((num, fieldname, start, end, segment))
+
+        for _ in xrange(min(procs, len(jobs))):
+            jobqueue.put(None)
+            task = MergeSliceTask(storage, schema, codec, segments, jobqueue,
+                                  resultqueue)
+            tasks.append(task)
+            task.start()
+
+        # While the tasks merge the postings, write the per-document
+        # information in this process
+        for reader in readers:
+            mwriter.write_per_doc(fieldnames, reader)
+        mwriter.perdocwriter.close()
+
+        # Wait for the slices
+        results = dict(collect_results(tasks, resultqueue, len(jobs)))
+        for task in tasks:
+            task.join()
+        if len(results) < len(jobs):
+            raise IndexingError("A merge process failed")
+
+        # Stitch the slices together in order
+        fieldwriter = mwriter.fieldwriter
+        for num in xrange(len(jobs)):
+            fieldwriter.append_slice(storage, results[num])
+        mwriter._close_segment()
+        mwriter._assemble_segment()
+        return mwriter.get_segment()
+    except Exception:
+        for task in tasks:
+            if task.is_alive():
+                task.terminate()
+        mwriter._close_segment()
+        raise
+    finally:
+        # Don't call mwriter._finish(), since it would remove the temporary
+        # storage the committing writer is still using
+        mwriter.is_closed = True
+        for reader in readers:
+            reader.close()
+        for segment in jobs:
+            for name in segment.list_files(storage):
+                storage.delete_file(name)
+
+
+# Parallel analysis
+
+# The schema used by the analysis functions in a worker process
+_analysis_schema = None
+
+
+def _init_analysis(schema):
+    global _analysis_schema
+    _analysis_schema = schema
+
+
+def _analyze_batch(batch):
+    schema = _analysis_schema
+    return [analyze_document(schema, fields) for fields in batch]
+
+
+class AnalysisPool(object):
+    """Analyzes (tokenizes, filters, etc.) documents for a
+    :class:`whoosh.writing.SegmentWriter` in a pool of worker processes, so
+    the writer only has to add the results to its posting pool and write the
+    per-document information. This is used when you create a writer with
+    ``analysisprocs`` greater than 1::
+
+        with ix.writer(analysisprocs=4) as w:
+            for doc in docs:
+                w.add_document(**doc)
+
+    Unlike ``ix.writer(procs=4)``, this writes a single segment without
+    having to merge the results of several sub-writers. The field values
+    (and the schema's analyzers) must be picklable.
+    """
+
+    def __init__(self, schema, procs=None, batchsize=100, maxpending=None):
+        """
+        :param schema: the schema of the index.
+        :param procs: the number of worker processes. The default is the
+            number of CPUs.
+        :param batchsize: the number of documents to send to a worker at a
+            time.
+        :param maxpending: the maximum number of batches being analyzed at
+            once. When this many are pending, :meth:`add` waits for the oldest
+            one to finish. The default is twice the number of processes.
+        """
+
+        procs = procs or cpu_count()
+        self.pool = Pool(procs, _init_analysis, (schema,))
+        self.batchsize = batchsize
+        self.maxpending = maxpending or procs * 2
+        self.buffer = []
+        # A queue of (batch, AsyncResult) pairs in the order the batches were
+        # submitted
+        self.pending = deque()
+
+    def __len__(self):
+        # The number of documents that have been added but not yet returned
+        return len(self.buffer) + sum(len(batch) for batch, _ in self.pending)
+
+    def _submit(self):
+        batch = self.buffer
+        self.buffer = []
+        result = self.pool.apply_async(_analyze_batch, (batch,))
+        self.pending.append((batch, result))
+
+    def _pop(self):
+        batch, result = self.pending.popleft()
+        return izip(batch, result.get())
+
+    def add(self, fields):
+        """Adds a document to be analyzed, and returns a list of
+        ``(fields, analyzed)`` pairs for the documents that are finished, in
+        the order they were added, where ``analyzed`` is the return value of
+        :func:`whoosh.writing.analyze_document`.
+        """
+
+        self.buffer.append(fields)
+        if len(self.buffer) >= self.batchsize:
+            self._submit()
+
+        done = []
+        pending = self.pending
+        while pending and (pending[0][1].ready() or
+                           len(pending) > self.maxpending):
+            done.extend(self._pop())
+        return done
+
+    def finish(self):
+        """Waits for all documents to be analyzed, shuts down the worker
+        processes, and returns a list of ``(fields, analyzed)`` pairs for the
+        remaining documents.
+        """
+
+        if self.buffer:
+            self._submit()
+        done = []
+        while self.pending:
+            done.extend(self._pop())
+        self.pool.close()
+        self.pool.join()
+        return done
+
+    def terminate(self):
+        """Stops the worker processes without waiting for them to finish.
+        """
+
+        self.pool.terminate()
+        self.pool.join()
+
+
 # For compatibility with old multiproc module
 class MultiSegmentWriter(MpWriter):
     def __init__(self, *args, **kwargs):
@@ -290,7 +290,11 @@ class Or(CompoundQuery):
     DEFAULT_MATCHER = 1  # Use a binary tree of UnionMatchers
     SPLIT_MATCHER = 2  # Use a different strategy for short and long queries
     ARRAY_MATCHER = 3  # Use a matcher that pre-loads docnums and scores
+    WAND_MATCHER = 4  # Use a WAND matcher that skips low-scoring documents
     matcher_type = AUTO_MATCHER
+    # The automatic heuristics use a WAND matcher for at least this many
+    # clauses in a scored search
+    WAND_MIN_CLAUSES = 3
 
     def __init__(self, subqueries, boost=1.0, minmatch=0, scale=None):
         """
@@ -339,11 +343,19 @@ class Or(CompoundQuery):
 
         if matcher_type == self.AUTO_MATCHER:
             dc = searcher.doc_count_all()
-            if (len(subs) < self.TOO_MANY_CLAUSES
-                and (needs_current
-                     or self.scale
-                     or len(subs) == 2
-                     or dc > 5000)):
+            if (self.WAND_MIN_CLAUSES <= len(subs) < self.TOO_MANY_CLAUSES
+                and weighting is not None
+                and not weighting.use_final
+                and not self.scale
+                and (needs_current or dc > 5000)):
+                # For long scored queries, use a matcher that can skip
+                # documents that won't make it into the top N
+                matcher_type = self.WAND_MATCHER
+            elif (len(subs) < self.TOO_MANY_CLAUSES
+                  and (needs_current
+                       or self.scale
+                       or len(subs) == 2
+                       or dc > 5000)):
                 # If the parent matcher needs the current match, or there's just
                 # two sub-matchers, use the standard binary tree of Unions
                 matcher_type = self.DEFAULT_MATCHER
@@ -362,6 +374,10 @@ class Or(CompoundQuery):
         elif matcher_type == self.ARRAY_MATCHER:
             # Implementation that pre-loads docnums and scores into an array
             cls = PreloadedOr
+        elif matcher_type == self.WAND_MATCHER:
+            # Implementation that skips non-competitive documents using the
+            # maximum qualities of the sub-matchers
+            cls = WandOr
         else:
             raise ValueError("Unknown matcher_type %r" % self.matcher_type)
 
@@ -386,6 +402,26 @@ class DefaultOr(Or):
         return m
 
 
+class WandOr(DefaultOr):
+    JOINT = " wOR "
+
+    def _matcher(self, subs, searcher, context):
+        weighting = context.weighting if context else searcher.weighting
+        if weighting is None or weighting.use_final or self.scale:
+            # WAND only helps when the collector is looking for the top scores
+            return DefaultOr._matcher(self, subs, searcher, context)
+
+        ms = [q.matcher(searcher, context) for q in subs]
+        if not all(m.supports_block_quality() for m in ms):
+            # WAND needs the sub-matchers' maximum qualities to skip documents
+            m = make_binary_tree(matching.UnionMatcher, ms)
+            if self.boost != 1.0:
+                m = matching.WrappingMatcher(m, self.boost)
+            return m
+
+        return matching.WandMatcher(ms, boost=self.boost)
+
+
 class SplitOr(Or):
     JOINT = " sOr "
     SPLIT_DOC_LIMIT = 8000
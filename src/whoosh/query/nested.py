@@ -295,6 +295,10 @@ class NestedChildren(WrappingQuery):
                                    self.parent_comb,
                                    self.child)
 
+        def block_max_id(self):
+            # The IDs of this matcher aren't related to the child's blocks
+            return None
+
         def reset(self):
             self.child.reset()
             self._reset()
@@ -33,6 +33,7 @@ from collections import defaultdict
 
 from whoosh import matching
 from whoosh.analysis import Token
+from whoosh.automata import glob, reg
 from whoosh.compat import bytes_type, text_type, u
 from whoosh.lang.morph_en import variations
 from whoosh.query import qcore
@@ -272,10 +273,24 @@ class PatternQuery(MultiTerm):
                 break
         return text[:i]
 
+    def _get_automaton(self):
+        # Subclasses can return a DFA that accepts every term the pattern
+        # matches, to find the candidate terms by running the automaton over
+        # the term index instead of checking every term with the prefix
+        return None
+
     def _btexts(self, ixreader):
         field = ixreader.schema[self.fieldname]
 
         exp = re.compile(self._get_pattern())
+        dfa = self._get_automaton()
+        if dfa is not None:
+            to_bytes = field.to_bytes
+            for text in ixreader.automaton_terms(self.fieldname, dfa):
+                if exp.match(text):
+                    yield to_bytes(text)
+            return
+
         prefix = self._find_prefix(self.text)
         if prefix:
             candidates = ixreader.expand_prefix(self.fieldname, prefix)
@@ -330,6 +345,13 @@ class Wildcard(PatternQuery):
     def _get_pattern(self):
         return fnmatch.translate(self.text)
 
+    def _get_automaton(self):
+        # The glob automaton doesn't understand ranges or negated sets, so
+        # only use it for patterns with * and ? wildcards
+        if "[" in self.text:
+            return None
+        return glob.glob_automaton(self.text).to_dfa()
+
     def normalize(self):
         # If there are no wildcard characters in this "wildcard", turn it into
         # a simple Term
@@ -375,6 +397,12 @@ class Regex(PatternQuery):
     def _get_pattern(self):
         return self.text
 
+    def _get_automaton(self):
+        try:
+            return reg.regex_automaton(self.text).to_dfa()
+        except ValueError:
+            return None
+
     def _find_prefix(self, text):
         if "|" in text:
             return ""
@@ -28,17 +28,20 @@
 """This module contains classes that allow reading from an index.
 """
 
+from array import array
 from math import log
 from bisect import bisect_right
+from collections import defaultdict
 from heapq import heapify, heapreplace, heappop, nlargest
 
 from whoosh import columns
 from whoosh.compat import abstractmethod
-from whoosh.compat import xrange, zip_, next, iteritems
+from whoosh.compat import izip, xrange, zip_, next, iteritems
 from whoosh.filedb.filestore import OverlayStorage
 from whoosh.matching import MultiMatcher
 from whoosh.support.levenshtein import distance
 from whoosh.system import emptybytes
+from whoosh.util.numeric import length_table
 
 
 # Exceptions
@@ -333,15 +336,30 @@ class IndexReader(object):
         raise NotImplementedError
 
     @abstractmethod
-    def stored_fields(self, docnum):
+    def stored_fields(self, docnum, fieldnames=None):
         """Returns the stored fields for the given document number.
 
-        :param numerickeys: use field numbers as the dictionary keys instead of
-            field names.
+        :param fieldnames: if not None, a list of the names of the fields to
+            return. Other stored fields are left out of the dictionary, and
+            depending on the codec, their values may not be loaded at all,
+            which is much faster when a document has large stored fields you
+            don't need.
         """
 
         raise NotImplementedError
 
+    def stored_fields_many(self, docnums, fieldnames=None):
+        """Returns a list of the stored fields dictionaries for the given
+        document numbers, in the same order. This can be much faster than
+        calling :meth:`IndexReader.stored_fields` for each document, since the
+        reader can load the stored fields of nearby documents together.
+
+        :param fieldnames: if not None, a list of the names of the fields to
+            return (see :meth:`IndexReader.stored_fields`).
+        """
+
+        return [self.stored_fields(docnum, fieldnames) for docnum in docnums]
+
     def all_stored_fields(self):
         """Yields the stored fields for all non-deleted documents.
         """
@@ -407,6 +425,30 @@ class IndexReader(object):
         """
         raise NotImplementedError
 
+    def doc_length_bytes(self, fieldname):
+        """Returns a sequence containing the encoded length byte of the given
+        field in each document, indexed by document number, or None if this
+        reader can't provide one. Use :data:`whoosh.util.numeric.length_table`
+        to convert the bytes to approximate lengths. Scorers use this to look
+        up the lengths for many postings without a method call per document.
+        The default implementation returns None.
+        """
+
+        return None
+
+    def bm25_norms(self, fieldname, avgfl, B, K1):
+        """Returns a sequence of 256 BM25 length normalization factors, one for
+        each length byte returned by :meth:`IndexReader.doc_length_bytes`, or
+        None if this reader doesn't have length bytes for the field.
+
+        :param fieldname: the name of the field.
+        :param avgfl: the average length of the field across the collection.
+        :param B: the BM25 ``B`` parameter.
+        :param K1: the BM25 ``K1`` parameter.
+        """
+
+        return None
+
     def first_id(self, fieldname, text):
         """Returns the first ID in the posting list for the given term. This
         may be optimized in certain backends.
@@ -540,6 +582,22 @@ class IndexReader(object):
             if k <= maxdist:
                 yield word
 
+    def automaton_terms(self, fieldname, dfa):
+        """Yields the terms in the given field (as unicode strings, in order)
+        that are accepted by the given :class:`whoosh.automata.fsa.DFA`.
+
+        >>> from whoosh.automata.glob import glob_automaton
+        >>> dfa = glob_automaton(u"r*ing").to_dfa()
+        >>> list(reader.automaton_terms("content", dfa))
+        [u"reading", u"ring", u"rolling"]
+        """
+
+        fieldobj = self.schema[fieldname]
+        for btext in self.lexicon(fieldname):
+            text = fieldobj.from_bytes(btext)
+            if dfa.accept(text):
+                yield text
+
     def most_frequent_terms(self, fieldname, number=5, prefix=''):
         """Returns the top 'number' most frequent terms in the given field as a
         list of (frequency, text) tuples.
@@ -567,6 +625,20 @@ class IndexReader(object):
 
         return [(self, 0)]
 
+    def share_postings(self, share):
+        """While ``share`` is True, the reader may remember term info lookups
+        and decoded posting blocks, so running many queries that use the same
+        terms doesn't repeat the work. Call this method again with ``False`` to
+        free the cached data. Calls can be nested (for example, by several
+        searchers sharing the reader), and the cached data is freed when each
+        call with ``True`` has been matched by a call with ``False``. The
+        default implementation does nothing.
+
+        This is used by :meth:`whoosh.searching.Searcher.search_many`.
+        """
+
+        pass
+
     def supports_caches(self):
         return False
 
@@ -620,6 +692,9 @@ class SegmentReader(IndexReader):
         self._terms = self._codec.terms_reader(self._storage, segment)
         self._perdoc = self._codec.per_document_reader(self._storage, segment)
 
+        # Cache of BM25 normalization tables, see bm25_norms()
+        self._bm25norms = {}
+
     def codec(self):
         return self._codec
 
@@ -665,6 +740,9 @@ class SegmentReader(IndexReader):
         text = self._text_to_bytes(fieldname, text)
         return (fieldname, text) in self._terms
 
+    def share_postings(self, share):
+        self._terms.share_postings(share)
+
     def close(self):
         if self.is_closed:
             raise ReaderClosed("Reader already closed")
@@ -678,14 +756,32 @@ class SegmentReader(IndexReader):
 
         self.is_closed = True
 
-    def stored_fields(self, docnum):
+    def _filter_stored(self, sfs, fieldnames):
+        # Double-check with schema to filter out removed fields. The per-doc
+        # reader may treat the list of field names as a hint and return other
+        # fields too, so filter those out here as well
+        schema = self.schema
+        if fieldnames is not None:
+            return dict(item for item in iteritems(sfs)
+                        if item[0] in fieldnames and item[0] in schema)
+        return dict(item for item in iteritems(sfs) if item[0] in schema)
+
+    def stored_fields(self, docnum, fieldnames=None):
         if self.is_closed:
             raise ReaderClosed
         assert docnum >= 0
-        schema = self.schema
-        sfs = self._perdoc.stored_fields(docnum)
-        # Double-check with schema to filter out removed fields
-        return dict(item for item in iteritems(sfs) if item[0] in schema)
+        if fieldnames is not None:
+            fieldnames = frozenset(fieldnames)
+        sfs = self._perdoc.stored_fields(docnum, fieldnames)
+        return self._filter_stored(sfs, fieldnames)
+
+    def stored_fields_many(self, docnums, fieldnames=None):
+        if self.is_closed:
+            raise ReaderClosed
+        if fieldnames is not None:
+            fieldnames = frozenset(fieldnames)
+        return [self._filter_stored(sfs, fieldnames) for sfs
+                in self._perdoc.stored_fields_many(docnums, fieldnames)]
 
     # Delegate doc methods to the per-doc reader
 
@@ -724,6 +820,23 @@ class SegmentReader(IndexReader):
             raise ReaderClosed
         return self._perdoc.doc_field_length(docnum, fieldname, default)
 
+    def doc_length_bytes(self, fieldname):
+        if self.is_closed:
+            raise ReaderClosed
+        return self._perdoc.doc_length_bytes(fieldname)
+
+    def bm25_norms(self, fieldname, avgfl, B, K1):
+        key = (fieldname, avgfl, B, K1)
+        if key in self._bm25norms:
+            return self._bm25norms[key]
+
+        norms = None
+        if self.doc_length_bytes(fieldname) is not None:
+            norms = array("d", (K1 * ((1 - B) + B * length / float(avgfl))
+                                for length in length_table))
+        self._bm25norms[key] = norms
+        return norms
+
     def has_vector(self, docnum, fieldname):
         if self.is_closed:
             raise ReaderClosed
@@ -837,6 +950,17 @@ class SegmentReader(IndexReader):
         fieldobj = self.schema[fieldname]
         return self._terms.cursor(fieldname, fieldobj)
 
+    def automaton_terms(self, fieldname, dfa):
+        self._test_field(fieldname)
+        auto = self._codec.automata(self._storage, self._segment)
+        try:
+            fieldcur = self.cursor(fieldname)
+        except NotImplementedError:
+            # The codec can't give us a cursor, so fall back to checking every
+            # term in the field
+            return IndexReader.automaton_terms(self, fieldname, dfa)
+        return auto.find_matches(dfa, fieldcur)
+
     def terms_within(self, fieldname, text, maxdist, prefix=0):
         # Replaces the horribly inefficient base implementation with one based
         # on skipping through the word list efficiently using a DFA
@@ -844,8 +968,8 @@ class SegmentReader(IndexReader):
         fieldobj = self.schema[fieldname]
         spellfield = fieldobj.spelling_fieldname(fieldname)
         auto = self._codec.automata(self._storage, self._segment)
-        fieldcur = self.cursor(spellfield)
-        return auto.terms_within(fieldcur, text, maxdist, prefix)
+        dfa = auto.levenshtein_dfa(text, maxdist, prefix)
+        return self.automaton_terms(spellfield, dfa)
 
     # Column methods
 
@@ -929,7 +1053,7 @@ class EmptyReader(IndexReader):
     def is_deleted(self, docnum):
         return False
 
-    def stored_fields(self, docnum):
+    def stored_fields(self, docnum, fieldnames=None):
         raise KeyError("No document number %s" % docnum)
 
     def all_stored_fields(self):
@@ -1018,6 +1142,10 @@ class MultiReader(IndexReader):
         self.doc_offsets.append(self.base)
         self.base += reader.doc_count_all()
 
+    def share_postings(self, share):
+        for r in self.readers:
+            r.share_postings(share)
+
     def close(self):
         for d in self.readers:
             d.close()
@@ -1104,6 +1232,15 @@ class MultiReader(IndexReader):
         return self._merge_terms([r.terms_from(fieldname, prefix)
                                   for r in self.readers])
 
+    def automaton_terms(self, fieldname, dfa):
+        return self._merge_terms([r.automaton_terms(fieldname, dfa)
+                                  for r in self.readers])
+
+    def terms_within(self, fieldname, text, maxdist, prefix=0):
+        return self._merge_terms([r.terms_within(fieldname, text, maxdist,
+                                                 prefix=prefix)
+                                  for r in self.readers])
+
     def term_info(self, fieldname, text):
         term = (fieldname, text)
 
@@ -1166,9 +1303,26 @@ class MultiReader(IndexReader):
         segmentnum, segmentdoc = self._segment_and_docnum(docnum)
         return self.readers[segmentnum].is_deleted(segmentdoc)
 
-    def stored_fields(self, docnum):
+    def stored_fields(self, docnum, fieldnames=None):
         segmentnum, segmentdoc = self._segment_and_docnum(docnum)
-        return self.readers[segmentnum].stored_fields(segmentdoc)
+        return self.readers[segmentnum].stored_fields(segmentdoc, fieldnames)
+
+    def stored_fields_many(self, docnums, fieldnames=None):
+        # Group the document numbers by sub-reader
+        docnums = list(docnums)
+        bysegment = defaultdict(list)
+        for i, docnum in enumerate(docnums):
+            segmentnum, segmentdoc = self._segment_and_docnum(docnum)
+            bysegment[segmentnum].append((i, segmentdoc))
+
+        results = [None] * len(docnums)
+        for segmentnum, items in iteritems(bysegment):
+            reader = self.readers[segmentnum]
+            sfs = reader.stored_fields_many([docnum for _, docnum in items],
+                                            fieldnames)
+            for (i, _), fields in izip(items, sfs):
+                results[i] = fields
+        return results
 
     # Columns
 
@@ -33,6 +33,13 @@ from __future__ import division
 from math import log, pi
 
 from whoosh.compat import iteritems
+from whoosh.util import overrides_together
+from whoosh.util.numeric import length_table
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 # Base classes
@@ -109,6 +116,29 @@ class BaseScorer(object):
 
         raise NotImplementedError(self.__class__.__name__)
 
+    def supports_score_block(self):
+        """Returns True if this class implements :meth:`BaseScorer.score_block`.
+
+        Subclasses that implement ``score_block()`` should only return True if
+        ``score_block()`` gives the same scores as ``score()``, for example by
+        returning False if a subclass overrides ``score()`` but not
+        ``score_block()``.
+        """
+
+        return False
+
+    def score_block(self, ids, weights):
+        """Returns a sequence of scores for the postings with the given IDs
+        and weights, for example the postings in a matcher's current block.
+        This lets matchers that accumulate scores for many documents at a time
+        avoid calling :meth:`BaseScorer.score` for every posting. The return
+        value may be a NumPy array if NumPy is available.
+
+        Only available if :meth:`BaseScorer.supports_score_block` returns True.
+        """
+
+        raise NotImplementedError(self.__class__.__name__)
+
     def max_quality(self):
         """Returns the *maximum limit* on the possible score the matcher can
         give. This can be an estimate and not necessarily the actual maximum
@@ -150,6 +180,12 @@ class WeightScorer(BaseScorer):
     def score(self, matcher):
         return matcher.weight()
 
+    def supports_score_block(self):
+        return overrides_together(self, "score", "score_block")
+
+    def score_block(self, ids, weights):
+        return weights
+
     def max_quality(self):
         return self._maxweight
 
@@ -172,8 +208,15 @@ class WeightLengthScorer(BaseScorer):
     the score for a document with the given weight and length, and call the
     ``setup()`` method at the end of the initializer to set up common
     attributes.
+
+    If a subclass's ``_score()`` method only uses arithmetic operators, so it
+    also works element-wise on NumPy arrays of weights and lengths, it can set
+    the ``array_score`` attribute to True to let :meth:`score_block` score
+    whole arrays at once when NumPy is available.
     """
 
+    array_score = False
+
     def setup(self, searcher, fieldname, text):
         """Initializes the scorer and then does the busy work of
         adding the ``dfl()`` function and maximum quality attribute.
@@ -201,13 +244,54 @@ class WeightLengthScorer(BaseScorer):
             return WeightScorer(ti.max_weight())
 
         self.dfl = lambda docid: searcher.doc_field_length(docid, fieldname, 1)
+        # The length byte of the field in every document, if the reader has
+        # them, so lengths can be looked up without a method call
+        self._lengthbytes = searcher.reader().doc_length_bytes(fieldname)
+        self._nplengthbytes = None
         self._maxquality = self._score(ti.max_weight(), ti.min_length())
 
     def supports_block_quality(self):
         return True
 
     def score(self, matcher):
-        return self._score(matcher.weight(), self.dfl(matcher.id()))
+        lbytes = self._lengthbytes
+        if lbytes is None:
+            length = self.dfl(matcher.id())
+        else:
+            length = length_table[lbytes[matcher.id()]]
+        return self._score(matcher.weight(), length)
+
+    def supports_score_block(self):
+        # score_block() uses _score(), so it's only valid if score() wasn't
+        # overridden to do something else
+        return overrides_together(self, "score", "score_block")
+
+    def _block_length_bytes(self, ids):
+        # Returns a NumPy array of the length bytes of the given documents
+        nplbytes = self._nplengthbytes
+        if nplbytes is None:
+            # View the length bytes without copying them
+            nplbytes = numpy.frombuffer(self._lengthbytes, dtype=numpy.uint8)
+            self._nplengthbytes = nplbytes
+        return nplbytes[numpy.asarray(ids)]
+
+    def score_block(self, ids, weights):
+        lbytes = self._lengthbytes
+        if numpy is not None and self.array_score:
+            if lbytes is None:
+                dfl = self.dfl
+                lens = numpy.array([dfl(docid) for docid in ids], dtype=float)
+            else:
+                lens = _np_length_table()[self._block_length_bytes(ids)]
+            return self._score(numpy.asarray(weights, dtype=float), lens)
+
+        if lbytes is None:
+            dfl = self.dfl
+            lens = [dfl(docid) for docid in ids]
+        else:
+            lens = [length_table[lbytes[docid]] for docid in ids]
+        _score = self._score
+        return [_score(w, length) for w, length in zip(weights, lens)]
 
     def max_quality(self):
         return self._maxquality
@@ -221,6 +305,17 @@ class WeightLengthScorer(BaseScorer):
         raise NotImplementedError(self.__class__.__name__)
 
 
+_np_table = None
+
+
+def _np_length_table():
+    # Returns length_table as a NumPy array of floats
+    global _np_table
+    if _np_table is None:
+        _np_table = numpy.array(length_table, dtype=float)
+    return _np_table
+
+
 # WeightingModel implementations
 
 # Debugging model
@@ -315,6 +410,9 @@ class BM25F(WeightingModel):
 
 
 class BM25FScorer(WeightLengthScorer):
+    # bm25() only uses arithmetic, so it works on NumPy arrays
+    array_score = True
+
     def __init__(self, searcher, fieldname, text, B, K1, qf=1):
         # IDF and average field length are global statistics, so get them from
         # the top-level searcher
@@ -327,10 +425,48 @@ class BM25FScorer(WeightLengthScorer):
         self.qf = qf
         self.setup(searcher, fieldname, text)
 
+        # Table of the length normalization part of the BM25 formula for each
+        # length byte (not used if a subclass changed the formula)
+        self._norms = None
+        if (self._lengthbytes is not None
+                and getattr(self._score, "__func__", None)
+                is BM25FScorer.__dict__["_score"]):
+            self._norms = searcher.reader().bm25_norms(fieldname, self.avgfl,
+                                                       B, K1)
+        self._npnorms = None
+
     def _score(self, weight, length):
         s = bm25(self.idf, weight, length, self.avgfl, self.B, self.K1)
         return s
 
+    def score(self, matcher):
+        norms = self._norms
+        if norms is None:
+            return WeightLengthScorer.score(self, matcher)
+
+        tf = matcher.weight()
+        norm = norms[self._lengthbytes[matcher.id()]]
+        return self.idf * ((tf * (self.K1 + 1)) / (tf + norm))
+
+    def score_block(self, ids, weights):
+        norms = self._norms
+        if norms is None:
+            return WeightLengthScorer.score_block(self, ids, weights)
+
+        idf = self.idf
+        k1plus = self.K1 + 1
+        if numpy is not None:
+            npnorms = self._npnorms
+            if npnorms is None:
+                npnorms = self._npnorms = numpy.frombuffer(norms)
+            tfs = numpy.asarray(weights, dtype=float)
+            blocknorms = npnorms[self._block_length_bytes(ids)]
+            return idf * ((tfs * k1plus) / (tfs + blocknorms))
+
+        lbytes = self._lengthbytes
+        return [idf * ((tf * k1plus) / (tf + norms[lbytes[docid]]))
+                for docid, tf in zip(ids, weights)]
+
 
 # DFree model
 
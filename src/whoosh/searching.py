@@ -31,8 +31,12 @@
 
 from __future__ import division
 import copy
+import sys
+import threading
 import weakref
+from contextlib import contextmanager
 from math import ceil
+from time import sleep
 
 from whoosh import classify, highlight, query, scoring
 from whoosh.compat import iteritems, itervalues, iterkeys, xrange
@@ -149,10 +153,11 @@ class Searcher(object):
                                  in self.leafreaders]
 
         # Copy attributes/methods from wrapped reader
-        for name in ("stored_fields", "all_stored_fields", "has_vector",
-                     "vector", "vector_as", "lexicon", "field_terms",
-                     "frequency", "doc_frequency", "term_info",
-                     "doc_field_length", "corrector", "iter_docs"):
+        for name in ("stored_fields", "stored_fields_many",
+                     "all_stored_fields", "has_vector", "vector", "vector_as",
+                     "lexicon", "field_terms", "frequency", "doc_frequency",
+                     "term_info", "doc_field_length", "corrector",
+                     "iter_docs"):
             setattr(self, name, getattr(self.ixreader, name))
 
     def __enter__(self):
@@ -729,7 +734,7 @@ class Searcher(object):
             c = collectors.FilterCollector(c, filter, mask)
         return c
 
-    def search(self, q, **kwargs):
+    def search(self, q, workers=None, **kwargs):
         """Runs a :class:`whoosh.query.Query` object on this searcher and
         returns a :class:`Results` object. See :doc:`/searching` for more
         information.
@@ -776,16 +781,129 @@ class Searcher(object):
             to control which documents are kept when collapsing. The default
             (``collapse_order=None``) uses the results order (e.g. the highest
             scoring documents in a scored search).
+        :param workers: if this is a number greater than 1 and the index has
+            more than one segment, search the segments in parallel using a
+            pool of this many threads, with a separate collector for each
+            segment, and then merge the collectors. Searches that use a
+            collector that can't be merged (for example with ``collapse``)
+            run sequentially.
+        :param stored_fields: a list of the names of the stored fields to load
+            for the hits in the results (see :attr:`Results.fieldnames`). The
+            default is to load all stored fields.
         :rtype: :class:`Results`
         """
 
+        fieldnames = kwargs.pop("stored_fields", None)
+        if workers and workers > 1 and len(self.leaf_searchers()) > 1:
+            cs = self._parallel_search([q], workers, kwargs)
+            if cs is not None:
+                return self._results(cs[0], fieldnames)
+
         # Call the collector() method to build a collector based on the
         # parameters passed to this method
         c = self.collector(**kwargs)
         # Call the lower-level method to run the collector
         self.search_with_collector(q, c)
         # Return the results object from the collector
-        return c.results()
+        return self._results(c, fieldnames)
+
+    def _results(self, collector, fieldnames):
+        results = collector.results()
+        if fieldnames is not None:
+            results.fieldnames = list(fieldnames)
+        return results
+
+    def search_many(self, queries, workers=None, **kwargs):
+        """Runs a sequence of :class:`whoosh.query.Query` objects on this
+        searcher and returns a list of :class:`Results` objects, one for each
+        query, in the same order. This is faster than calling :meth:`search`
+        in a loop when many of the queries use the same terms, since the
+        readers remember term info lookups and decoded posting blocks for the
+        duration of the batch.
+
+        >>> qs = [query.Term("content", word) for word in words]
+        >>> for q, results in zip(qs, searcher.search_many(qs, limit=5)):
+        ...     print(q, len(results))
+
+        The keyword arguments are the same as for :meth:`Searcher.search`, and
+        apply to every query in the batch.
+
+        :param queries: a sequence of :class:`whoosh.query.Query` objects.
+        :param workers: if this is a number greater than 1 and the index has
+            more than one segment, use a pool of this many threads where each
+            thread runs all the queries on a single segment.
+        :rtype: list of :class:`Results`
+        """
+
+        queries = list(queries)
+        reader = self.reader()
+        reader.share_postings(True)
+        try:
+            if workers and workers > 1 and len(self.leaf_searchers()) > 1:
+                fieldnames = kwargs.get("stored_fields")
+                collectorkw = kwargs.copy()
+                collectorkw.pop("stored_fields", None)
+                cs = self._parallel_search(queries, workers, collectorkw)
+                if cs is not None:
+                    return [self._results(c, fieldnames) for c in cs]
+            return [self.search(q, **kwargs) for q in queries]
+        finally:
+            reader.share_postings(False)
+
+    def _parallel_search(self, queries, workers, kwargs):
+        # Runs a separate collector for each query on each segment using a
+        # thread pool, where each thread handles one segment, and merges the
+        # collectors for each query. Returns a list of the merged collectors,
+        # or None if the collector configured by the arguments can't be merged.
+
+        from multiprocessing.pool import ThreadPool
+
+        leaves = self.leaf_searchers()
+        context = self.context()
+
+        # Resolve the filter and mask once instead of in every collector
+        kwargs = kwargs.copy()
+        for name in ("filter", "mask"):
+            if kwargs.get(name):
+                kwargs[name] = self._filter_to_comb(kwargs[name])
+
+        # A list of collectors (one per query) for each segment
+        rows = []
+        for subsearcher, offset in leaves:
+            row = []
+            for q in queries:
+                c = self.collector(**kwargs)
+                c.prepare(self, q, context)
+                if not c.supports_merge():
+                    return None
+                # Create the matchers here rather than in the worker threads,
+                # since scorers may look up statistics in every segment
+                c.set_subsearcher(subsearcher, offset)
+                row.append(c)
+            rows.append(row)
+
+        def collect_row(row):
+            for c in row:
+                c.collect_matches()
+
+        pool = ThreadPool(min(workers, len(rows)))
+        try:
+            pool.map(collect_row, rows)
+        finally:
+            pool.close()
+            pool.join()
+
+        merged = []
+        for i in xrange(len(queries)):
+            first = rows[0][i]
+            for row in rows[1:]:
+                row[i].finish()
+                first.merge(row[i])
+            # The first collector was prepared first, so its run time covers
+            # the whole search
+            first.finish()
+            merged.append(first)
+        return merged
 
     def search_with_collector(self, q, collector, context=None):
         """Low-level method: runs a :class:`whoosh.query.Query` object on this
@@ -931,6 +1049,261 @@ class Searcher(object):
         return sqc.correct_query(q, qstring)
 
 
+# Searcher pool
+
+class SearcherManager(object):
+    """Hands out :class:`Searcher` objects for an index and keeps their
+    segment readers open between searches, so many threads (for example, the
+    workers of a web application) can search without opening the index files
+    and building the per-reader caches again for every request::
+
+        manager = SearcherManager(myindex)
+
+        # In each request
+        with manager.searcher() as s:
+            results = s.search(myquery)
+
+        # After the index changes (for example, on a timer)
+        manager.maybe_refresh()
+
+    Readers are not thread-safe, so each thread gets its own searcher with
+    its own segment readers. A thread gets the same searcher every time it
+    calls :meth:`SearcherManager.acquire` until the manager is refreshed. When
+    the index has changed, :meth:`SearcherManager.maybe_refresh` switches to
+    the latest generation of the index. The next time a thread acquires a
+    searcher, it keeps its readers for unchanged segments and only opens
+    readers for new segments (or segments with new deletions). Each segment
+    reader is reference counted, and is closed when the last searcher using it
+    has been released.
+
+    Searchers from the manager must be given back using
+    :meth:`SearcherManager.release` (or by using
+    :meth:`SearcherManager.searcher` as a context manager) instead of being
+    closed, and you can't call :meth:`Searcher.refresh` on them. Don't pass a
+    searcher to another thread.
+    """
+
+    def __init__(self, ix, weighting=scoring.BM25F):
+        """
+        :param ix: the :class:`whoosh.index.FileIndex` to search.
+        :param weighting: the weighting model to use for the searchers.
+        """
+
+        self.ix = ix
+        self.weighting = weighting
+        self.is_closed = False
+
+        # Lock protecting the reference counts
+        self._lock = threading.Lock()
+        # Lock making sure only one thread refreshes at a time
+        self._refreshlock = threading.Lock()
+        # Maps (thread ID, segment key) pairs to [reader, refcount] lists
+        self._readers = {}
+        # Maps id(searcher) to [searcher, reader keys, refcount] lists
+        self._searchers = {}
+        # Maps thread IDs to the searcher acquire() returns in that thread.
+        # The manager holds a reference to each of these searchers until the
+        # next refresh
+        self._current = {}
+        # The TOC of the generation of the index to search, and a counter
+        # that goes up each time it's replaced
+        self._toc = None
+        self._version = 0
+        self._gen = None
+
+        self.maybe_refresh()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def _segment_key(segment):
+        # A segment with the same ID can have different deletions in a later
+        # generation, and the reader gets its deletions from the segment
+        # object, so readers are only shared between identical deletions
+        return segment.segment_id(), frozenset(segment.deleted_docs())
+
+    def acquire(self):
+        """Returns the current searcher for the calling thread. You must pass
+        the searcher to :meth:`SearcherManager.release` when you're done with
+        it.
+        """
+
+        threadid = threading.current_thread().ident
+        retries = 10
+        while True:
+            with self._lock:
+                if self.is_closed:
+                    raise Exception("This SearcherManager is closed")
+                searcher = self._current.get(threadid)
+                if searcher is not None:
+                    self._searchers[id(searcher)][2] += 1
+                    return searcher
+                toc = self._toc
+                version = self._version
+
+            try:
+                searcher = self._open_searcher(threadid, toc)
+                break
+            except IOError:
+                # A writer may have deleted the files of the generation we
+                # were going to search since the manager was refreshed, so
+                # refresh and try again a few times before raising the
+                # exception
+                e = sys.exc_info()[1]
+                retries -= 1
+                if retries <= 0:
+                    raise e
+                sleep(0.05)
+                self.maybe_refresh()
+
+        with self._lock:
+            if version == self._version and not self.is_closed:
+                self._forget_dead_threads()
+                self._current[threadid] = searcher
+                # One reference for the caller and one held by the manager
+                self._searchers[id(searcher)][2] += 1
+            return searcher
+
+    def release(self, searcher):
+        """Gives back a searcher returned by :meth:`SearcherManager.acquire`.
+        You can't use the searcher after releasing it.
+        """
+
+        with self._lock:
+            self._decref_searcher(searcher)
+
+    @contextmanager
+    def searcher(self):
+        """Acquires a searcher for the duration of a ``with`` block::
+
+            with manager.searcher() as s:
+                ...
+        """
+
+        searcher = self.acquire()
+        try:
+            yield searcher
+        finally:
+            self.release(searcher)
+
+    def up_to_date(self):
+        """Returns True if the manager's searchers represent the latest
+        generation of the index.
+        """
+
+        return self._gen == self.ix.latest_generation()
+
+    def maybe_refresh(self):
+        """Switches to the latest version of the index, if the index has
+        changed. Returns True if the manager was refreshed. Searchers that were
+        acquired before the refresh stay valid until they are released.
+        """
+
+        with self._refreshlock:
+            if self.is_closed or self.up_to_date():
+                return False
+
+            toc = self.ix._read_toc()
+            with self._lock:
+                self._toc = toc
+                self._version += 1
+                self._gen = toc.generation
+                # Drop the manager's own references to the old searchers
+                self._drop_current(list(self._current))
+            return True
+
+    def _open_searcher(self, threadid, toc):
+        # Returns a new searcher for the given TOC using the calling thread's
+        # readers
+        from whoosh.reading import SegmentReader, MultiReader, EmptyReader
+
+        readers = []
+        keys = []
+        try:
+            for segment in toc.segments:
+                key = (threadid, self._segment_key(segment))
+                with self._lock:
+                    entry = self._readers.get(key)
+                    if entry is not None:
+                        entry[1] += 1
+                if entry is None:
+                    # Only this thread opens readers with its thread ID, so
+                    # there's no need to hold the lock while opening
+                    reader = SegmentReader(self.ix.storage, toc.schema,
+                                           segment, generation=toc.generation)
+                    entry = [reader, 1]
+                    with self._lock:
+                        self._readers[key] = entry
+                readers.append(entry[0])
+                keys.append(key)
+        except IOError:
+            with self._lock:
+                for key in keys:
+                    self._decref_reader(key)
+            raise
+
+        if not readers:
+            reader = EmptyReader(toc.schema)
+        elif len(readers) == 1:
+            reader = readers[0]
+        else:
+            reader = MultiReader(readers, generation=toc.generation)
+
+        # Don't give the searcher a reference to the index, since refreshing
+        # it directly would close the shared readers
+        searcher = Searcher(reader, weighting=self.weighting,
+                            closereader=False)
+        with self._lock:
+            self._searchers[id(searcher)] = [searcher, keys, 1]
+        return searcher
+
+    def _drop_current(self, threadids):
+        # Must be called with the lock held
+        for threadid in threadids:
+            self._decref_searcher(self._current.pop(threadid))
+
+    def _forget_dead_threads(self):
+        # Must be called with the lock held. Drops the manager's references
+        # to the searchers of threads that have finished
+        alive = set(t.ident for t in threading.enumerate())
+        self._drop_current([threadid for threadid in self._current
+                            if threadid not in alive])
+
+    def _decref_searcher(self, searcher):
+        # Must be called with the lock held
+        entry = self._searchers[id(searcher)]
+        entry[2] -= 1
+        if entry[2] == 0:
+            del self._searchers[id(searcher)]
+            searcher.is_closed = True
+            for key in entry[1]:
+                self._decref_reader(key)
+
+    def _decref_reader(self, key):
+        # Must be called with the lock held
+        entry = self._readers[key]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._readers[key]
+            entry[0].close()
+
+    def close(self):
+        """Closes the manager. Readers still in use by acquired searchers are
+        closed when the searchers are released.
+        """
+
+        with self._refreshlock:
+            with self._lock:
+                if self.is_closed:
+                    return
+                self.is_closed = True
+                self._drop_current(list(self._current))
+
+
 class Results(object):
     """This object is returned by a Searcher. This object represents the
     results of a search query. You can mostly use it as if it was a list of
@@ -962,6 +1335,9 @@ class Results(object):
         self.collector = None
         self._total = None
         self._char_cache = {}
+        # If this is not None, it's a list of the names of the stored fields
+        # to load for the hits
+        self.fieldnames = None
 
     def __repr__(self):
         return "<Top %s Results for %r runtime=%s>" % (len(self.top_n),
@@ -1028,13 +1404,24 @@ class Results(object):
 
         return ((docnum, score) for score, docnum in self.top_n)
 
-    def fields(self, n):
+    def fields(self, n, fieldnames=None):
         """Returns the stored fields for the document at the ``n`` th position
         in the results. Use :meth:`Results.docnum` if you want the raw
         document number instead of the stored fields.
+
+        >>> results.fields(0, fieldnames=["title", "url"])
+        {"title": u"Rendering the scene", "url": u"/render"}
+
+        :param fieldnames: if not None, a list of the names of the stored
+            fields to return. If you don't pass this argument, the method uses
+            the ``fieldnames`` attribute of this object (set by the
+            ``stored_fields`` keyword argument to :meth:`Searcher.search`),
+            and if that is None too, it returns all the stored fields.
         """
 
-        return self.searcher.stored_fields(self.top_n[n][1])
+        if fieldnames is None:
+            fieldnames = self.fieldnames
+        return self.searcher.stored_fields(self.top_n[n][1], fieldnames)
 
     def facet_names(self):
         """Returns the available facet names, for use with the ``groups()``
@@ -1365,6 +1752,11 @@ class Hit(object):
     "Rendering the scene"
     >>> r[0].keys()
     ["title"]
+
+    If the results only load some of the stored fields (see the
+    ``stored_fields`` keyword argument to :meth:`Searcher.search`), the
+    dictionary only has those fields, but you can still get the value of any
+    other stored field using ``hit[fieldname]``, which loads it on its own.
     """
 
     def __init__(self, results, docnum, pos=None, score=None):
@@ -1390,9 +1782,18 @@ class Hit(object):
         """
 
         if self._fields is None:
-            self._fields = self.searcher.stored_fields(self.docnum)
+            self._fields = self.searcher.stored_fields(self.docnum,
+                                                       self.results.fieldnames)
         return self._fields
 
+    def _unloaded_field(self, fieldname):
+        # Returns a dictionary containing the given stored field if it exists
+        # but was left out of the fields loaded by fields()
+        fieldnames = self.results.fieldnames
+        if fieldnames is None or fieldname in fieldnames:
+            return {}
+        return self.searcher.stored_fields(self.docnum, [fieldname])
+
     def matched_terms(self):
         """Returns the set of ``("fieldname", "text")`` tuples representing
         terms from the query that matched in this document. You can
@@ -1505,6 +1906,10 @@ class Hit(object):
         if fieldname in self.fields():
             return self._fields[fieldname]
 
+        unloaded = self._unloaded_field(fieldname)
+        if fieldname in unloaded:
+            return unloaded[fieldname]
+
         reader = self.reader
         if reader.has_column(fieldname):
             cr = reader.column_reader(fieldname)
@@ -1514,7 +1919,8 @@ class Hit(object):
 
     def __contains__(self, key):
         return (key in self.fields()
-                or self.reader.has_column(key))
+                or self.reader.has_column(key)
+                or key in self._unloaded_field(key))
 
     def items(self):
         return list(self.fields().items())
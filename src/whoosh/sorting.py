@@ -737,7 +737,7 @@ class StoredFieldFacet(FacetType):
             self.segment_searcher = segment_searcher
 
         def keys_for(self, matcher, docid):
-            d = self.segment_searcher.stored_fields(docid)
+            d = self.segment_searcher.stored_fields(docid, [self.fieldname])
             value = d.get(self.fieldname)
             if self.split_fn:
                 return self.split_fn(value)
@@ -745,7 +745,7 @@ class StoredFieldFacet(FacetType):
                 return value.split()
 
         def key_for(self, matcher, docid):
-            d = self.segment_searcher.stored_fields(docid)
+            d = self.segment_searcher.stored_fields(docid, [self.fieldname])
             return d.get(self.fieldname)
 
 
@@ -968,6 +968,9 @@ class FacetMap(object):
         myfacet = FieldFacet("size", maptype=Count)
     """
 
+    # True if this class implements merge()
+    mergeable = False
+
     def add(self, groupname, docid, sortkey):
         """Adds a document to the facet results.
 
@@ -979,6 +982,14 @@ class FacetMap(object):
 
         raise NotImplementedError
 
+    def merge(self, other):
+        """Adds the groups recorded in another facet map of the same type to
+        this object. This is used to combine the groups found by searching
+        different segments in parallel.
+        """
+
+        raise NotImplementedError
+
     def as_dict(self):
         """Returns a dictionary object mapping group names to
         implementation-specific values. For example, the value might be a list
@@ -1003,9 +1014,15 @@ class OrderedList(FacetMap):
     def __repr__(self):
         return "<%s %r>" % (self.__class__.__name__, self.dict)
 
+    mergeable = True
+
     def add(self, groupname, docid, sortkey):
         self.dict[groupname].append((sortkey, docid))
 
+    def merge(self, other):
+        for key, items in iteritems(other.dict):
+            self.dict[key].extend(items)
+
     def as_dict(self):
         d = {}
         for key, items in iteritems(self.dict):
@@ -1029,9 +1046,15 @@ class UnorderedList(FacetMap):
     def __repr__(self):
         return "<%s %r>" % (self.__class__.__name__, self.dict)
 
+    mergeable = True
+
     def add(self, groupname, docid, sortkey):
         self.dict[groupname].append(docid)
 
+    def merge(self, other):
+        for key, docids in iteritems(other.dict):
+            self.dict[key].extend(docids)
+
     def as_dict(self):
         return dict(self.dict)
 
@@ -1049,9 +1072,15 @@ class Count(FacetMap):
     def __repr__(self):
         return "<%s %r>" % (self.__class__.__name__, self.dict)
 
+    mergeable = True
+
     def add(self, groupname, docid, sortkey):
         self.dict[groupname] += 1
 
+    def merge(self, other):
+        for key, count in iteritems(other.dict):
+            self.dict[key] += count
+
     def as_dict(self):
         return dict(self.dict)
 
@@ -1071,11 +1100,17 @@ class Best(FacetMap):
     def __repr__(self):
         return "<%s %r>" % (self.__class__.__name__, self.bestids)
 
+    mergeable = True
+
     def add(self, groupname, docid, sortkey):
         if groupname not in self.bestids or sortkey < self.bestkeys[groupname]:
             self.bestids[groupname] = docid
             self.bestkeys[groupname] = sortkey
 
+    def merge(self, other):
+        for groupname, docid in iteritems(other.bestids):
+            self.add(groupname, docid, other.bestkeys[groupname])
+
     def as_dict(self):
         return self.bestids
 
@@ -114,6 +114,22 @@ def fib(n):
     return result
 
 
+def overrides_together(obj, method, fastmethod):
+    """Returns True if the class of ``obj`` defines ``fastmethod`` in the same
+    class as ``method`` or in a subclass of it. Base classes use this to check
+    whether a faster bulk version of a method (``fastmethod``) is still
+    equivalent to ``method``, or whether a subclass has overridden ``method``
+    without also overriding ``fastmethod``.
+    """
+
+    def defined_in(name):
+        for cls in type(obj).__mro__:
+            if name in cls.__dict__:
+                return cls
+
+    return issubclass(defined_in(fastmethod), defined_in(method))
+
+
 # Decorators
 
 def synchronized(func):
@@ -315,3 +315,7 @@ def length_to_byte(length):
         return bisect_left(_length_byte_cache, length)
 
 byte_to_length = _length_byte_cache.__getitem__
+
+# The approximate length associated with each of the 256 length bytes, for code
+# that converts many length bytes at once
+length_table = _length_byte_cache
@@ -1,7 +1,9 @@
 from array import array
+from binascii import hexlify, unhexlify
+from bisect import bisect_right
 
-from whoosh.compat import xrange
-from whoosh.system import emptybytes
+from whoosh.compat import array_frombytes, array_tobytes, b, xrange
+from whoosh.system import IS_LITTLE, emptybytes
 from whoosh.system import pack_byte, unpack_byte
 from whoosh.system import pack_ushort_le, unpack_ushort_le
 from whoosh.system import pack_uint_le, unpack_uint_le
@@ -14,11 +16,15 @@ def delta_encode(nums):
         base = n
 
 
-def delta_decode(nums):
-    base = 0
-    for n in nums:
-        base += n
-        yield base
+try:
+    # Running sums computed in C are much faster than the generator below
+    from itertools import accumulate as delta_decode
+except ImportError:
+    def delta_decode(nums):
+        base = 0
+        for n in nums:
+            base += n
+            yield base
 
 
 class GrowableArray(object):
@@ -353,7 +359,7 @@ class GInts(NumberEncoding):
             elif code == 1:
                 yield f.read_ushort_le()
             elif code == 2:
-                yield unpack_uint_le(f.read(3) + "\x00")[0]
+                yield unpack_uint_le(f.read(3) + b("\x00"))[0]
             else:
                 yield f.read_uint_le()
 
@@ -371,3 +377,96 @@ class GInts(NumberEncoding):
 #        for n in self.read_nums(f, (i + 1) - base):
 #            pass
 #        return n
+
+
+# Patched frame-of-reference: the numbers are packed into a single bit width
+# chosen so that most of them fit, and the high bits of the few numbers that
+# don't fit ("exceptions") are stored separately and patched in after unpacking
+
+class PForDelta(NumberEncoding):
+    maxint = None
+
+    # Approximate number of bytes it takes to store an exception
+    _exception_size = 3
+    # Bit widths that can be read directly into an array
+    _typecodes = {8: "B", 16: "H", 32: "I"}
+
+    def _choose_width(self, numbers):
+        # Returns the bit width that minimizes the total packed size
+        n = len(numbers)
+        bitlens = sorted(x.bit_length() for x in numbers)
+        best = None
+        bestsize = None
+        for width in set(bitlens) | set([0]):
+            exceptions = n - bisect_right(bitlens, width)
+            size = (n * width + 7) // 8 + exceptions * self._exception_size
+            if bestsize is None or size < bestsize:
+                best = width
+                bestsize = size
+        return best
+
+    def _pack_bits(self, numbers, width):
+        if not width:
+            return emptybytes
+        if width in self._typecodes:
+            arry = array(self._typecodes[width], numbers)
+            if IS_LITTLE and width > 8:
+                arry.byteswap()
+            return array_tobytes(arry)
+
+        # Pack all the numbers into one big integer and dump it as bytes,
+        # instead of shifting bits into bytes one number at a time
+        big = 0
+        for x in numbers:
+            big = (big << width) | x
+        nbytes = (len(numbers) * width + 7) // 8
+        big <<= nbytes * 8 - len(numbers) * width
+        return unhexlify(("%x" % big).zfill(nbytes * 2).encode("ascii"))
+
+    def _unpack_bits(self, bs, width, n):
+        if not width:
+            return [0] * n
+        if width in self._typecodes:
+            arry = array(self._typecodes[width])
+            array_frombytes(arry, bs)
+            if IS_LITTLE and width > 8:
+                arry.byteswap()
+            return list(arry)
+
+        big = int(hexlify(bs), 16) >> (len(bs) * 8 - n * width)
+        mask = (1 << width) - 1
+        return [(big >> shift) & mask
+                for shift in xrange((n - 1) * width, -1, -width)]
+
+    def write_nums(self, f, numbers):
+        numbers = list(numbers)
+        if not numbers:
+            return
+
+        width = self._choose_width(numbers)
+        mask = (1 << width) - 1
+        f.write_byte(width)
+        f.write(self._pack_bits([x & mask for x in numbers], width))
+
+        # Write the positions (delta encoded) and high bits of the exceptions
+        exceptions = [(i, x >> width) for i, x in enumerate(numbers)
+                      if x > mask]
+        f.write_varint(len(exceptions))
+        last = 0
+        for i, high in exceptions:
+            f.write_varint(i - last)
+            f.write_varint(high)
+            last = i
+
+    def read_nums(self, f, n):
+        if not n:
+            return []
+
+        width = f.read_byte()
+        numbers = self._unpack_bits(f.read((n * width + 7) // 8), width, n)
+
+        i = 0
+        for _ in xrange(f.read_varint()):
+            i += f.read_varint()
+            numbers[i] |= f.read_varint() << width
+        return numbers
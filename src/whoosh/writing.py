@@ -26,17 +26,25 @@
 # policies, either expressed or implied, of Matt Chaput.
 
 from __future__ import with_statement
-import threading, time
-from bisect import bisect_right
+import marshal, sys, threading, time
+from array import array
+from bisect import bisect_left, bisect_right
 from contextlib import contextmanager
+from heapq import heapify, heappop, heapreplace
+from itertools import chain, groupby, islice, repeat
+from math import ceil
+from operator import itemgetter
+from struct import Struct
 
 from whoosh import columns
-from whoosh.compat import abstractmethod, bytes_type
-from whoosh.externalsort import SortingPool
+from whoosh.compat import abstractmethod, bytes_type, izip, xrange
+from whoosh.compat import array_frombytes, array_tobytes
+from whoosh.externalsort import SortingPool, imerge
 from whoosh.fields import UnknownFieldError
 from whoosh.index import LockError
-from whoosh.system import emptybytes
-from whoosh.util import fib, random_name
+from whoosh.system import _INT_SIZE, _SHORT_SIZE, emptybytes
+from whoosh.system import pack_uint, pack_ushort, unpack_uint, unpack_ushort
+from whoosh.util import fib, now, random_name
 from whoosh.util.filelock import try_for
 from whoosh.util.text import utf8encode
 
@@ -74,8 +82,6 @@ def MERGE_SMALL(writer, segments):
     heuristic based on the fibonacci sequence.
     """
 
-    from whoosh.reading import SegmentReader
-
     unchanged_segments = []
     segments_to_merge = []
 
@@ -96,11 +102,8 @@ def MERGE_SMALL(writer, segments):
                 merge_point_found = True
 
     if merge_point_found and len(segments_to_merge) > 1:
-        for seg, i in segments_to_merge:
-            reader = SegmentReader(writer.storage, writer.schema, seg)
-            writer.add_reader(reader)
-            reader.close()
-        return unchanged_segments
+        tomerge = [seg for seg, i in segments_to_merge]
+        return unchanged_segments + merge_segments(writer, tomerge)
     else:
         return segments
 
@@ -109,28 +112,344 @@ def OPTIMIZE(writer, segments):
     """This policy merges all existing segments.
     """
 
+    # Only merge in parallel if the writer has no documents of its own, since
+    # a parallel merge writes a separate segment
+    return merge_segments(writer, segments, parallel=not writer._added)
+
+
+def CLEAR(writer, segments):
+    """This policy DELETES all existing segments and only writes the new
+    segment.
+    """
+
+    return []
+
+
+def analyze_document(schema, fields):
+    """Runs the analysis for a document's fields. This is the part of
+    :meth:`SegmentWriter.add_document` that can be done in a separate process
+    (see :class:`whoosh.multiproc.AnalysisPool`).
+
+    Returns a dictionary mapping each field name to a tuple of
+    ``(postings, spellwords, vectoritems)``, where ``postings`` is a list of
+    the ``(tbytes, freq, weight, vbytes)`` tuples returned by the field's
+    ``index()`` method, ``spellwords`` is a list of the words to add to the
+    field's separate spelling field, and ``vectoritems`` is a sorted list of
+    ``(tbytes, weight, vbytes)`` term vector items. Each item is None if the
+    field doesn't use it.
+
+    :param schema: the :class:`whoosh.fields.Schema` of the index.
+    :param fields: a dictionary of the document's field values, as passed to
+        ``add_document()``.
+    """
+
+    analyzed = {}
+    for fieldname, value in fields.items():
+        if fieldname.startswith("_") or value is None:
+            continue
+        field = schema[fieldname]
+
+        postings = spellwords = vitems = None
+        if field.indexed:
+            # Ask the field to return a list of (text, weight, vbytes)
+            # tuples
+            postings = list(field.index(value))
+        if field.separate_spelling():
+            spellwords = list(field.spellable_words(value))
+        vformat = field.vector
+        if vformat:
+            analyzer = field.analyzer
+            # Call the format's word_values method to get posting values
+            vitems = vformat.word_values(value, analyzer, mode="index")
+            # Remove unused frequency field from the tuple
+            vitems = sorted((text, weight, vbytes)
+                            for text, _, weight, vbytes in vitems)
+        analyzed[fieldname] = (postings, spellwords, vitems)
+    return analyzed
+
+
+def batch_documents(docs):
+    """Converts the documents passed to :meth:`IndexWriter.add_documents`
+    into a list of dictionaries, one per document. ``docs`` is either an
+    iterable of dictionaries, or a dictionary mapping field names to
+    equal-length lists of values.
+    """
+
+    if isinstance(docs, dict):
+        names = list(docs)
+        columns = [list(docs[name]) for name in names]
+        lengths = set(len(values) for values in columns)
+        if len(lengths) > 1:
+            raise ValueError("Columns have different lengths: %r"
+                             % dict((name, len(values)) for name, values
+                                    in izip(names, columns)))
+        return [dict(izip(names, row)) for row in izip(*columns)]
+    return list(docs)
+
+
+def merge_segments(writer, segments, parallel=True):
+    """Merges the given segments for a merge policy function. Returns a list
+    of new segments that must be kept in addition to the writer's own segment.
+
+    If the writer was created with ``mergeprocs`` greater than 1, this uses
+    :func:`whoosh.multiproc.parallel_merge` to write the segments into a new
+    segment using several processes, and returns the new segment. Otherwise
+    (or if the index's storage or codec doesn't support a parallel merge)
+    this adds the segments to the writer using ``merge_reader()`` and returns
+    an empty list.
+
+    :param writer: the writer the merge policy was called with.
+    :param segments: a list of segments to merge.
+    :param parallel: if False, always add the segments to the writer.
+    """
+
     from whoosh.reading import SegmentReader
 
+    if parallel and getattr(writer, "mergeprocs", 1) > 1 and len(segments) > 1:
+        from whoosh.multiproc import parallel_merge
+
+        newsegment = parallel_merge(writer, segments, writer.mergeprocs)
+        if newsegment is not None:
+            return [newsegment]
+
     for seg in segments:
         reader = SegmentReader(writer.storage, writer.schema, seg)
-        writer.add_reader(reader)
-        reader.close()
+        writer.merge_reader(reader)
     return []
 
 
-def CLEAR(writer, segments):
-    """This policy DELETES all existing segments and only writes the new
-    segment.
+def segment_byte_size(storage, segment):
+    """Returns the total size in bytes of the given segment's files in the
+    given storage.
     """
 
-    return []
+    if segment.is_compound():
+        return storage.file_length(segment.make_filename(segment.COMPOUND_EXT))
+    return sum(storage.file_length(name)
+               for name in segment.list_files(storage))
+
+
+class TieredMergePolicy(object):
+    """A merge policy that keeps segments in "tiers" of similar byte sizes,
+    similar to Lucene's ``TieredMergePolicy``. Pass an instance to
+    ``commit()``::
+
+        policy = TieredMergePolicy(max_merged_mb=1024)
+        writer.commit(mergetype=policy)
+
+    The policy allows ``segments_per_tier`` segments of each size before it
+    merges, and when the index has more segments than that, it chooses the
+    group of at most ``max_merge_at_once`` similar-sized segments that is
+    cheapest to merge, preferring segments with many deleted documents. It
+    never chooses segments that would add up to more than ``max_merged_mb``,
+    so unlike :func:`MERGE_SMALL` a single commit never rewrites most of a
+    large index.
+
+    A segment where more than ``deletes_pct_allowed`` percent of the
+    documents are deleted is merged on its own (to remove the deleted
+    documents) if there is nothing else to merge.
+
+    The policy keeps statistics about the merges it has done in the
+    ``merge_count``, ``merged_segments``, ``merged_docs``, ``merged_bytes``
+    (the bytes of segment files read) and ``merge_time`` attributes, and
+    the ``last_merge`` attribute contains a dictionary describing the most
+    recent merge (or None if the last commit didn't merge).
+    """
+
+    def __init__(self, segments_per_tier=10, max_merge_at_once=10,
+                 max_merged_mb=5 * 1024, floor_mb=2.0,
+                 deletes_pct_allowed=33.0):
+        """
+        :param segments_per_tier: the number of segments allowed in each size
+            tier before merging.
+        :param max_merge_at_once: the maximum number of segments to merge in
+            one commit.
+        :param max_merged_mb: the maximum total size (in megabytes) of the
+            segments merged in one commit. Segments bigger than half this size
+            are only merged to remove deleted documents.
+        :param floor_mb: segments smaller than this size (in megabytes) are
+            treated as if they were this size, so tiny segments are merged
+            together aggressively.
+        :param deletes_pct_allowed: the percentage of deleted documents a
+            segment may have before it's rewritten on its own.
+        """
+
+        if segments_per_tier < 1:
+            raise ValueError("segments_per_tier must be at least 1")
+        if max_merge_at_once < 2:
+            raise ValueError("max_merge_at_once must be at least 2")
+        if floor_mb <= 0:
+            raise ValueError("floor_mb must be greater than 0")
+        self.segments_per_tier = segments_per_tier
+        self.max_merge_at_once = max_merge_at_once
+        self.max_merged_bytes = int(max_merged_mb * 1024 * 1024)
+        # The tier sizes are multiples of the floor size, so it can't round
+        # down to 0
+        self.floor_bytes = max(1, int(floor_mb * 1024 * 1024))
+        self.deletes_pct_allowed = deletes_pct_allowed
+
+        self.merge_count = 0
+        self.merged_segments = 0
+        self.merged_docs = 0
+        self.merged_bytes = 0
+        self.merge_time = 0.0
+        self.last_merge = None
+
+    def __call__(self, writer, segments):
+        storage = writer.storage
+        sized = [(seg, segment_byte_size(storage, seg)) for seg in segments]
+        tomerge = self.find_merge(sized)
+        if not tomerge:
+            self.last_merge = None
+            return segments
+
+        t = now()
+        newsegments = merge_segments(writer, tomerge)
+
+        sizes = dict((id(seg), size) for seg, size in sized)
+        self.last_merge = {
+            "segments": [seg.segment_id() for seg in tomerge],
+            "docs": sum(seg.doc_count() for seg in tomerge),
+            "bytes": sum(sizes[id(seg)] for seg in tomerge),
+            "time": now() - t,
+        }
+        self.merge_count += 1
+        self.merged_segments += len(tomerge)
+        self.merged_docs += self.last_merge["docs"]
+        self.merged_bytes += self.last_merge["bytes"]
+        self.merge_time += self.last_merge["time"]
+
+        merged = set(id(seg) for seg in tomerge)
+        return [seg for seg in segments if id(seg) not in merged] + newsegments
+
+    def _live_size(self, segment, size):
+        # Returns the size of the undeleted part of the segment
+        total = segment.doc_count_all()
+        if not total:
+            return 0
+        return size * segment.doc_count() / float(total)
+
+    def _deleted_pct(self, segment):
+        total = segment.doc_count_all()
+        if not total:
+            return 0.0
+        return 100.0 * segment.deleted_count() / total
+
+    def _allowed_count(self, total_bytes):
+        # Returns the number of segments the index may have before merging:
+        # segments_per_tier segments of the floor size, then
+        # segments_per_tier segments max_merge_at_once times bigger, and so on
+        per_tier = self.segments_per_tier
+        tier_size = self.floor_bytes
+        left = total_bytes
+        allowed = 0
+        while True:
+            tier_count = left / float(tier_size)
+            if tier_count < per_tier:
+                allowed += int(ceil(tier_count))
+                return max(allowed, per_tier)
+            allowed += per_tier
+            left -= per_tier * tier_size
+            tier_size *= self.max_merge_at_once
+
+    def find_merge(self, sized):
+        """Returns the list of segments to merge (which may be empty), given a
+        list of ``(segment, byte_size)`` pairs.
+        """
+
+        maxbytes = self.max_merged_bytes
+        floor = self.floor_bytes
+
+        # Segments near the maximum size can't be merged with anything, so
+        # leave them out, except to rewrite them to remove deletions
+        eligible = []
+        for seg, size in sized:
+            live = self._live_size(seg, size)
+            if live < maxbytes / 2.0:
+                eligible.append((seg, live))
+        eligible.sort(key=lambda x: x[1], reverse=True)
+
+        total = sum(max(live, floor) for _, live in eligible)
+        if len(eligible) > self._allowed_count(total):
+            best = None
+            bestscore = None
+            for start in xrange(len(eligible) - 1):
+                candidate = []
+                candsize = 0
+                for seg, live in eligible[start:]:
+                    if len(candidate) >= self.max_merge_at_once:
+                        break
+                    if candsize + live > maxbytes:
+                        continue
+                    candidate.append((seg, live))
+                    candsize += live
+                if len(candidate) < 2:
+                    continue
+
+                score = self._score(candidate, sized)
+                if bestscore is None or score < bestscore:
+                    best = candidate
+                    bestscore = score
+            if best:
+                return [seg for seg, _ in best]
+
+        # Nothing to merge for the segment count, so look for a segment with
+        # too many deletions to rewrite
+        deletes = [(self._deleted_pct(seg), seg) for seg, size in sized
+                   if self._live_size(seg, size) <= maxbytes]
+        deletes = [(pct, seg) for pct, seg in deletes
+                   if pct > self.deletes_pct_allowed]
+        if deletes:
+            deletes.sort(key=lambda x: x[0])
+            return [deletes[-1][1]]
+        return []
+
+    def _score(self, candidate, sized):
+        # Lower scores are better merges. Prefers merging segments of similar
+        # sizes (low skew), smaller merges, and merges that remove many
+        # deleted documents
+        floor = self.floor_bytes
+        floored = [max(live, floor) for _, live in candidate]
+        skew = max(floored) / float(sum(floored))
+
+        sizes = dict((id(seg), size) for seg, size in sized)
+        before = sum(sizes[id(seg)] for seg, _ in candidate)
+        after = sum(live for _, live in candidate)
+        live_ratio = after / float(before) if before else 1.0
+
+        return skew * (after or 1) ** 0.05 * live_ratio ** 2
 
 
 # Customized sorting pool for postings
 
+# Header of a block of postings in a run file: the number of postings, the
+# number of distinct terms, the number of fields, and flags
+_block_struct = Struct("<IIHB")
+# Block flags
+_HAS_WEIGHTS = 1  # the weights aren't all 1.0
+_HAS_VALUES = 2  # some postings have values
+# The maximum number of postings in a block
+_BLOCK_SIZE = 4096
+
+# Memory used by a posting tuple in the pool (not counting the term bytes and
+# the value bytes): the tuple, the pointer to it in the pool's list, the
+# document number, and the weight. The field name is shared.
+_POSTING_SIZE = (sys.getsizeof((None,) * 5) + sys.getsizeof(None)
+                 + sys.getsizeof(2 ** 20) + sys.getsizeof(1.5))
+_BYTES_SIZE = sys.getsizeof(emptybytes)
+
+
 class PostingPool(SortingPool):
     # Subclass whoosh.externalsort.SortingPool to use knowledge of
-    # postings to set run size in bytes instead of items
+    # postings to set run size in bytes instead of items, and to write the
+    # runs in a compact binary format instead of pickling each posting.
+    #
+    # A run file is a series of blocks of up to _BLOCK_SIZE sorted postings
+    # (see encode_postings()). Each block stores the field names and the
+    # distinct terms (with the prefix shared with the previous term removed)
+    # once, followed by the number of postings for each term and the
+    # postings' document numbers, weights, and values as packed arrays, so
+    # reading a block back is mostly done by C code.
 
     namechars = "abcdefghijklmnopqrstuvwxyz0123456789"
 
@@ -148,7 +467,7 @@ class PostingPool(SortingPool):
         return path, f
 
     def _open_run(self, path):
-        return self.tempstore.open_file(path).raw_file()
+        return self.tempstore.open_file(path, mapped=True)
 
     def _remove_run(self, path):
         return self.tempstore.delete_file(path)
@@ -156,20 +475,35 @@ class PostingPool(SortingPool):
     def add(self, item):
         # item = (fieldname, tbytes, docnum, weight, vbytes)
         assert isinstance(item[1], bytes_type), "tbytes=%r" % item[1]
-        if item[4] is not None:
-            assert isinstance(item[4], bytes_type), "vbytes=%r" % item[4]
+        vbytes = item[4]
+        if vbytes is not None:
+            assert isinstance(vbytes, bytes_type), "vbytes=%r" % vbytes
         self.fieldnames.add(item[0])
-        size = (28 + 4 * 5  # tuple = 28 + 4 * length
-                + 21 + len(item[0])  # fieldname = str = 21 + length
-                + 26 + len(item[1]) * 2  # text = unicode = 26 + 2 * length
-                + 18  # docnum = long = 18
-                + 16  # weight = float = 16
-                + 21 + len(item[4] or ''))  # valuestring
+        size = _POSTING_SIZE + _BYTES_SIZE + len(item[1])
+        if vbytes is not None:
+            size += _BYTES_SIZE + len(vbytes)
         self.currentsize += size
         if self.currentsize > self.limit:
             self.save()
         self.current.append(item)
 
+    def add_many(self, items):
+        # Adds a list of postings at once. The pool only checks its memory
+        # limit after adding the whole list
+        fieldnames = self.fieldnames
+        size = 0
+        for fieldname, tbytes, _, _, vbytes in items:
+            assert isinstance(tbytes, bytes_type), "tbytes=%r" % tbytes
+            fieldnames.add(fieldname)
+            size += _POSTING_SIZE + _BYTES_SIZE + len(tbytes)
+            if vbytes is not None:
+                assert isinstance(vbytes, bytes_type), "vbytes=%r" % vbytes
+                size += _BYTES_SIZE + len(vbytes)
+        self.current.extend(items)
+        self.currentsize += size
+        if self.currentsize > self.limit:
+            self.save()
+
     def iter_postings(self):
         # This is just an alias for items() to be consistent with the
         # iter_postings()/add_postings() interface of a lot of other classes
@@ -179,6 +513,193 @@ class PostingPool(SortingPool):
         SortingPool.save(self)
         self.currentsize = 0
 
+    def _write_run(self, f, items):
+        write = f.write
+        items = iter(items)
+        while True:
+            block = list(islice(items, _BLOCK_SIZE))
+            if not block:
+                break
+            write(encode_postings(block))
+        f.close()
+
+    def _read_blocks(self, path):
+        # Yields a sorted list of postings for each block in the given run
+        # file, and removes the file when it's finished
+        f = self._open_run(path)
+        read = f.read
+        try:
+            while True:
+                block = decode_postings(read)
+                if block is None:
+                    return
+                yield block
+        finally:
+            f.close()
+            self._remove_run(path)
+
+    def _read_run(self, path):
+        for block in self._read_blocks(path):
+            for item in block:
+                yield item
+
+    def _merge_runs(self, paths):
+        # A k-way merge of the runs that copies postings a slice at a time:
+        # the run with the lowest next posting can emit all of its postings
+        # up to the lowest next posting of the other runs, which is found
+        # using a binary search of its current block
+        heap = []
+        for runnum, path in enumerate(paths):
+            blocks = self._read_blocks(path)
+            for block in blocks:
+                heap.append([block[0], runnum, block, 0, blocks])
+                break
+        heapify(heap)
+
+        while heap:
+            entry = heap[0]
+            block = entry[2]
+            pos = entry[3]
+            if len(heap) == 1:
+                end = len(block)
+            else:
+                if len(heap) == 2:
+                    nexthead = heap[1][0]
+                else:
+                    nexthead = min(heap[1][0], heap[2][0])
+                end = bisect_right(block, nexthead, pos)
+
+            for i in xrange(pos, end):
+                yield block[i]
+
+            if end < len(block):
+                entry[0] = block[end]
+                entry[3] = end
+                heapreplace(heap, entry)
+            else:
+                for block in entry[4]:
+                    entry[0] = block[0]
+                    entry[2] = block
+                    entry[3] = 0
+                    heapreplace(heap, entry)
+                    break
+                else:
+                    heappop(heap)
+
+
+def encode_postings(block):
+    """Encodes a sorted list of ``(fieldname, btext, docnum, weight, vbytes)``
+    postings as a bytes string in the format of the blocks in
+    :class:`PostingPool` run files.
+    """
+
+    # Find the distinct terms and the number of postings for each
+    keys = []
+    counts = array("I")
+    for key, group in groupby(map(itemgetter(0, 1), block)):
+        keys.append(key)
+        counts.append(len(list(group)))
+
+    fields = []
+    prefixes = array("H")
+    suffixes = []
+    lastterm = emptybytes
+    for fieldname, fkeys in groupby(keys, itemgetter(0)):
+        nterms = 0
+        for _, btext in fkeys:
+            # Only store the part of the term that's different from the
+            # previous term
+            prefix = 0
+            maxprefix = min(len(lastterm), len(btext), 0xffff)
+            while prefix < maxprefix and lastterm[prefix] == btext[prefix]:
+                prefix += 1
+            prefixes.append(prefix)
+            suffixes.append(btext[prefix:])
+            lastterm = btext
+            nterms += 1
+        fields.append((fieldname.encode("utf8"), nterms))
+
+    weights = array("d", map(itemgetter(3), block))
+    values = list(map(itemgetter(4), block))
+    flags = 0
+    if weights.count(1.0) != len(weights):
+        flags |= _HAS_WEIGHTS
+    if values.count(None) != len(values):
+        flags |= _HAS_VALUES
+
+    parts = [_block_struct.pack(len(block), len(keys), len(fields), flags)]
+    for fbytes, nterms in fields:
+        parts.append(pack_ushort(len(fbytes)) + fbytes + pack_uint(nterms))
+    parts.append(array_tobytes(prefixes))
+    parts.append(array_tobytes(array("I", map(len, suffixes))))
+    parts.extend(suffixes)
+    parts.append(array_tobytes(counts))
+    parts.append(array_tobytes(array("i", map(itemgetter(2), block))))
+    if flags & _HAS_WEIGHTS:
+        parts.append(array_tobytes(weights))
+    if flags & _HAS_VALUES:
+        vbytes = marshal.dumps(values)
+        parts.append(pack_uint(len(vbytes)))
+        parts.append(vbytes)
+    return emptybytes.join(parts)
+
+
+def decode_postings(read):
+    """Reads a block of postings written by :func:`encode_postings` using the
+    given ``read(n)`` function, and returns the postings as a list. Returns
+    None if there is no more data.
+    """
+
+    head = read(_block_struct.size)
+    if len(head) < _block_struct.size:
+        return None
+    count, nterms, nfields, flags = _block_struct.unpack(head)
+
+    fields = []
+    for _ in xrange(nfields):
+        flen = unpack_ushort(read(_SHORT_SIZE))[0]
+        fieldname = read(flen).decode("utf8")
+        fields.append((fieldname, unpack_uint(read(_INT_SIZE))[0]))
+
+    prefixes = _read_array(read, "H", nterms)
+    suffixlens = _read_array(read, "I", nterms)
+    suffixes = read(sum(suffixlens))
+    terms = []
+    lastterm = emptybytes
+    pos = 0
+    for prefix, length in izip(prefixes, suffixlens):
+        lastterm = lastterm[:prefix] + suffixes[pos:pos + length]
+        terms.append(lastterm)
+        pos += length
+    counts = _read_array(read, "I", nterms)
+
+    docnums = _read_array(read, "i", count)
+    if flags & _HAS_WEIGHTS:
+        weights = _read_array(read, "d", count)
+    else:
+        weights = repeat(1.0)
+    if flags & _HAS_VALUES:
+        vlen = unpack_uint(read(_INT_SIZE))[0]
+        values = marshal.loads(read(vlen))
+    else:
+        values = repeat(None)
+
+    # Expand the field names and terms to one per posting
+    fieldcol = []
+    t = 0
+    for fieldname, fterms in fields:
+        fieldcol.extend(repeat(fieldname, sum(counts[t:t + fterms])))
+        t += fterms
+    termcol = chain.from_iterable(map(repeat, terms, counts))
+
+    return list(izip(fieldcol, termcol, docnums, weights, values))
+
+
+def _read_array(read, typecode, count):
+    a = array(typecode)
+    array_frombytes(a, read(count * a.itemsize))
+    return a
+
 
 # Writer base class
 
@@ -401,6 +922,31 @@ class IndexWriter(object):
 
         raise NotImplementedError
 
+    def add_documents(self, docs):
+        """Adds a batch of documents to the index. This is equivalent to
+        calling :meth:`IndexWriter.add_document` for each document, but some
+        writers can add a batch faster, by checking the fields and adding
+        the postings and column values once for the whole batch.
+
+        You can give the documents as a list of dictionaries mapping field
+        names to values (including the special ``_boost``-style keywords
+        accepted by ``add_document``)::
+
+            w.add_documents([{"path": u"/a", "content": u"Alfa"},
+                             {"path": u"/b", "content": u"Bravo"}])
+
+        ...or as a single dictionary mapping field names to lists of values,
+        one for each document::
+
+            w.add_documents({"path": [u"/a", u"/b"],
+                             "content": [u"Alfa", u"Bravo"]})
+
+        :param docs: the documents to add.
+        """
+
+        for fields in batch_documents(docs):
+            self.add_document(**fields)
+
     @abstractmethod
     def add_reader(self, reader):
         raise NotImplementedError
@@ -458,9 +1004,8 @@ class IndexWriter(object):
         * Marking more fields "unique" in the schema will make each
           ``update_document`` call slightly slower.
 
-        * When you are updating multiple documents, it is faster to batch
-          delete all changed documents and then use ``add_document`` to add
-          the replacements instead of using ``update_document``.
+        * When you are updating multiple documents, it is much faster to use
+          :meth:`IndexWriter.update_documents` to update them in a batch.
 
         Note that this method will only replace a *committed* document;
         currently it cannot replace documents you've added to the IndexWriter
@@ -489,6 +1034,93 @@ class IndexWriter(object):
         # Add the given fields
         self.add_document(**fields)
 
+    def update_documents(self, docs):
+        """Adds a batch of documents to the index, deleting any existing
+        documents with the same values in any fields marked "unique" in the
+        schema, like calling :meth:`IndexWriter.update_document` for each
+        document but much faster::
+
+            w = myindex.writer()
+            w.update_documents([
+                {"path": u"/a", "content": u"Alfa"},
+                {"path": u"/b", "content": u"Bravo"},
+            ])
+            w.commit()
+
+        Instead of searching for each document's unique values separately,
+        this method collects the unique values of the whole batch, looks them
+        up in sorted order in each segment, and deletes the matching documents
+        at once.
+
+        If more than one document in the batch has the same value in a unique
+        field, only the last one is added, as if the later documents replaced
+        the earlier ones. This only applies within the batch; as with
+        ``update_document``, documents added earlier but not yet committed
+        are not replaced.
+
+        :param docs: an iterable of dictionaries mapping field names to the
+            values to index/store, as you would pass as keyword arguments to
+            :meth:`IndexWriter.add_document`. The documents are read into a
+            list, so for very large updates you should call this method with
+            batches of documents.
+        :returns: the number of existing documents deleted.
+        """
+
+        docs = list(docs)
+        schema = self.schema
+        unique_names = [name for name, field in schema.items()
+                        if field.unique]
+
+        # Map each unique term in the batch to the position of the last
+        # document that has it, and mark earlier documents with the same term
+        # as replaced
+        latest = {}
+        replaced = set()
+        if unique_names:
+            for i, fields in enumerate(docs):
+                for name in unique_names:
+                    if name in fields:
+                        term = (name, schema[name].to_bytes(fields[name]))
+                        if term in latest:
+                            replaced.add(latest[term])
+                        latest[term] = i
+
+        count = 0
+        if latest:
+            count = self._delete_by_terms(latest)
+
+        for i, fields in enumerate(docs):
+            if i not in replaced:
+                self.add_document(**fields)
+        return count
+
+    def _delete_by_terms(self, terms):
+        # Deletes the existing documents containing any of the given
+        # (fieldname, termbytes) pairs and returns the number of documents
+        # deleted. The terms are looked up in sorted order so the reads from
+        # each segment's term index move forward through the file
+
+        terms = sorted(terms)
+        # A document can contain more than one of the terms, so collect the
+        # document numbers first to count each document only once
+        docnums = set()
+        reader = self.reader()
+        try:
+            for leaf, offset in reader.leaf_readers():
+                for term in terms:
+                    if term not in leaf:
+                        continue
+                    fieldname, tbytes = term
+                    for docnum in leaf.postings(fieldname, tbytes).all_ids():
+                        if not leaf.is_deleted(docnum):
+                            docnums.add(offset + docnum)
+        finally:
+            reader.close()
+
+        for docnum in docnums:
+            self.delete_document(docnum)
+        return len(docnums)
+
     def commit(self):
         """Finishes writing and unlocks the index.
         """
@@ -505,7 +1137,8 @@ class IndexWriter(object):
 
 class SegmentWriter(IndexWriter):
     def __init__(self, ix, poolclass=None, timeout=0.0, delay=0.1, _lk=True,
-                 limitmb=128, docbase=0, codec=None, compound=True, **kwargs):
+                 limitmb=128, docbase=0, codec=None, compound=True,
+                 mergeprocs=1, analysisprocs=1, **kwargs):
         # Lock the index
         self.writelock = None
         if _lk:
@@ -530,14 +1163,22 @@ class SegmentWriter(IndexWriter):
         self._setup_doc_offsets()
 
         # Internals
-        self._tempstorage = self.storage.temp_storage("%s.tmp" % self.indexname)
-        newsegment = codec.new_segment(self.storage, self.indexname)
+        newsegment = self._new_segment()
         self.newsegment = newsegment
+        # Use the same temporary storage as the codec's per-document writer,
+        # which is named after the segment's index name
+        self._tempstorage = self.storage.temp_storage("%s.tmp"
+                                                      % newsegment.indexname)
         self.compound = compound and newsegment.should_assemble()
         self.is_closed = False
         self._added = False
-        self.pool = PostingPool(self._tempstorage, self.newsegment,
-                                limitmb=limitmb)
+        poolclass = poolclass or PostingPool
+        self.pool = poolclass(self._tempstorage, self.newsegment,
+                              limitmb=limitmb)
+        # A list of (reader, startdoc, docmap) tuples for readers added with
+        # merge_reader(), whose postings are merged with the pool's postings
+        # when the segment is flushed
+        self._merge_sources = []
 
         # Set up writers
         self.perdocwriter = codec.per_document_writer(self.storage, newsegment)
@@ -546,10 +1187,19 @@ class SegmentWriter(IndexWriter):
         self.merge = True
         self.optimize = False
         self.mergetype = None
+        # The number of processes to use to merge existing segments
+        self.mergeprocs = mergeprocs
+        # The number of processes to use to analyze added documents, and the
+        # pool of processes (created when the first document is added)
+        self.analysisprocs = analysisprocs
+        self._analysispool = None
 
     def __repr__(self):
         return "<%s %r>" % (self.__class__.__name__, self.newsegment)
 
+    def _new_segment(self):
+        return self.codec.new_segment(self.storage, self.indexname)
+
     def _check_state(self):
         if self.is_closed:
             raise IndexingError("This writer is closed")
@@ -639,7 +1289,31 @@ class SegmentWriter(IndexWriter):
                                  self.generation, reuse=reuse)
 
     def iter_postings(self):
-        return self.pool.iter_postings()
+        sources = [self.pool.iter_postings()]
+        for reader, startdoc, docmap in self._merge_sources:
+            sources.append(self._reader_postings(reader, startdoc, docmap))
+        if len(sources) == 1:
+            return sources[0]
+        # The pool's postings and the postings of each reader are already
+        # sorted, so they only need to be interleaved
+        return imerge(sources)
+
+    def _reader_postings(self, reader, startdoc, docmap):
+        # Yields the reader's postings renumbered for the new segment, sorted
+        # by field name, term, and document number like the pool's postings
+        schema = self.schema
+        for fieldname in sorted(reader.indexed_field_names()):
+            if fieldname not in schema:
+                continue
+            for btext in reader.lexicon(fieldname):
+                m = reader.postings(fieldname, btext)
+                while m.is_active():
+                    if docmap is not None:
+                        newdoc = docmap[m.id()]
+                    else:
+                        newdoc = startdoc + m.id()
+                    yield (fieldname, btext, newdoc, m.weight(), m.value())
+                    m.next()
 
     def add_postings_to_pool(self, reader, startdoc, docmap):
         items = self._process_posts(reader.iter_postings(), startdoc, docmap)
@@ -699,17 +1373,40 @@ class SegmentWriter(IndexWriter):
 
         return docmap
 
-    def add_reader(self, reader):
-        self._check_state()
-        basedoc = self.docnum
+    def _write_reader_docs(self, reader):
+        # Writes the per-document information of all undeleted documents in
+        # the reader, and returns the docmap for renumbering its postings
         ndxnames = set(fname for fname in reader.indexed_field_names()
                        if fname in self.schema)
         fieldnames = set(self.schema.names()) | ndxnames
+        return self.write_per_doc(fieldnames, reader)
 
-        docmap = self.write_per_doc(fieldnames, reader)
+    def add_reader(self, reader):
+        self._check_state()
+        self._finish_analysis()
+        basedoc = self.docnum
+        docmap = self._write_reader_docs(reader)
         self.add_postings_to_pool(reader, basedoc, docmap)
         self._added = True
 
+    def merge_reader(self, reader):
+        """Like :meth:`~IndexWriter.add_reader`, but instead of adding the
+        reader's postings to the writer's pool (which sorts them again), the
+        writer keeps the reader open and merges the reader's postings, which
+        are already sorted, directly into the new segment when it's written.
+        The writer takes ownership of the reader and closes it when the
+        writer is finished.
+
+        This is how the merge policies add existing segments to the writer.
+        """
+
+        self._check_state()
+        self._finish_analysis()
+        basedoc = self.docnum
+        docmap = self._write_reader_docs(reader)
+        self._merge_sources.append((reader, basedoc, docmap))
+        self._added = True
+
     def _check_fields(self, schema, fieldnames):
         # Check if the caller gave us a bogus field
         for name in fieldnames:
@@ -719,76 +1416,157 @@ class SegmentWriter(IndexWriter):
 
     def add_document(self, **fields):
         self._check_state()
+        fieldnames = [name for name in fields.keys()
+                      if not name.startswith("_")]
+        self._check_fields(self.schema, fieldnames)
+
+        if self.analysisprocs > 1:
+            # Hand the document to the analysis pool, and write any documents
+            # it has finished analyzing
+            done = self._analysis_pool().add(fields)
+            if done:
+                self._write_documents(done)
+            self._added = True
+        else:
+            analyzed = analyze_document(self.schema, fields)
+            self._write_documents([(fields, analyzed)])
+
+    def add_documents(self, docs):
+        self._check_state()
+        docs = batch_documents(docs)
+        schema = self.schema
+
+        # Only check each distinct set of field names once
+        checked = set()
+        for fields in docs:
+            keys = frozenset(fields)
+            if keys not in checked:
+                self._check_fields(schema, [name for name in keys
+                                            if not name.startswith("_")])
+                checked.add(keys)
+
+        if self.analysisprocs > 1:
+            apool = self._analysis_pool()
+            for fields in docs:
+                done = apool.add(fields)
+                if done:
+                    self._write_documents(done)
+            self._added = True
+        else:
+            self._write_documents((fields, analyze_document(schema, fields))
+                                  for fields in docs)
+
+    def _analysis_pool(self):
+        if self._analysispool is None:
+            from whoosh.multiproc import AnalysisPool
+
+            self._analysispool = AnalysisPool(self.schema, self.analysisprocs)
+        return self._analysispool
+
+    def _finish_analysis(self):
+        # Writes the documents that are still in the analysis pool and shuts
+        # the pool down
+        if self._analysispool is not None:
+            apool = self._analysispool
+            self._analysispool = None
+            self._write_documents(apool.finish())
+
+    def _write_documents(self, items):
+        # Writes documents given an iterable of (fields, analyzed) pairs,
+        # where analyzed is the return value of analyze_document(). The
+        # postings and column values for all the documents are collected and
+        # added to the pool and the per-document writer in one go
+
         perdocwriter = self.perdocwriter
         schema = self.schema
         docnum = self.docnum
-        add_post = self.pool.add
+        postings = []
+        add_post = postings.append
+        # Maps field names to (column, [(docnum, value), ...])
+        colvalues = {}
 
-        docboost = self._doc_boost(fields)
-        fieldnames = sorted([name for name in fields.keys()
-                             if not name.startswith("_")])
-        self._check_fields(schema, fieldnames)
-
-        perdocwriter.start_doc(docnum)
-        for fieldname in fieldnames:
-            value = fields.get(fieldname)
-            if value is None:
-                continue
-            field = schema[fieldname]
-
-            length = 0
-            if field.indexed:
-                # TODO: Method for adding progressive field values, ie
-                # setting start_pos/start_char?
-                fieldboost = self._field_boost(fields, fieldname, docboost)
-                # Ask the field to return a list of (text, weight, vbytes)
-                # tuples
-                items = field.index(value)
-                # Only store the length if the field is marked scorable
-                scorable = field.scorable
-                # Add the terms to the pool
-                for tbytes, freq, weight, vbytes in items:
-                    weight *= fieldboost
-                    if scorable:
-                        length += freq
-                    add_post((fieldname, tbytes, docnum, weight, vbytes))
-
-            if field.separate_spelling():
-                spellfield = field.spelling_fieldname(fieldname)
-                for word in field.spellable_words(value):
-                    word = utf8encode(word)[0]
-                    # item = (fieldname, tbytes, docnum, weight, vbytes)
-                    add_post((spellfield, word, 0, 1, vbytes))
-
-            vformat = field.vector
-            if vformat:
-                analyzer = field.analyzer
-                # Call the format's word_values method to get posting values
-                vitems = vformat.word_values(value, analyzer, mode="index")
-                # Remove unused frequency field from the tuple
-                vitems = sorted((text, weight, vbytes)
-                                for text, _, weight, vbytes in vitems)
-                perdocwriter.add_vector_items(fieldname, field, vitems)
-
-            # Allow a custom value for stored field/column
-            customval = fields.get("_stored_%s" % fieldname, value)
-
-            # Add the stored value and length for this field to the per-
-            # document writer
-            sv = customval if field.stored else None
-            perdocwriter.add_field(fieldname, field, sv, length)
-
-            column = field.column_type
-            if column and customval is not None:
-                cv = field.to_column_value(customval)
-                perdocwriter.add_column_value(fieldname, column, cv)
-
-        perdocwriter.finish_doc()
-        self._added = True
-        self.docnum += 1
+        try:
+            for fields, analyzed in items:
+                fieldnames = sorted([name for name in fields
+                                     if not name.startswith("_")])
+                # Only look for boosts and custom stored values if the
+                # document has keywords starting with an underscore
+                special = len(fieldnames) < len(fields)
+                docboost = self._doc_boost(fields) if special else 1.0
+
+                perdocwriter.start_doc(docnum)
+                for fieldname in fieldnames:
+                    value = fields[fieldname]
+                    if value is None:
+                        continue
+                    field = schema[fieldname]
+                    postitems, spellwords, vitems = analyzed[fieldname]
+
+                    length = 0
+                    if field.indexed:
+                        # TODO: Method for adding progressive field values, ie
+                        # setting start_pos/start_char?
+                        if special:
+                            fieldboost = self._field_boost(fields, fieldname,
+                                                           docboost)
+                        else:
+                            fieldboost = docboost
+                        # Only store the length if the field is marked
+                        # scorable
+                        scorable = field.scorable
+                        # Add the terms to the pool
+                        for tbytes, freq, weight, vbytes in postitems:
+                            weight *= fieldboost
+                            if scorable:
+                                length += freq
+                            add_post((fieldname, tbytes, docnum, weight,
+                                      vbytes))
+
+                    if spellwords is not None:
+                        spellfield = field.spelling_fieldname(fieldname)
+                        for word in spellwords:
+                            word = utf8encode(word)[0]
+                            # item = (fieldname, tbytes, docnum, weight, vbytes)
+                            add_post((spellfield, word, 0, 1, vbytes))
+
+                    if vitems is not None:
+                        perdocwriter.add_vector_items(fieldname, field, vitems)
+
+                    # Allow a custom value for stored field/column
+                    if special:
+                        customval = fields.get("_stored_%s" % fieldname, value)
+                    else:
+                        customval = value
+
+                    # Add the stored value and length for this field to the
+                    # per-document writer
+                    sv = customval if field.stored else None
+                    perdocwriter.add_field(fieldname, field, sv, length)
+
+                    column = field.column_type
+                    if column and customval is not None:
+                        cv = field.to_column_value(customval)
+                        if fieldname not in colvalues:
+                            colvalues[fieldname] = (column, [])
+                        colvalues[fieldname][1].append((docnum, cv))
+
+                perdocwriter.finish_doc()
+                self._added = True
+                docnum += 1
+        finally:
+            self.docnum = docnum
+            if postings:
+                self.pool.add_many(postings)
+            for fieldname, (column, values) in colvalues.items():
+                perdocwriter.add_column_values(fieldname, column, values)
 
     def doc_count(self):
-        return self.docnum - self.docbase
+        count = self.docnum - self.docbase
+        if self._analysispool is not None:
+            # Count the documents still being analyzed without waiting for
+            # them, so the pool stays open for more documents
+            count += len(self._analysispool)
+        return count
 
     def get_segment(self):
         newsegment = self.newsegment
@@ -832,7 +1610,7 @@ class SegmentWriter(IndexWriter):
             pdr = self.per_document_reader()
         else:
             pdr = None
-        postings = self.pool.iter_postings()
+        postings = self.iter_postings()
         self.fieldwriter.add_postings(self.schema, pdr, postings)
         self.fieldwriter.close()
         if pdr:
@@ -844,6 +1622,9 @@ class SegmentWriter(IndexWriter):
         if not self.fieldwriter.is_closed:
             self.fieldwriter.close()
         self.pool.cleanup()
+        for reader, _, _ in self._merge_sources:
+            reader.close()
+        self._merge_sources = []
 
     def _assemble_segment(self):
         if self.compound:
@@ -918,6 +1699,8 @@ class SegmentWriter(IndexWriter):
         """
 
         self._check_state()
+        # Write any documents still being analyzed
+        self._finish_analysis()
         # Merge old segments if necessary
         finalsegments = self._merge_segments(mergetype, optimize, merge)
         if self._added:
@@ -936,10 +1719,238 @@ class SegmentWriter(IndexWriter):
 
     def cancel(self):
         self._check_state()
+        if self._analysispool is not None:
+            self._analysispool.terminate()
+            self._analysispool = None
         self._close_segment()
         self._finish()
 
 
+# Background merging
+
+class _MergeWriter(SegmentWriter):
+    # A writer used by BackgroundMerger to write a merged segment without
+    # locking the index. The new segment's files are named using a different
+    # prefix so clean_files() doesn't delete them if another writer commits
+    # during the merge, and renamed when the segment is published
+
+    def __init__(self, ix, **kwargs):
+        self.sources = []
+        SegmentWriter.__init__(self, ix, _lk=False, compound=False, **kwargs)
+        # The merged segment must be written by this writer so it can be
+        # published, so don't merge in parallel
+        self.mergeprocs = 1
+
+    def _new_segment(self):
+        return self.codec.new_segment(self.storage,
+                                      "%s_merging" % self.indexname)
+
+    def _write_reader_docs(self, reader):
+        # Remember where each merged segment's documents start and which of
+        # them were deleted, so later deletions can be applied to the merged
+        # segment
+        segment = reader.segment()
+        self.sources.append((segment.segment_id(), self.docnum,
+                             sorted(segment.deleted_docs())))
+        return SegmentWriter._write_reader_docs(self, reader)
+
+    def remove_files(self):
+        for name in self.newsegment.list_files(self.storage):
+            try:
+                self.storage.delete_file(name)
+            except OSError:
+                pass
+
+
+class BackgroundMerger(object):
+    """Merges segments in a background thread, so commits don't have to wait
+    for merges. Use the merger as the merge policy of your commits::
+
+        merger = BackgroundMerger(myindex)
+
+        with myindex.writer() as w:
+            w.add_document(...)
+            w.mergetype = merger
+
+        ...
+
+        # Wait for any running merge to finish before exiting
+        merger.close()
+
+    The commit publishes its new segment without merging, and the merger
+    then starts a thread that chooses segments to merge using its own merge
+    policy (``MERGE_SMALL`` by default) and writes the merged segment while
+    the index is unlocked, so other writers can commit in the meantime. When
+    the merged segment is finished, the merger locks the index, applies any
+    deletions made to the merged segments while it was working, and writes a
+    new generation of the index replacing them with the merged segment.
+
+    If another writer merged or removed any of the same segments in the
+    meantime, the merge is thrown away. So while you're using a background
+    merger, your other commits should not merge segments themselves (for
+    example, use ``commit(merge=False)``).
+
+    Merged segments are not assembled into compound files.
+    """
+
+    def __init__(self, ix, mergetype=MERGE_SMALL, delay=0.1, writerargs=None):
+        """
+        :param ix: the :class:`whoosh.index.FileIndex` to merge.
+        :param mergetype: the merge policy used to choose the segments to
+            merge (see :meth:`SegmentWriter.commit`).
+        :param delay: how often (in seconds) to retry locking the index.
+        :param writerargs: an optional dictionary of keyword arguments to pass
+            to the :class:`SegmentWriter` that writes the merged segment.
+        """
+
+        self.ix = ix
+        self.mergetype = mergetype
+        self.delay = delay
+        self.writerargs = writerargs or {}
+
+        self.merge_count = 0
+        # The exception raised by the last merge in the background thread
+        self.error = None
+
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pending = False
+
+    def __call__(self, writer, segments):
+        # Used as a merge policy: schedule a merge and don't merge anything
+        # in the committing writer
+        self.schedule()
+        return segments
+
+    def schedule(self):
+        """Starts a merge in the background thread, or if a merge is already
+        running, starts another one when it's finished.
+        """
+
+        with self._lock:
+            self._pending = True
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._thread = None
+                    return
+                self._pending = False
+
+            try:
+                self.merge()
+            except Exception:
+                self.error = sys.exc_info()[1]
+
+    def wait(self):
+        """Waits for the background thread to finish any running and
+        scheduled merges.
+        """
+
+        while True:
+            with self._lock:
+                thread = self._thread
+            if thread is None:
+                return
+            thread.join()
+
+    def close(self):
+        """Waits for merges to finish, and raises the exception from the last
+        merge if it failed.
+        """
+
+        self.wait()
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def _acquire(self, writelock):
+        while not try_for(writelock.acquire, timeout=60.0, delay=self.delay):
+            pass
+
+    def merge(self):
+        """Runs a merge in the calling thread. Returns True if segments were
+        merged.
+        """
+
+        ix = self.ix
+        writelock = ix.lock("WRITELOCK")
+        # If a writer is committing (for example, the one that scheduled this
+        # merge), wait for it to finish so we see its segment
+        self._acquire(writelock)
+        writelock.release()
+
+        mwriter = _MergeWriter(ix, **self.writerargs)
+        try:
+            self.mergetype(mwriter, list(mwriter.segments))
+            if not mwriter.sources:
+                mwriter.cancel()
+                mwriter.remove_files()
+                return False
+            newsegment = mwriter._finalize_segment()
+        except Exception:
+            if not mwriter.is_closed:
+                mwriter.cancel()
+            mwriter.remove_files()
+            raise
+
+        self._acquire(writelock)
+        try:
+            published = self._publish(mwriter, newsegment)
+        finally:
+            writelock.release()
+            mwriter._finish()
+
+        if published:
+            self.merge_count += 1
+        return published
+
+    def _publish(self, mwriter, newsegment):
+        from whoosh.index import TOC, clean_files
+
+        ix = self.ix
+        storage = ix.storage
+        toc = ix._read_toc()
+        current = dict((seg.segment_id(), seg) for seg in toc.segments)
+        if not all(segid in current for segid, _, _ in mwriter.sources):
+            # Another writer merged or removed some of the same segments
+            mwriter.remove_files()
+            return False
+
+        # Delete documents in the merged segment that were deleted from the
+        # source segments since the merge started
+        for segid, base, deleted in mwriter.sources:
+            for docnum in current[segid].deleted_docs():
+                pos = bisect_left(deleted, docnum)
+                if pos < len(deleted) and deleted[pos] == docnum:
+                    # This document was already deleted, so it wasn't merged
+                    continue
+                newsegment.delete_document(base + docnum - pos)
+
+        # Rename the merged segment's files into the index's namespace
+        oldprefix = newsegment.segment_id()
+        names = newsegment.list_files(storage)
+        newsegment.indexname = ix.indexname
+        newprefix = newsegment.segment_id()
+        for name in names:
+            storage.rename_file(name, newprefix + name[len(oldprefix):])
+
+        sources = set(segid for segid, _, _ in mwriter.sources)
+        segments = [seg for seg in toc.segments
+                    if seg.segment_id() not in sources]
+        segments.append(newsegment)
+
+        generation = toc.generation + 1
+        TOC(toc.schema, segments, generation).write(storage, ix.indexname)
+        clean_files(storage, ix.indexname, generation, segments)
+        return True
+
+
 # Writer wrappers
 
 class AsyncWriter(threading.Thread, IndexWriter):
@@ -1020,9 +2031,15 @@ class AsyncWriter(threading.Thread, IndexWriter):
     def add_document(self, *args, **kwargs):
         self._record("add_document", args, kwargs)
 
+    def add_documents(self, *args, **kwargs):
+        self._record("add_documents", args, kwargs)
+
     def update_document(self, *args, **kwargs):
         self._record("update_document", args, kwargs)
 
+    def update_documents(self, *args, **kwargs):
+        self._record("update_documents", args, kwargs)
+
     def add_field(self, *args, **kwargs):
         self._record("add_field", args, kwargs)
 
@@ -1125,9 +2142,13 @@ class BufferedWriter(IndexWriter):
 
     You can read/search the combination of the on-disk index and the
     buffered documents in memory by calling ``BufferedWriter.reader()`` or
-    ``BufferedWriter.searcher()``. This allows quasi-real-time search, where
+    ``BufferedWriter.searcher()``. This allows near-real-time search, where
     documents are available for searching as soon as they are buffered in
-    memory, before they are committed to disk.
+    memory, before they are committed to disk. The buffered documents are
+    added to an in-memory segment (see :mod:`whoosh.codec.memory`) as they
+    come in, so getting a new searcher doesn't have to flush or copy them.
+    Each reader or searcher sees the documents added before it was created;
+    get a new searcher to see documents added since then.
 
     .. tip::
         By using a searcher from the shared writer, multiple *threads* can
@@ -1184,6 +2205,10 @@ class BufferedWriter(IndexWriter):
         from whoosh.codec.memory import MemoryCodec
 
         self.codec = MemoryCodec()
+        # Keep a writer open on the in-memory segment. It adds each document
+        # straight to the segment, so the documents are searchable without
+        # committing it
+        self.ramwriter = self.codec.writer(self.writer.schema)
 
     def _get_ram_reader(self):
         return self.codec.reader(self.schema)
@@ -1201,7 +2226,12 @@ class BufferedWriter(IndexWriter):
 
         # If there are in-memory docs, combine the readers
         if ramreader.doc_count():
-            if reader.is_atomic():
+            if not reader.doc_count_all():
+                # Nothing has been committed yet, so only the in-memory
+                # segment has any documents
+                reader.close()
+                reader = ramreader
+            elif reader.is_atomic():
                 reader = MultiReader([reader, ramreader])
             else:
                 reader.add_reader(ramreader)
@@ -1221,6 +2251,7 @@ class BufferedWriter(IndexWriter):
             self.timer.cancel()
 
         with self.lock:
+            self.ramwriter.commit()
             ramreader = self._get_ram_reader()
             self._make_ram_index()
 
@@ -1242,9 +2273,7 @@ class BufferedWriter(IndexWriter):
 
     def add_document(self, **fields):
         with self.lock:
-            # Hijack a writer to make the calls into the codec
-            with self.codec.writer(self.writer.schema) as w:
-                w.add_document(**fields)
+            self.ramwriter.add_document(**fields)
 
             self.bufferedcount += 1
             if self.bufferedcount >= self.limit:
@@ -1254,6 +2283,19 @@ class BufferedWriter(IndexWriter):
         with self.lock:
             IndexWriter.update_document(self, **fields)
 
+    def add_documents(self, docs):
+        docs = batch_documents(docs)
+        with self.lock:
+            self.ramwriter.add_documents(docs)
+
+            self.bufferedcount += len(docs)
+            if self.bufferedcount >= self.limit:
+                self.commit()
+
+    def update_documents(self, docs):
+        with self.lock:
+            return IndexWriter.update_documents(self, docs)
+
     def delete_document(self, docnum, delete=True):
         with self.lock:
             base = self.index.doc_count_all()
@@ -370,3 +370,34 @@ def test_strings_dfa():
     assert list(dfa.generate_all()) == words
 
 
+
+
+def test_regex_automaton():
+    import re
+
+    patterns = ["abc", "a.c", "a*b", "ab+c?", "(ab|cd)e", "[a-c]x", "[^a]b",
+                "a{2,3}", "b\\wc", "^ab$", "a|b$", "(?:ab)*c\\Z", "[]a]",
+                "a[-b]", "(?P<x>ab)c", "a.*c$"]
+    domain = "abcx-]"
+    strings = [""]
+    for _ in xrange(4):
+        strings += [s + c for s in strings for c in domain]
+    strings = sorted(set(strings))
+
+    # The automaton must accept (at least) everything the expression matches
+    for pattern in patterns:
+        exp = re.compile(pattern)
+        dfa = reg.regex_automaton(pattern).to_dfa()
+        for s in strings:
+            if exp.match(s):
+                assert dfa.accept(s), (pattern, s)
+
+    dfa = reg.regex_automaton("a[bc]d$").to_dfa()
+    assert dfa.accept("abd")
+    assert dfa.accept("acd")
+    assert not dfa.accept("add")
+    assert not dfa.accept("abdd")
+
+    for pattern in ["(a)\\1", "(?=a)b", "(?i)a", "a{x}", "*a", "\\x41"]:
+        with pytest.raises(ValueError):
+            reg.regex_automaton(pattern)
@@ -5,12 +5,13 @@ from array import array
 import pytest
 
 from whoosh import analysis, fields, formats, query
-from whoosh.compat import u, b, text_type
+from whoosh.compat import BytesIO, u, b, text_type
 from whoosh.compat import array_tobytes, xrange
 from whoosh.codec import default_codec
 from whoosh.filedb.filestore import RamStorage
+from whoosh.system import pack_uint
 from whoosh.util.numeric import byte_to_length, length_to_byte
-from whoosh.util.testing import TempStorage
+from whoosh.util.testing import TempIndex, TempStorage
 
 
 def _make_codec(**kwargs):
@@ -428,6 +429,118 @@ def test_skip():
     assert m.id() == 1800
 
 
+def test_block_formats():
+    from whoosh.codec.whoosh3 import WHOOSH3_BINARY_MAGIC, WHOOSH3_HEADER_MAGIC
+
+    field = fields.TEXT()
+    postings = [(0, 1.0, b("a"), 2), (3, 1.0, b("b"), 1), (290, 2.5, b("cc"), 7),
+                (70000, 1.0, b("dddd"), 300), (70001, 1.0, b("e"), 1)]
+
+    for binary, magic in ((True, WHOOSH3_BINARY_MAGIC),
+                          (False, WHOOSH3_HEADER_MAGIC)):
+        st, codec, seg = _make_codec(blocklimit=2, binary=binary)
+        fw = codec.field_writer(st, seg)
+        fw.start_field("text", field)
+        fw.start_term(b("alfa"))
+        for docnum, weight, vbytes, length in postings:
+            fw.add(docnum, weight, vbytes, length)
+        fw.finish_term()
+        fw.finish_field()
+        fw.close()
+
+        tr = codec.terms_reader(st, seg)
+        ti = tr.term_info("text", b("alfa"))
+        offset, _ = ti.extent()
+        assert st.open_file(seg.make_filename(".pst")).get(offset, 4) == magic
+
+        m = tr.matcher("text", b("alfa"), field.format)
+        assert m.block_max_id() == 3
+        assert m.block_max_weight() == 1.0
+        ps = []
+        while m.is_active():
+            ps.append((m.id(), m.weight(), m.value()))
+            m.next()
+        assert ps == [p[:3] for p in postings]
+
+        m = tr.matcher("text", b("alfa"), field.format)
+        m.skip_to(70000)
+        assert m.id() == 70000
+        assert m.block_max_length() == byte_to_length(length_to_byte(300))
+        tr.close()
+
+
+def test_number_encodings():
+    from whoosh.filedb.structfile import BufferFile, StructFile
+    from whoosh.util import numlists
+
+    encodings = [numlists.Varints(), numlists.Simple16(), numlists.GInts(),
+                 numlists.PForDelta()]
+    domains = [[], [0], [0] * 50, list(range(200)),
+               [random.randint(0, 300) for _ in xrange(500)],
+               [random.randint(0, 5) for _ in xrange(127)] + [2 ** 27, 70000]]
+    for enc in encodings:
+        for nums in domains:
+            f = StructFile(BytesIO())
+            enc.write_nums(f, nums)
+            bs = f.file.getvalue()
+
+            f = BufferFile(bs + b("xyz"))
+            assert list(enc.read_nums(f, len(nums))) == nums
+            assert f.tell() == len(bs)
+
+
+@pytest.mark.parametrize("encoding", [None, "varints", "simple16", "gints",
+                                      "pfordelta"])
+def test_posting_encodings(encoding):
+    field = fields.TEXT(phrase=False)
+    docnums = sorted(random.sample(xrange(100000), 300))
+    weights = [float(random.randint(1, 1000)) for _ in docnums]
+    st, codec, seg = _make_codec(fieldencodings={"a": (encoding, encoding)})
+
+    fw = codec.field_writer(st, seg)
+    for fieldname in ("a", "b"):
+        fw.start_field(fieldname, field)
+        fw.start_term(b("test"))
+        for docnum, weight in zip(docnums, weights):
+            fw.add(docnum, weight, pack_uint(int(weight)), 1)
+        fw.finish_term()
+        fw.finish_field()
+    fw.close()
+
+    tr = codec.terms_reader(st, seg)
+    for fieldname in ("a", "b"):
+        m = tr.matcher(fieldname, b("test"), field.format)
+        assert list(m.items_as("weight")) == list(zip(docnums, weights))
+    tr.close()
+
+    with pytest.raises(ValueError):
+        default_codec(idencoding="foo")
+
+
+def test_vector_block_formats():
+    field = fields.TEXT(vector=True)
+    items = [(u("alfa"), 1.0, b("t1")), (u("\u00e9clair"), 2.0, b("t2")),
+             (u("zulu"), 1.0, b("t3"))]
+
+    for binary in (True, False):
+        st, codec, seg = _make_codec(blocklimit=2, binary=binary)
+        dw = codec.per_document_writer(st, seg)
+        dw.start_doc(0)
+        dw.add_vector_items("title", field, items)
+        dw.finish_doc()
+        dw.close()
+        seg.set_doc_count(1)
+
+        pdr = codec.per_document_reader(st, seg)
+        m = pdr.vector(0, "title", field.vector)
+        assert m.block_max_id() == u("\u00e9clair")
+        ps = []
+        while m.is_active():
+            ps.append((m.id(), m.weight(), m.value()))
+            m.next()
+        assert ps == items
+
+
 # def test_spelled_field():
 #     field = fields.TEXT(spelling=True)
 #     st, codec, seg = _make_codec()
@@ -550,6 +663,84 @@ def test_plaintext_codec():
         assert " ".join(v.all_ids()) == "charlie delta echo"
 
 
+def test_block_terms():
+    from whoosh.codec.whoosh3 import W3Codec
+
+    schema = fields.Schema(id=fields.ID(stored=True), text=fields.TEXT)
+    domain = u("alfa bravo charlie delta echo foxtrot golf hotel").split()
+    with TempIndex(schema, "blockterms") as ix:
+        with ix.writer(codec=W3Codec(blockterms=True)) as w:
+            for i, word in enumerate(domain):
+                w.add_document(id=text_type(i),
+                               text=u(" ").join(domain[i:i + 3]))
+        # Add a segment in the old format so both are read together
+        with ix.writer(codec=W3Codec()) as w:
+            w.merge = False
+            w.add_document(id=u("x"), text=u("bravo echoes"))
+
+        with ix.searcher() as s:
+            r = s.reader()
+            assert list(r.lexicon("text")) == [b(w) for w in sorted(
+                domain + ["echoes"])]
+            assert list(r.expand_prefix("text", "ec")) == [b("echo"),
+                                                           b("echoes")]
+            assert r.doc_frequency("text", "bravo") == 3
+            assert r.frequency("text", "zulu") == 0
+            assert ("text", "zulu") not in r
+            assert sorted(r.terms_within("text", u("echoe"), 1)) == [
+                u("echo"), u("echoes")]
+
+            q = query.Term("text", u("delta"))
+            assert sorted(hit["id"] for hit in s.search(q)) == ["1", "2", "3"]
+            q = query.Wildcard("text", u("*o"))
+            assert len(s.search(q, limit=None)) == 6
+
+        # Merging the segments keeps the writer's codec
+        with ix.writer(codec=W3Codec(blockterms=True)) as w:
+            w.optimize = True
+        with ix.reader() as r:
+            assert r.doc_frequency("text", "bravo") == 3
+            assert list(r.expand_prefix("text", "ec")) == [b("echo"),
+                                                           b("echoes")]
+
+
+def test_block_stored_fields():
+    from whoosh.codec.whoosh3 import W3Codec
+
+    schema = fields.Schema(id=fields.ID(stored=True), n=fields.NUMERIC(stored=True),
+                           text=fields.TEXT(stored=True))
+    docs = [dict(id=text_type(i), n=i, text=u(" ").join([u("word%d") % i] * i))
+            for i in xrange(300)]
+    with TempIndex(schema, "blockstored") as ix:
+        codec = W3Codec(blockstored=True)
+        with ix.writer(codec=codec) as w:
+            for doc in docs[:200]:
+                w.add_document(**doc)
+        # Add a segment in the old format so both are read together
+        with ix.writer(codec=W3Codec()) as w:
+            w.merge = False
+            for doc in docs[200:]:
+                w.add_document(**doc)
+
+        with ix.reader() as r:
+            assert not r.is_atomic()
+            assert r.stored_fields(150) == docs[150]
+            assert r.stored_fields(250) == docs[250]
+            docnums = [299, 5, 150, 5, 205, 0]
+            assert r.stored_fields_many(docnums) == [docs[i] for i in docnums]
+            assert list(r.all_stored_fields()) == docs
+
+        with ix.writer(codec=codec) as w:
+            w.delete_by_term("id", u("10"))
+            w.optimize = True
+        with ix.searcher() as s:
+            assert s.reader().is_atomic()
+            assert list(s.all_stored_fields()) == docs[:10] + docs[11:]
+            assert s.stored_fields_many([0, 298, 10]) == [docs[0], docs[299],
+                                                           docs[11]]
+            assert s.document(id=u("299")) == docs[299]
+
+
 def test_memory_codec():
     from whoosh.codec import memory
     from whoosh.searching import Searcher
@@ -619,3 +810,43 @@ def test_memory_multiwrite():
     assert [sf["line"] for sf in reader.all_stored_fields()] == domain
     assert (" ".join(reader.field_terms("line"))
             == "alfa bravo charlie delta echo foxtrot india juliet")
+
+
+def test_doc_length_bytes():
+    from whoosh import scoring
+    from whoosh.util.numeric import length_table
+
+    schema = fields.Schema(a=fields.TEXT, b=fields.TEXT)
+    with TempStorage("lengthbytes") as st:
+        ix = st.create_index(schema)
+        with ix.writer() as w:
+            for i in xrange(50):
+                w.add_document(a=u(" ").join([u("alfa")] * (i + 1)))
+            # Documents at the end without the "a" field
+            for i in xrange(5):
+                w.add_document(b=u("bravo"))
+
+        with ix.reader() as r:
+            lbytes = r.doc_length_bytes("a")
+            assert len(lbytes) == 55
+            for docnum in xrange(55):
+                assert (length_table[lbytes[docnum]]
+                        == (r.doc_field_length(docnum, "a") or 0))
+            assert r.doc_length_bytes("b")[0] == 0
+            assert r.doc_length_bytes("c") is None
+
+            avgfl = r.field_length("a") / 55.0
+            norms = r.bm25_norms("a", avgfl, 0.75, 1.2)
+            assert len(norms) == 256
+            assert r.bm25_norms("a", avgfl, 0.75, 1.2) is norms
+
+        with ix.searcher() as s:
+            m = s.postings("a", u("alfa"), scoring.BM25F())
+            idf = s.idf("a", u("alfa"))
+            avgfl = s.avg_field_length("a")
+            while m.is_active():
+                length = s.doc_field_length(m.id(), "a")
+                target = scoring.bm25(idf, m.weight(), length, avgfl, 0.75,
+                                      1.2)
+                assert m.score() == pytest.approx(target)
+                m.next()
@@ -248,3 +248,48 @@ def test_filter_results_count():
             q = query.Term("text", u("alfa"))
             r2 = s.search(q, filter=r1, limit=1)
             assert len(r2) == 2
+
+
+def test_parallel_search():
+    from whoosh import sorting
+
+    schema = fields.Schema(id=fields.STORED, text=fields.TEXT,
+                           tag=fields.ID(sortable=True))
+    domain = u("alfa bravo charlie delta echo foxtrot golf").split()
+    with TempIndex(schema) as ix:
+        count = 0
+        for _ in xrange(4):
+            with ix.writer(merge=False) as w:
+                for i in xrange(25):
+                    words = [domain[(count * 3 + j) % 7] for j in xrange(i % 5 + 1)]
+                    w.add_document(id=count, text=u(" ").join(words),
+                                   tag=domain[count % 3])
+                    count += 1
+
+        with ix.searcher() as s:
+            assert len(s.leaf_searchers()) == 4
+
+            q = query.Or([query.Term("text", u("alfa")),
+                          query.Term("text", u("echo"))])
+            argsets = [{}, {"limit": None}, {"limit": 5},
+                       {"sortedby": "tag", "limit": 12},
+                       {"scored": False},
+                       {"groupedby": "tag"},
+                       {"groupedby": "tag", "maptype": sorting.Count},
+                       {"filter": query.Term("tag", u("bravo"))},
+                       {"mask": query.Term("tag", u("alfa")), "terms": True}]
+            for kwargs in argsets:
+                r1 = s.search(q, **kwargs)
+                r2 = s.search(q, workers=3, **kwargs)
+                assert [(h.docnum, h.score) for h in r1] == [(h.docnum, h.score) for h in r2]
+                assert len(r1) == len(r2)
+                if "groupedby" in kwargs:
+                    assert r1.groups() == r2.groups()
+                if kwargs.get("terms"):
+                    for hit in r1:
+                        assert hit.matched_terms() == r2.docterms[hit.docnum]
+
+            # Collapsing can't be merged, so it falls back to a normal search
+            r1 = s.search(q, collapse="tag")
+            r2 = s.search(q, collapse="tag", workers=3)
+            assert [h.docnum for h in r1] == [h.docnum for h in r2]
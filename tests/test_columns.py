@@ -1,6 +1,8 @@
 from __future__ import with_statement
 import inspect, random, sys
 
+import pytest
+
 from whoosh import columns, fields, query
 from whoosh.codec.whoosh3 import W3Codec
 from whoosh.compat import b, u, BytesIO, bytes_type, text_type
@@ -177,6 +179,12 @@ def test_roundtrip():
     c = columns.FixedBytesListColumn(4)
     _rt(c, [[b('garn'), b('amet')], [b('pear')]], [])
 
+    c = columns.CompressedBlockColumn()
+    _rt(c, [b("a"), b("ccc"), b("bbb"), b(""), b("e"), b("dd")], b(""))
+
+    c = columns.StoredFieldsColumn()
+    _rt(c, [{"a": u("alfa"), "b": 1}, {"c": [1.5, None]}, {"a": b("x")}], {})
+
 
 def test_multivalue():
     schema = fields.Schema(s=fields.TEXT(sortable=True),
@@ -321,3 +329,137 @@ def test_varbytes_offsets():
             for i in (10, 100, 1000, 3000):
                 assert cr[i] == values[i % vlen]
 
+
+def test_stored_fields_column():
+    from datetime import datetime
+
+    values = [{"id": i, "title": u("Document %d") % i, "big": -2 ** 70 * i,
+               "data": b("\x00\xff") * (i % 5), "score": i / 4.0,
+               "tags": [u("a"), (i, True, False), None],
+               "when": datetime(2000, 1, 1 + i % 28)}
+              for i in xrange(500)]
+    # Leave some documents without stored fields
+    for i in xrange(0, 500, 7):
+        values[i] = {}
+
+    with TempStorage("storedcol") as st:
+        col = columns.StoredFieldsColumn(blocksize=1, cachesize=2)
+        f = st.create_file("sf")
+        w = col.writer(f)
+        for docnum, v in enumerate(values):
+            if v:
+                w.add(docnum, v)
+        w.finish(len(values) + 3)
+        length = f.tell()
+        f.close()
+
+        f = st.open_file("sf")
+        assert columns.StoredFieldsColumn.is_column(f, 0, length)
+        r = col.reader(f, 0, length, len(values) + 3)
+        assert len(r._firstdocs) > 10
+        target = values + [{}, {}, {}]
+        assert list(r) == target
+        for docnum in [5, 400, 6, 7, 499, 0, 501, 250, 251]:
+            assert r[docnum] == target[docnum]
+        assert len(r._cache) == 2
+
+        docnums = [499, 3, 250, 3, 502, 120, 0]
+        assert r.get_many(docnums) == [target[d] for d in docnums]
+        # Out of range document numbers raise the same error either way
+        for docnum in (len(target), -1):
+            with pytest.raises(IndexError):
+                r.fields(docnum)
+            with pytest.raises(IndexError):
+                r.get_many([3, docnum])
+        f.close()
+
+
+def test_stored_fields_projection():
+    body = u(" ").join(u("word%d") % i for i in xrange(2000))
+    values = [{"title": u("Title %d") % i, "url": u("/doc/%d") % i,
+               "body": body + text_type(i)} for i in xrange(20)]
+
+    with TempStorage("storedproj") as st:
+        col = columns.StoredFieldsColumn(maxinline=1)
+        f = st.create_file("sf")
+        w = col.writer(f)
+        for docnum, v in enumerate(values):
+            w.add(docnum, v)
+        w.finish(len(values))
+        length = f.tell()
+        f.close()
+
+        f = st.open_file("sf")
+        r = col.reader(f, 0, length, len(values))
+        assert r[3] == values[3]
+        assert r.fields(19, ["body"]) == {"body": values[19]["body"]}
+
+        # Asking for the small fields shouldn't touch the large values
+        def no_external(ints, pos):
+            raise AssertionError("read an external value")
+        r._external = no_external
+        assert r.fields(5, ["title", "url", "missing"]) == {
+            "title": u("Title 5"), "url": u("/doc/5")}
+        assert r.get_many([7, 2], ["url"]) == [{"url": u("/doc/7")},
+                                               {"url": u("/doc/2")}]
+        assert r.fields(4, []) == {}
+        f.close()
+
+
+def test_compressed_block_column():
+    domain = [b("alfa"), b("bravo"), b("charlie"), b("delta"), b("echo")]
+    values = {}
+    for docnum in xrange(3000):
+        if docnum % 11 and not 1000 <= docnum < 1200:
+            values[docnum] = domain[docnum % 5] + str(docnum).encode("ascii")
+    doccount = 3010
+
+    with TempStorage("cbcol") as st:
+        col = columns.CompressedBlockColumn(blocksize=1, cachesize=2)
+        f = st.create_file("cb")
+        f.write(b("hello"))
+        w = col.writer(f)
+        for docnum in sorted(values):
+            w.add(docnum, values[docnum])
+        w.finish(doccount)
+        length = f.tell() - 5
+        f.close()
+
+        target = [values.get(docnum, b("")) for docnum in xrange(doccount)]
+        f = st.open_file("cb")
+        r = col.reader(f, 5, length, doccount)
+        assert len(r._firstdocs) > 10
+        assert list(r) == target
+        for docnum in [0, 1, 11, 999, 1000, 1100, 1200, 2999, 3005, 5, 6]:
+            assert r[docnum] == target[docnum]
+        assert len(r._cache) == 2
+
+        docnums = [3005, 12, 2500, 1100, 12, 0, 1999, 1200]
+        assert r.get_many(docnums) == [target[d] for d in docnums]
+        f.close()
+
+
+def test_column_large_offsets():
+    # The block formats store their offsets as 64-bit numbers, so columns can
+    # be larger than 4 GB
+    big = 2 ** 32 + 10
+    positions = [0, 2 ** 31, big, 2 ** 40]
+
+    with TempStorage("largeoffsets") as st:
+        f = st.create_file("offsets")
+        columns.write_qsafe_array("Q", positions, f)
+        f.write(columns._cb_footer.pack(big, 3,
+                                        columns.CompressedBlockColumn.magic))
+        f.write(columns._sf_footer.pack(big, 1, 2, 3,
+                                        columns.StoredFieldsColumn.magic))
+        f.close()
+
+        f = st.open_file("offsets")
+        assert columns.read_qsafe_array("Q", len(positions), f) == positions
+        footer = f.read(columns._cb_footer.size)
+        assert columns._cb_footer.unpack(footer) == (
+            big, 3, columns.CompressedBlockColumn.magic)
+        footer = f.read(columns._sf_footer.size)
+        assert columns._sf_footer.unpack(footer) == (
+            big, 1, 2, 3, columns.StoredFieldsColumn.magic)
+        f.close()
@@ -4,6 +4,7 @@ from random import randint, choice, sample
 from whoosh import fields, matching, qparser, query
 from whoosh.compat import b, u, xrange, permutations
 from whoosh.filedb.filestore import RamStorage
+from whoosh.matching import combo
 from whoosh.query import And, Term
 from whoosh.util import make_binary_tree
 from whoosh.scoring import WeightScorer
@@ -554,3 +555,208 @@ def test_every_matcher():
                     pass
             return 0
 
+
+
+def test_wand_matcher():
+    ws = WeightScorer(1.0)
+    l1 = matching.ListMatcher([1, 2, 5, 9], [1.0, 3.0, 1.0, 2.0], scorer=ws)
+    l2 = matching.ListMatcher([2, 3, 9, 12], [1.0, 1.0, 4.0, 1.0], scorer=ws)
+    l3 = matching.ListMatcher([5, 12], [1.0, 1.0], scorer=ws)
+    wm = matching.WandMatcher([l1, l2, l3])
+    items = []
+    while wm.is_active():
+        items.append((wm.id(), wm.score()))
+        wm.next()
+    assert items == [(1, 1.0), (2, 4.0), (3, 1.0), (5, 2.0), (9, 6.0),
+                     (12, 2.0)]
+
+    wm = matching.WandMatcher([l.copy() for l in (l1, l2, l3)])
+    wm.reset()
+    wm.skip_to(4)
+    assert wm.id() == 5
+    # Skip documents that can't score higher than 4.5 based on the maximum
+    # weights of the lists
+    wm.skip_to_quality(4.5)
+    assert wm.id() == 9
+    assert wm.score() == 6.0
+    wm.next()
+    assert wm.id() == 12
+    wm.next()
+    assert not wm.is_active()
+
+
+def test_wand_or():
+    domain = u("alfa bravo charlie delta echo foxtrot golf hotel india").split()
+    schema = fields.Schema(text=fields.TEXT)
+    ix = RamStorage().create_index(schema)
+    with ix.writer() as w:
+        for i in xrange(1500):
+            words = [domain[randint(0, i % 9)] for _ in xrange(randint(1, 6))]
+            w.add_document(text=u(" ").join(words))
+
+    with ix.searcher() as s:
+        for _ in xrange(20):
+            words = sample(domain, randint(3, 7))
+            q = query.Or([query.Term("text", word) for word in words],
+                         boost=choice([1.0, 2.0]))
+            wq = query.compound.WandOr(q.subqueries, boost=q.boost)
+            dq = query.compound.DefaultOr(q.subqueries, boost=q.boost)
+            assert isinstance(wq.matcher(s, s.context()), matching.WandMatcher)
+
+            # Compare with the top of an unlimited search, since the binary
+            # tree of unions may prune approximately
+            allhits = [(round(h.score, 5), h.docnum) for h
+                       in s.search(dq, limit=None)]
+            for limit in (1, 10, 100):
+                r = s.search(wq, limit=limit)
+                assert ([(round(h.score, 5), h.docnum) for h in r]
+                        == allhits[:limit])
+
+
+def test_arrayunion_vectorize():
+    domain = u("alfa bravo charlie delta echo foxtrot golf hotel india").split()
+    schema = fields.Schema(text=fields.TEXT)
+    ix = RamStorage().create_index(schema)
+    with ix.writer() as w:
+        for i in xrange(1200):
+            words = [domain[randint(0, i % 9)] for _ in xrange(randint(1, 6))]
+            w.add_document(text=u(" ").join(words))
+    with ix.writer() as w:
+        for docnum in xrange(0, 1200, 7):
+            w.delete_document(docnum)
+
+    with ix.searcher() as s:
+        doccount = s.doc_count_all()
+        for _ in xrange(10):
+            qs = [query.Term("text", word) for word in sample(domain, 4)]
+            target = sorted(set(docnum for q in qs
+                                for docnum in q.docs(s)))
+
+            for scored in (True, False):
+                results = []
+                for vectorize in (False, True):
+                    ms = [q.matcher(s, s.context()) for q in qs]
+                    am = matching.ArrayUnionMatcher(ms, doccount, boost=2.0,
+                                                    scored=scored,
+                                                    partsize=300,
+                                                    vectorize=vectorize)
+                    items = []
+                    while am.is_active():
+                        items.append((am.id(), am.score()))
+                        am.next()
+                    results.append(items)
+                assert ([(d, round(score, 5)) for d, score in results[0]]
+                        == [(d, round(score, 5)) for d, score in results[1]])
+                assert [docnum for docnum, _ in results[1]] == target
+                if scored:
+                    scores = dict(results[1])
+
+            # Skipping ahead
+            ms = [q.matcher(s, s.context()) for q in qs]
+            am = matching.ArrayUnionMatcher(ms, doccount, partsize=300)
+            am.skip_to(650)
+            assert am.id() == min(d for d in target if d >= 650)
+
+            # With NumPy, documents that can't score above the minimum quality
+            # are skipped after replace()
+            if combo.numpy is not None:
+                ms = [q.matcher(s, s.context()) for q in qs]
+                am = matching.ArrayUnionMatcher(ms, doccount, boost=2.0,
+                                                partsize=300)
+                minscore = sorted(scores.values())[len(scores) // 2]
+                am = am.replace(minscore)
+                found = []
+                while am.is_active():
+                    found.append(am.id())
+                    am.next()
+                assert found == sorted(docnum for docnum, score
+                                       in scores.items() if score > minscore)
+
+
+def test_block_scores():
+    domain = u("alfa bravo charlie delta echo").split()
+    schema = fields.Schema(text=fields.TEXT)
+    ix = RamStorage().create_index(schema)
+    with ix.writer() as w:
+        for i in xrange(1000):
+            words = [choice(domain) for _ in xrange(randint(1, 8))]
+            w.add_document(text=u(" ").join(words))
+    with ix.writer() as w:
+        for docnum in xrange(0, 1000, 9):
+            w.delete_document(docnum)
+
+    with ix.searcher() as s:
+        q = query.Term("text", u("bravo"), boost=1.5)
+        m = q.matcher(s, s.context())
+        assert m.supports_block_scores()
+        target = []
+        while m.is_active():
+            target.append((m.id(), round(m.score(), 5)))
+            m.next()
+
+        m = q.matcher(s, s.context())
+        items = []
+        while m.is_active():
+            ids, scores = m.block_scores()
+            items.extend((docnum, round(score, 5))
+                         for docnum, score in zip(ids, scores))
+            m.skip_block()
+        assert items == target
+
+        # Bulk-scored top N matches the full scored results
+        r = s.search(q, limit=10)
+        full = s.search(q, limit=None)
+        assert ([(hit.docnum, round(hit.score, 5)) for hit in r]
+                == [(hit.docnum, round(hit.score, 5)) for hit in full[:10]])
+
+
+def test_block_scores_overridden():
+    from whoosh import collectors, scoring
+
+    schema = fields.Schema(id=fields.STORED, text=fields.TEXT,
+                           tag=fields.KEYWORD(scorable=False))
+    ix = RamStorage().create_index(schema)
+    with ix.writer() as w:
+        for i in xrange(300):
+            w.add_document(id=i, text=u("alfa bravo") if i % 2 else u("alfa"),
+                           tag=u("x"))
+
+    # A scorer subclass that overrides score() doesn't get bulk scoring,
+    # because the inherited score_block() would ignore the new score()
+    class IdScorer(scoring.BM25FScorer):
+        def score(self, matcher):
+            return float(matcher.id())
+
+    class IdWeighting(scoring.BM25F):
+        def scorer(self, searcher, fieldname, text, qf=1):
+            return IdScorer(searcher, fieldname, text, self.B, self.K1)
+
+    class TagScorer(scoring.WeightScorer):
+        def score(self, matcher):
+            return -float(matcher.id())
+
+    with ix.searcher(weighting=IdWeighting()) as s:
+        # The scorer's quality methods don't match its score() method, so
+        # turn off the block quality optimizations
+        r = s.search(query.Term("text", u("alfa")), limit=3, optimize=False)
+        assert [hit["id"] for hit in r] == [299, 298, 297]
+
+    with ix.searcher() as s:
+        tsc = TagScorer(1.0)
+        assert not tsc.supports_score_block()
+        assert scoring.WeightScorer(1.0).supports_score_block()
+
+        # A collector that overrides collect() still has it called for every
+        # document
+        class CountingCollector(collectors.UnlimitedCollector):
+            calls = 0
+
+            def collect(self, sub_docnum):
+                self.calls += 1
+                return collectors.UnlimitedCollector.collect(self,
+                                                             sub_docnum)
+
+        c = CountingCollector()
+        s.search_with_collector(query.Term("text", u("bravo")), c)
+        assert c.calls == 150
+        assert len(c.results()) == 150
@@ -1,7 +1,7 @@
 from __future__ import with_statement
 import os, threading, time
 
-from whoosh.compat import u
+from whoosh.compat import b, u
 from whoosh.util.filelock import try_for
 from whoosh.util.numeric import length_to_byte, byte_to_length
 from whoosh.util.testing import TempStorage
@@ -47,6 +47,37 @@ def test_ramstorage():
     lock.release()
 
 
+def test_mapped_file():
+    from whoosh.filedb.structfile import MmapFile, StructFile
+
+    with TempStorage("mappedfile") as st:
+        with st.create_file("a") as f:
+            f.write_int(100)
+            f.write_string(b("hello"))
+            f.write_int(-5)
+        st.create_file("empty").close()
+
+        f = st.open_file("a", mapped=True)
+        assert isinstance(f, MmapFile)
+        assert f.get_int(0) == 100
+        assert f.get_int(10) == -5
+        assert f.read_int() == 100
+        assert f.read_string() == b("hello")
+        assert f.get_array(0, "i", 1)[0] == 100
+        f.close()
+
+        # An empty file can't be mapped, so it falls back to a regular file
+        f = st.open_file("empty", mapped=True)
+        assert type(f) is StructFile
+        f.close()
+
+        st.supports_mmap = False
+        f = st.open_file("a", mapped=True)
+        assert type(f) is StructFile
+        assert f.get_int(10) == -5
+        f.close()
+
+
 def test_filelock_simple():
     with TempStorage("simplefilelock") as st:
         lock1 = st.lock("testlock")
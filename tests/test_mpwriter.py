@@ -275,3 +275,34 @@ def test_finish_segment():
             w.add_document(a=text_type(i) * 10)
 
         w.commit()
+
+
+def test_streamed_postings():
+    check_multi()
+
+    from whoosh.multiproc import MpWriter
+
+    schema = fields.Schema(id=fields.ID(stored=True), text=fields.TEXT)
+    domain = [u("w%d") % i for i in xrange(50)]
+    rnd = random.Random(0)
+    docs = [(text_type(i), u(" ").join(rnd.choice(domain)
+                                        for _ in xrange(30)))
+            for i in xrange(400)]
+
+    def postings(ix):
+        with ix.reader() as r:
+            return [(fieldname, text, r.stored_fields(docnum)["id"], w, v)
+                    for fieldname, text, docnum, w, v in r.iter_postings()]
+
+    with TempIndex(schema, "streamedserial") as ix1:
+        with ix1.writer() as w:
+            for docid, text in docs:
+                w.add_document(id=docid, text=text)
+        target = sorted(postings(ix1))
+
+    with TempIndex(schema, "streamedmulti") as ix2:
+        with MpWriter(ix2, procs=3, batchsize=25) as w:
+            for docid, text in docs:
+                w.add_document(id=docid, text=text)
+        assert sorted(postings(ix2)) == target
+        assert not any(name.endswith(".tmp") for name in ix2.storage.list())
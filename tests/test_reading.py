@@ -498,3 +498,60 @@ def test_term_inspection_multi_reader():
             w.merge = False
 
         _check_inspection_results(ix)
+
+
+def test_automaton_terms():
+    import fnmatch
+    import re
+    from whoosh import query
+    from whoosh.automata import glob, lev
+    from whoosh.codec.whoosh3 import W3Codec
+    from whoosh.support.levenshtein import levenshtein
+
+    domain = u"abcde"
+    words = [u""]
+    for _ in xrange(4):
+        words += [w + c for w in words for c in domain]
+    words = sorted(set(words[1:]))
+    schema = fields.Schema(text=fields.KEYWORD)
+
+    def check(reader):
+        dfa = lev.levenshtein_automaton(u"bade", 2, 1).to_dfa()
+        target = [w for w in words
+                  if w[0] == u"b" and levenshtein(w, u"bade", 2) <= 2]
+        assert list(reader.automaton_terms("text", dfa)) == target
+        assert list(reader.terms_within("text", u"bade", 2, 1)) == target
+
+        dfa = glob.glob_automaton(u"a?c*e").to_dfa()
+        target = [w for w in words if fnmatch.fnmatch(w, u"a?c*e")]
+        assert list(reader.automaton_terms("text", dfa)) == target
+
+        for pattern in [u"a?c*e", u"*d?a", u"?b*"]:
+            q = query.Wildcard("text", pattern)
+            target = [w.encode("utf8") for w in words
+                      if fnmatch.fnmatchcase(w, pattern)]
+            assert list(q._btexts(reader)) == target
+
+        for pattern in [u"b[a-c]+e$", u".a(b|d)", u"(?=e)e"]:
+            q = query.Regex("text", pattern)
+            target = [w.encode("utf8") for w in words
+                      if re.match(pattern, w)]
+            assert list(q._btexts(reader)) == target
+
+    for blockterms in (False, True):
+        codec = W3Codec(blockterms=blockterms)
+        with TempIndex(schema) as ix:
+            with ix.writer(codec=codec) as w:
+                for word in words:
+                    w.add_document(text=word)
+            with ix.reader() as r:
+                check(r)
+
+            # Split the words across two segments
+            with ix.writer(codec=codec) as w:
+                w.merge = False
+                for word in words[::3]:
+                    w.add_document(text=word)
+            with ix.reader() as r:
+                assert not r.is_atomic()
+                check(r)
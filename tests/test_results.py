@@ -673,3 +673,39 @@ def test_filter_by_result():
             assert all(x["title"] == "even" and x["content"] == "foo"
                        for x in result)
 
+
+
+def test_stored_fields_projection():
+    schema = fields.Schema(id=fields.ID(stored=True),
+                           title=fields.TEXT(stored=True),
+                           body=fields.TEXT(stored=True))
+    body = u(" ").join([u("alfa bravo charlie")] * 500)
+    with TempIndex(schema, "storedproj") as ix:
+        for codec in (W3Codec(blockstored=True), W3Codec()):
+            with ix.writer(codec=codec) as w:
+                w.merge = False
+                for i in xrange(3):
+                    w.add_document(id=text_type(i), title=u("Title %d") % i,
+                                   body=body)
+
+        with ix.searcher() as s:
+            q = query.Term("body", u("bravo"))
+            r = s.search(q, limit=None, stored_fields=["id", "title"])
+            assert len(r) == 6
+            assert r.fieldnames == ["id", "title"]
+            for hit in r:
+                assert sorted(hit.keys()) == ["id", "title"]
+                # Fields left out of the projection are loaded on their own
+                assert "body" in hit
+                assert hit["body"] == body
+                assert "bravo" in hit.highlights("body")
+            assert r.fields(0, fieldnames=["id"]) == {"id": r[0]["id"]}
+
+            r = s.search(q, limit=None)
+            assert r.fieldnames is None
+            assert sorted(r[0].keys()) == ["body", "id", "title"]
+            assert r.fields(1, ["title"]) == {"title": r[1]["title"]}
+
+            docnums = sorted(r.docs())
+            sfs = s.stored_fields_many(docnums, ["id"])
+            assert sfs == [{"id": u(x)} for x in "012012"]
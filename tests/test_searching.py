@@ -2,6 +2,8 @@
 
 from __future__ import with_statement
 import copy
+import sys
+import threading
 from datetime import datetime, timedelta
 
 import pytest
@@ -1764,3 +1766,147 @@ def test_limit_scores():
 
 
 
+
+
+def test_search_many():
+    domain = u"alfa bravo charlie delta echo foxtrot golf".split()
+    schema = fields.Schema(id=fields.STORED, text=fields.TEXT)
+    with TempIndex(schema) as ix:
+        count = 0
+        for _ in xrange(3):
+            with ix.writer(merge=False) as w:
+                for words in permutations(domain, 3):
+                    w.add_document(id=count, text=u" ".join(words))
+                    count += 1
+
+        qs = [query.Term("text", u"alfa"),
+              query.And([query.Term("text", u"alfa"),
+                         query.Term("text", u"echo")]),
+              query.Or([query.Term("text", u"echo"),
+                        query.Term("text", u"golf")]),
+              query.Term("text", u"zulu")]
+        with ix.searcher() as s:
+            singles = [s.search(q, limit=5) for q in qs]
+            for workers in (None, 3):
+                rs = s.search_many(qs, limit=5, workers=workers)
+                assert len(rs) == len(qs)
+                for r1, r2 in zip(singles, rs):
+                    assert r2.q is not None
+                    assert ([(h.docnum, h.score) for h in r1]
+                            == [(h.docnum, h.score) for h in r2])
+
+            # While sharing is on, lookups of the same term are remembered
+            reader = s.leaf_searchers()[0][0].reader()
+            reader.share_postings(True)
+            ti = reader.term_info("text", u"alfa")
+            assert reader.term_info("text", u"alfa") is ti
+            reader.share_postings(False)
+            assert reader.term_info("text", u"alfa") is not ti
+
+            # Sharing is reference counted, and the caches are limited in size
+            terms = reader._terms
+            reader.share_postings(True)
+            reader.share_postings(True)
+            ti = reader.term_info("text", u"alfa")
+            reader.share_postings(False)
+            assert reader.term_info("text", u"alfa") is ti
+            cache = terms._ticache
+            cache._maxsize = 3
+            for word in domain:
+                reader.term_info("text", word)
+            assert len(cache) <= 3
+            assert cache.get(terms._keycoder("text", b("golf"))) is not None
+            reader.share_postings(False)
+            assert terms._ticache is None and terms._blockcache is None
+            # Extra calls to turn sharing off are ignored
+            reader.share_postings(False)
+            reader.share_postings(True)
+            assert terms._ticache is not None
+            reader.share_postings(False)
+
+
+def test_searcher_manager():
+    schema = fields.Schema(id=fields.ID(stored=True), text=fields.TEXT)
+    with TempIndex(schema, "searchermanager") as ix:
+        with ix.writer() as w:
+            w.add_document(id=u("a"), text=u("alfa bravo"))
+        with ix.writer(merge=False) as w:
+            w.add_document(id=u("b"), text=u("bravo charlie"))
+
+        with searching.SearcherManager(ix) as manager:
+            q = query.Term("text", u("bravo"))
+            s1 = manager.acquire()
+            assert manager.acquire() is s1
+            manager.release(s1)
+            assert not manager.maybe_refresh()
+            old_readers = [r for r, _ in s1.reader().leaf_readers()]
+
+            with ix.writer(merge=False) as w:
+                w.add_document(id=u("c"), text=u("bravo delta"))
+                w.delete_by_term("id", u("b"))
+            assert not manager.up_to_date()
+            assert manager.maybe_refresh()
+
+            with manager.searcher() as s2:
+                assert s2 is not s1
+                new_readers = [r for r, _ in s2.reader().leaf_readers()]
+                # The unchanged segment's reader is shared, the segment with
+                # a new deletion gets a new reader
+                assert new_readers[0] is old_readers[0]
+                assert new_readers[1] is not old_readers[1]
+                assert sorted(hit["id"] for hit in s2.search(q)) == ["a", "c"]
+
+                # The old searcher still works until it's released
+                assert sorted(hit["id"] for hit in s1.search(q)) == ["a", "b"]
+                manager.release(s1)
+                assert old_readers[1].is_closed
+                assert not old_readers[0].is_closed
+
+        assert all(r.is_closed for r in new_readers)
+
+
+def test_searcher_manager_threads():
+    schema = fields.Schema(id=fields.ID(stored=True), text=fields.TEXT)
+    domain = u("alfa bravo charlie delta echo").split()
+    with TempIndex(schema, "searchermanagerthreads") as ix:
+        for i in xrange(3):
+            with ix.writer(merge=False) as w:
+                for j in xrange(200):
+                    w.add_document(id=text_type(j),
+                                   text=u(" ").join(domain[j % 5:]))
+
+        with searching.SearcherManager(ix) as manager:
+            searchers = {}
+            errors = []
+
+            def run(n):
+                try:
+                    for _ in xrange(20):
+                        with manager.searcher() as s:
+                            searchers[n] = s
+                            r = s.search(query.Term("text", domain[n]),
+                                         limit=None)
+                            assert len(r) == 3 * 40 * (n + 1)
+                            assert len(list(r)) == len(r)
+                except Exception:
+                    errors.append(sys.exc_info()[1])
+
+            threads = [threading.Thread(target=run, args=(n,))
+                       for n in xrange(4)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            assert not errors
+
+            # Each thread got its own searcher and readers
+            assert len(set(id(s) for s in searchers.values())) == 4
+            readers = [r for s in searchers.values()
+                       for r, _ in s.reader().leaf_readers()]
+            assert len(set(id(r) for r in readers)) == 12
+
+            # The searchers of finished threads are closed when another
+            # thread gets a new searcher
+            with manager.searcher() as s:
+                assert s not in searchers.values()
+            assert all(r.is_closed for r in readers)
@@ -3,10 +3,13 @@
 from __future__ import with_statement
 import random
 
+import pytest
+
 from whoosh.compat import b, xrange, iteritems
 from whoosh.filedb.filestore import RamStorage
 from whoosh.filedb.filetables import HashReader, HashWriter
 from whoosh.filedb.filetables import OrderedHashWriter, OrderedHashReader
+from whoosh.filedb.filetables import PrefixBlockWriter, PrefixBlockReader
 from whoosh.util.testing import TempStorage
 
 
@@ -147,6 +150,53 @@ def test_ordered_closest():
         hr.close()
 
 
+def test_prefix_blocks():
+    domain = u"abcde"
+    rnd = random.Random(0)
+    keys = set()
+    for _ in xrange(1000):
+        word = u"".join(rnd.choice(domain) for _ in xrange(rnd.randint(1, 6)))
+        keys.add(word.encode("ascii"))
+    keys = sorted(keys)
+
+    st = RamStorage()
+    bw = PrefixBlockWriter(st.create_file("test"), blocksize=7)
+    bw.extras["test"] = 100
+    for key in keys:
+        bw.add(key, key * 2)
+    with pytest.raises(ValueError):
+        bw.add(keys[0], b("x"))
+    bw.close()
+
+    br = PrefixBlockReader.open(st, "test")
+    assert br.extras["test"] == 100
+    assert br.block_count() == (len(keys) + 6) // 7
+    assert list(br.keys()) == keys
+    assert list(br.values()) == [key * 2 for key in keys]
+    for key in keys:
+        assert key in br
+        assert br[key] == key * 2
+
+    for _ in xrange(200):
+        word = u"".join(rnd.choice(domain + u"f")
+                        for _ in xrange(rnd.randint(0, 6)))
+        key = word.encode("ascii")
+        following = [k for k in keys if k >= key]
+        assert (key in br) == (key in keys)
+        assert br.get(key) == (key * 2 if key in keys else None)
+        assert list(br.keys_from(key)) == following
+        assert br.closest_key(key) == (following[0] if following else None)
+    br.close()
+
+    bw = PrefixBlockWriter(st.create_file("empty"))
+    bw.close()
+    br = PrefixBlockReader.open(st, "empty")
+    assert list(br.items()) == []
+    assert list(br.items_from(b("a"))) == []
+    assert b("a") not in br
+    br.close()
+
+
 def test_extras():
     st = RamStorage()
     hw = HashWriter(st.create_file("test"))
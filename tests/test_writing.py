@@ -1,5 +1,5 @@
 from __future__ import with_statement
-import random, time, threading
+import random, sys, time, threading
 
 import pytest
 
@@ -88,6 +88,399 @@ def test_updates():
     assert ix.doc_count() == 1
 
 
+def test_update_documents():
+    schema = fields.Schema(id=fields.ID(unique=True, stored=True),
+                           text=fields.TEXT(stored=True))
+    ix = RamStorage().create_index(schema)
+    with ix.writer() as w:
+        for i in xrange(10):
+            w.add_document(id=text_type(i), text=u"old")
+    # A second segment, with a duplicate of "5"
+    with ix.writer(merge=False) as w:
+        w.add_document(id=u"5", text=u"old")
+        w.add_document(id=u"20", text=u"old")
+
+    with ix.writer(merge=False) as w:
+        count = w.update_documents([
+            {"id": u"3", "text": u"first"},
+            {"id": u"5", "text": u"new"},
+            {"id": u"30", "text": u"new"},
+            {"id": u"3", "text": u"new"},
+            {"text": u"no id"},
+        ])
+        # 3 and both copies of 5
+        assert count == 3
+
+    with ix.searcher() as s:
+        docs = sorted((d["id"], d["text"]) for d in s.all_stored_fields()
+                      if "id" in d)
+        assert docs == sorted([(text_type(i), u"old") for i in xrange(10)
+                               if i not in (3, 5)]
+                              + [(u"20", u"old"), (u"3", u"new"),
+                                 (u"5", u"new"), (u"30", u"new")])
+        assert s.doc_count() == 13
+
+
+def test_update_documents_count():
+    schema = fields.Schema(id=fields.ID(unique=True, stored=True),
+                           path=fields.ID(unique=True, stored=True))
+    ix = RamStorage().create_index(schema)
+    with ix.writer() as w:
+        w.add_document(id=u"1", path=u"/a")
+        w.add_document(id=u"2", path=u"/b")
+        w.add_document(id=u"3", path=u"/c")
+    with ix.writer() as w:
+        w.delete_by_term("id", u"3")
+
+    with ix.writer() as w:
+        # Use a reader that doesn't see the writer's own deletions, so the
+        # first document is found again through its second unique term
+        w.reader = ix.reader
+        # The first document matches both unique terms, and the third was
+        # already deleted, so only one document should be counted
+        count = w.update_documents([{"id": u"1", "path": u"/a"},
+                                    {"id": u"3", "path": u"/x"}])
+        assert count == 1
+
+    with ix.searcher() as s:
+        assert s.doc_count() == 3
+
+
+def test_tiered_merge_policy():
+    schema = fields.Schema(id=fields.ID(stored=True), text=fields.TEXT)
+    ix = RamStorage().create_index(schema)
+    for i in xrange(12):
+        with ix.writer() as w:
+            w.mergetype = writing.NO_MERGE
+            for j in xrange(10):
+                w.add_document(id=text_type(i * 10 + j), text=u"alfa bravo")
+    assert len(ix._segments()) == 12
+
+    policy = writing.TieredMergePolicy(segments_per_tier=4,
+                                       max_merge_at_once=3, floor_mb=0.01)
+    with ix.writer() as w:
+        w.mergetype = policy
+        w.add_document(id=u"new", text=u"charlie")
+    # Only max_merge_at_once segments are merged at a time
+    assert len(policy.last_merge["segments"]) == 3
+    assert policy.last_merge["docs"] == 30
+    assert policy.merged_bytes > 0
+    assert len(ix._segments()) == 10
+    assert ix.doc_count() == 121
+
+    # Segments that would be merged into something bigger than the maximum
+    # size are left alone
+    policy = writing.TieredMergePolicy(segments_per_tier=4,
+                                       max_merged_mb=0.0001)
+    with ix.writer() as w:
+        w.mergetype = policy
+    assert policy.last_merge is None
+    assert len(ix._segments()) == 10
+
+    # A segment with too many deletions is rewritten by itself
+    from whoosh.reading import SegmentReader
+
+    seg = [seg for seg in ix._segments() if seg.doc_count_all() == 10][0]
+    with SegmentReader(ix.storage, ix.schema, seg) as r:
+        ids = [d["id"] for d in r.all_stored_fields()][:6]
+    with ix.writer() as w:
+        w.mergetype = writing.NO_MERGE
+        for docid in ids:
+            w.delete_by_term("id", docid)
+    policy = writing.TieredMergePolicy(segments_per_tier=20)
+    with ix.writer() as w:
+        w.mergetype = policy
+    assert policy.last_merge["docs"] == 4
+    assert len(ix._segments()) == 10
+    assert ix.doc_count() == 115
+
+    with pytest.raises(ValueError):
+        writing.TieredMergePolicy(segments_per_tier=0)
+    with pytest.raises(ValueError):
+        writing.TieredMergePolicy(segments_per_tier=-1)
+    with pytest.raises(ValueError):
+        writing.TieredMergePolicy(floor_mb=0)
+    # A floor too small to be a whole byte is rounded up instead of to 0
+    policy = writing.TieredMergePolicy(floor_mb=1e-9)
+    assert policy.floor_bytes == 1
+    assert policy._allowed_count(1024) > 0
+
+
+def test_background_merge():
+    schema = fields.Schema(id=fields.ID(stored=True), text=fields.TEXT)
+    with TempIndex(schema, "bgmerge") as ix:
+        merger = writing.BackgroundMerger(ix, mergetype=writing.OPTIMIZE)
+        for i in xrange(5):
+            with ix.writer() as w:
+                w.mergetype = merger
+                for j in xrange(10):
+                    w.add_document(id=text_type(i * 10 + j), text=u"alfa")
+        merger.close()
+        assert merger.merge_count >= 1
+        assert len(ix._segments()) == 1
+        assert ix.doc_count() == 50
+
+        # Changes made by other writers while the merge is running
+        def policy(writer, segments):
+            result = writing.OPTIMIZE(writer, segments)
+            with ix.writer() as w:
+                w.mergetype = writing.NO_MERGE
+                w.delete_by_term("id", u"3")
+                w.delete_by_term("id", u"55")
+                w.add_document(id=u"new", text=u"bravo")
+            return result
+
+        with ix.writer() as w:
+            w.mergetype = writing.NO_MERGE
+            for i in xrange(50, 60):
+                w.add_document(id=text_type(i), text=u"alfa")
+            w.delete_by_term("id", u"7")
+
+        merger = writing.BackgroundMerger(ix, mergetype=policy)
+        assert merger.merge()
+        # The merged segment plus the segment added during the merge
+        assert len(ix._segments()) == 2
+        with ix.searcher() as s:
+            ids = set(d["id"] for d in s.all_stored_fields())
+            target = set(text_type(i) for i in xrange(60)) - set(["3", "7",
+                                                                  "55"])
+            assert ids == target | set(["new"])
+            assert s.doc_count() == 58
+            assert not any(name.startswith("MAIN_merging")
+                           for name in ix.storage.list())
+
+        # If another writer merges the same segments, the merge is thrown away
+        def conflict(writer, segments):
+            result = writing.OPTIMIZE(writer, segments)
+            ix.optimize()
+            return result
+
+        merger = writing.BackgroundMerger(ix, mergetype=conflict)
+        assert not merger.merge()
+        assert len(ix._segments()) == 1
+        assert ix.doc_count() == 58
+        assert not any(name.startswith("MAIN_merging")
+                       for name in ix.storage.list())
+
+
+def test_parallel_merge():
+    schema = fields.Schema(id=fields.ID(stored=True),
+                           text=fields.TEXT(stored=True, vector=True),
+                           num=fields.NUMERIC(sortable=True))
+    domain = u"alfa bravo charlie delta echo foxtrot golf hotel india".split()
+    with TempIndex(schema, "parallelmerge") as ix:
+        rnd = random.Random(0)
+        for i in xrange(3):
+            with ix.writer() as w:
+                w.mergetype = writing.NO_MERGE
+                for j in xrange(40):
+                    words = [rnd.choice(domain) for _ in xrange(6)]
+                    w.add_document(id=text_type(i * 40 + j),
+                                   text=u" ".join(words), num=i * 40 + j)
+        with ix.writer() as w:
+            w.mergetype = writing.NO_MERGE
+            for i in xrange(0, 120, 7):
+                w.delete_by_term("id", text_type(i))
+
+        def snapshot():
+            with ix.searcher() as s:
+                stored = sorted((d["id"], d["text"])
+                                for d in s.all_stored_fields())
+                hits = {}
+                for word in domain:
+                    r = s.search(query.Term("text", word), limit=None)
+                    hits[word] = sorted(hit["id"] for hit in r)
+                r = s.search(query.NumericRange("num", 10, 90), limit=None,
+                             sortedby="num")
+                nums = [hit["id"] for hit in r]
+                return stored, hits, nums
+
+        before = snapshot()
+        ix.optimize(mergeprocs=2)
+        assert len(ix._segments()) == 1
+        assert ix.doc_count_all() == 102
+        assert snapshot() == before
+        assert not any("_slice_" in name for name in ix.storage.list())
+
+        with ix.searcher() as s:
+            docnum = s.document_number(id=u"41")
+            v = dict(s.vector_as("frequency", docnum, "text"))
+            stored = s.stored_fields(docnum)["text"].split()
+            assert v == dict((w, stored.count(w)) for w in set(stored))
+
+
+def test_analysis_procs():
+    schema = fields.Schema(id=fields.ID(stored=True),
+                           text=fields.TEXT(stored=True, vector=True,
+                                            spelling=True),
+                           num=fields.NUMERIC(sortable=True))
+    domain = u"alfa bravo charlie delta echo foxtrot golf hotel india".split()
+    rnd = random.Random(1)
+    docs = [u" ".join(rnd.choice(domain) for _ in xrange(8))
+            for _ in xrange(250)]
+
+    def build(name, analysisprocs):
+        with TempIndex(schema, name) as ix:
+            with ix.writer(analysisprocs=analysisprocs) as w:
+                for i, text in enumerate(docs):
+                    w.add_document(id=text_type(i), text=text, num=i,
+                                   _boost=2.0 if i % 5 == 0 else 1.0)
+                    if i == 100:
+                        # Counting the documents includes the ones still
+                        # being analyzed, and doesn't shut the pool down
+                        apool = w._analysispool
+                        assert w.doc_count() == 101
+                        assert w._analysispool is apool
+            with ix.reader() as r:
+                vectors = [list(r.vector_as("weight", docnum, "text"))
+                           for docnum in r.all_doc_ids()]
+                return (list(r.iter_postings()), list(r.all_stored_fields()),
+                        vectors, list(r.column_reader("num")))
+
+    assert build("analysisprocs", 2) == build("analysisserial", 1)
+
+
+def test_add_documents():
+    schema = fields.Schema(id=fields.ID(stored=True),
+                           text=fields.TEXT(stored=True),
+                           num=fields.NUMERIC(sortable=True))
+    docs = [dict(id=u"a", text=u"alfa bravo", num=3),
+            dict(id=u"b", text=u"bravo charlie", num=1, _boost=2.0),
+            dict(id=u"c", text=u"charlie", _stored_text=u"delta", num=2),
+            dict(id=u"d", text=None, num=None)]
+
+    def contents(ix):
+        with ix.reader() as r:
+            return (list(r.iter_postings()), list(r.all_stored_fields()),
+                    list(r.column_reader("num")))
+
+    with TempIndex(schema, "adddocs") as ix:
+        with ix.writer() as w:
+            for doc in docs:
+                w.add_document(**doc)
+        target = contents(ix)
+
+    with TempIndex(schema, "adddocsbatch") as ix:
+        with ix.writer() as w:
+            w.add_documents(docs[:1])
+            w.add_documents(iter(docs[1:]))
+            assert w.doc_count() == 4
+        assert contents(ix) == target
+
+    with TempIndex(schema, "adddocscols") as ix:
+        with ix.writer() as w:
+            w.add_documents({"id": [u"a", u"b"],
+                             "text": [u"alfa bravo", u"bravo charlie"],
+                             "num": [3, 1], "_boost": [1.0, 2.0]})
+            w.add_documents({"id": [u"c", u"d"], "text": [u"charlie", None],
+                             "_stored_text": [u"delta", None],
+                             "num": [2, None]})
+        assert contents(ix) == target
+
+        with ix.writer() as w:
+            with pytest.raises(ValueError):
+                w.add_documents({"id": [u"e", u"f"], "num": [5]})
+            with pytest.raises(fields.UnknownFieldError):
+                w.add_documents([{"id": u"e"}, {"id": u"f", "title": u"x"}])
+            assert w.doc_count() == 0
+
+
+def test_add_documents_default():
+    # Writers that don't implement add_documents() get the default, which
+    # calls add_document() for each document
+    class ListWriter(writing.IndexWriter):
+        def __init__(self):
+            self.docs = []
+
+        def add_document(self, **fields):
+            self.docs.append(fields)
+
+        def add_field(self, *args):
+            pass
+
+        def remove_field(self, *args):
+            pass
+
+        def reader(self, **kwargs):
+            pass
+
+        def add_reader(self, reader):
+            pass
+
+    docs = [{"id": u"a"}, {"id": u"b", "text": u"bravo"}]
+    w = ListWriter()
+    w.add_documents(docs)
+    w.add_documents({"id": [u"c"]})
+    assert w.docs == docs + [{"id": u"c"}]
+
+    with pytest.raises(NotImplementedError):
+        writing.IndexWriter.add_document(w, id=u"d")
+
+
+def test_merge_reader():
+    schema = fields.Schema(id=fields.ID(stored=True), text=fields.TEXT)
+    with TempIndex(schema, "mergereader") as ix:
+        with ix.writer() as w:
+            w.add_document(id=u"a", text=u"alfa bravo")
+            w.add_document(id=u"b", text=u"bravo charlie")
+            w.add_document(id=u"c", text=u"charlie delta")
+        with ix.writer() as w:
+            w.mergetype = writing.NO_MERGE
+            w.add_document(id=u"d", text=u"delta alfa")
+            w.add_document(id=u"e", text=u"echo")
+        with ix.writer() as w:
+            w.mergetype = writing.NO_MERGE
+            w.delete_by_term("id", u"b")
+
+        w = ix.writer()
+        w.add_document(id=u"f", text=u"alfa echo")
+        segments = list(w.segments)
+        assert writing.OPTIMIZE(w, segments) == []
+        # The merged postings don't go through the pool
+        assert len(w._merge_sources) == 2
+        w._commit_toc([w._finalize_segment()])
+        w._finish()
+
+        assert len(ix._segments()) == 1
+        with ix.searcher() as s:
+            def ids(word):
+                r = s.search(query.Term("text", word), limit=None)
+                return sorted(hit["id"] for hit in r)
+
+            assert ids(u"alfa") == [u"a", u"d", u"f"]
+            assert ids(u"bravo") == [u"a"]
+            assert ids(u"charlie") == [u"c"]
+            assert ids(u"echo") == [u"e", u"f"]
+            assert s.doc_count_all() == 5
+
+
+def test_posting_pool_runs():
+    rnd = random.Random(0)
+    items = []
+    for docnum in xrange(3000):
+        for fieldname in ("a", "content", "tag"):
+            for word in rnd.sample(range(500), 4):
+                btext = b("w%03d") % word if fieldname != "tag" else b("t")
+                weight = rnd.choice((1.0, 2.5))
+                value = rnd.choice((None, b(""), b("v%d") % docnum))
+                items.append((fieldname, btext, docnum, weight, value))
+    # Postings are unique by field, term, and document
+    items = list(dict((item[:3], item) for item in items).values())
+    target = sorted(items, key=lambda item: item[:3])
+
+    with TempIndex(fields.Schema(), "postingpool") as ix:
+        st = ix.storage.temp_storage("pool.tmp")
+        for maxfiles in (128, 2):
+            pool = writing.PostingPool(st, None, limitmb=0.05)
+            rnd.shuffle(items)
+            for item in items:
+                pool.add(item)
+            assert len(pool.runs) > 2
+            assert list(pool.items(maxfiles=maxfiles)) == target
+            assert not st.list()
+        st.destroy()
+
+
 def test_buffered():
     schema = fields.Schema(id=fields.ID, text=fields.TEXT)
     with TempIndex(schema, "buffered") as ix:
@@ -130,6 +523,114 @@ def test_buffered_search():
         w.close()
 
 
+def test_buffered_nrt():
+    schema = fields.Schema(id=fields.ID(stored=True, unique=True),
+                           text=fields.TEXT,
+                           num=fields.NUMERIC(sortable=True))
+    with TempIndex(schema, "bufferednrt") as ix:
+        w = writing.BufferedWriter(ix, period=None, limit=100)
+        w.add_documents([dict(id=u"a", text=u"alfa bravo", num=3),
+                         dict(id=u"b", text=u"bravo charlie", num=1)])
+
+        s1 = w.searcher()
+        r = s1.search(query.Term("text", u"bravo"), sortedby="num")
+        assert [hit["id"] for hit in r] == [u"b", u"a"]
+
+        w.add_document(id=u"c", text=u"bravo delta", num=2)
+        w.update_document(id=u"a", text=u"echo", num=4)
+
+        # The first searcher doesn't see the new document
+        r = s1.search(query.Term("text", u"bravo"), sortedby="num")
+        assert [hit["id"] for hit in r] == [u"b"]
+        s1.close()
+
+        with w.searcher() as s:
+            assert s.doc_count() == 3
+            r = s.search(query.Term("text", u"bravo"), sortedby="num")
+            assert [hit["id"] for hit in r] == [u"b", u"c"]
+            r = s.search(query.Every(), sortedby="num", reverse=True)
+            assert [hit["id"] for hit in r] == [u"a", u"c", u"b"]
+
+        # Documents added after a commit are searched along with the
+        # committed ones
+        w.commit()
+        w.add_document(id=u"d", text=u"bravo", num=0)
+        with w.searcher() as s:
+            r = s.search(query.Term("text", u"bravo"), sortedby="num")
+            assert [hit["id"] for hit in r] == [u"d", u"b", u"c"]
+        w.close()
+
+        with ix.searcher() as s:
+            assert s.doc_count() == 4
+
+
+def test_buffered_nrt_scored():
+    schema = fields.Schema(id=fields.ID(stored=True), text=fields.TEXT,
+                           num=fields.NUMERIC(sortable=True))
+    with TempIndex(schema, "bufferednrtscored") as ix:
+        w = writing.BufferedWriter(ix, period=None, limit=1000)
+        for i in xrange(20):
+            w.add_document(id=text_type(i), text=u" alfa bravo" * (i % 3 + 1),
+                           num=i)
+
+        # A limited scored search uses the block quality optimizations,
+        # which need the term statistics
+        with w.searcher() as s:
+            r = s.search(query.Term("text", u"bravo"), limit=3)
+            assert len(r.top_n) == 3
+            assert s.doc_frequency("text", u"bravo") == 20
+
+            # The snapshot's statistics don't change when more documents
+            # are added
+            w.add_document(id=u"x", text=u"bravo charlie", num=99)
+            assert s.doc_frequency("text", u"bravo") == 20
+            assert ("text", u"charlie") not in s.reader()
+            assert list(s.lexicon("text")) == [b("alfa"), b("bravo")]
+
+        # Sorting by a column in repeated snapshots only keeps the latest
+        # column file
+        storage = w.codec.storage
+        for i in xrange(5):
+            w.add_document(id=u"y%d" % i, text=u"bravo", num=100 + i)
+            with w.searcher() as s:
+                r = s.search(query.Term("text", u"bravo"), sortedby="num",
+                             reverse=True, limit=1)
+                assert r[0]["id"] == u"y%d" % i
+        assert len([name for name in storage.list()
+                    if name.startswith("num.")]) == 1
+        w.close()
+
+
+def test_buffered_nrt_threads():
+    schema = fields.Schema(id=fields.ID(stored=True), text=fields.TEXT)
+    with TempIndex(schema, "bufferednrtthreads") as ix:
+        w = writing.BufferedWriter(ix, period=None, limit=100000)
+        errors = []
+
+        def add():
+            for i in xrange(2000):
+                w.add_document(id=text_type(i),
+                               text=u"alfa w%d bravo w%d" % (i, i % 50))
+
+        def search():
+            try:
+                while adder.is_alive():
+                    with w.searcher() as s:
+                        s.search(query.Term("text", u"bravo"), limit=5)
+                        list(s.reader().all_terms())
+            except Exception:
+                errors.append(sys.exc_info()[1])
+
+        adder = threading.Thread(target=add)
+        searcher = threading.Thread(target=search)
+        adder.start()
+        searcher.start()
+        adder.join()
+        searcher.join()
+        w.close()
+        assert not errors
+
+
 def test_buffered_update():
     schema = fields.Schema(id=fields.ID(stored=True, unique=True),
                            payload=fields.STORED)